@@ -0,0 +1,385 @@
+"""
+Load and latency benchmark of the marketplace API.
+
+Seeds the configured database with generated communities, users, listings, items and lodgings,
+then drives each scenario at each concurrency level, through the Flask test client and over real
+HTTP. Latency percentiles, throughput and queries per request are printed as JSON, or written with
+--output, so runs can be compared between commits.
+
+    python benchmarks/api.py --listings 20000 --concurrency 1 8 32 --output before.json
+    python benchmarks/api.py --sqlite /tmp/bench.db --transports client
+
+Queries per request are read from the Server-Timing header of query profiling, which is switched on
+for the in-process app; pass --url to drive a server that is already running (i.e. under gunicorn)
+against the same database. The seeded rows are deleted afterwards unless --keep is passed.
+"""
+import argparse
+import datetime
+import json
+import logging
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import delete, insert, select
+from werkzeug.serving import make_server
+
+from marketplace.extensions import db
+from marketplace.models import (
+    Community, CommunityListingStats, CommunityProfile, Item, Listing, ListingItem, ListingLodging,
+    ListingReservation, Lodging, LodgingBooking, User,
+)
+from marketplace.search import refresh_search_vectors, search_index, use_postgres_search
+from marketplace.server import create_app
+
+SCENARIOS = [
+    "get_listing", "listings_batch", "community_feed", "community_feed_filtered", "search",
+    "lodging_availability", "create_listing",
+]
+TRANSPORTS = ["client", "http"]
+
+TITLE_WORDS = ["red", "blue", "vintage", "running", "leather", "retro", "classic", "hiking", "sneakers", "boots"]
+COLORS = ["red", "blue", "black", "white", "green"]
+CONDITIONS = ["new", "excellent", "very good", "good"]
+LODGING_TYPES = ["hotel", "airbnb", "cruise"]
+QUERY_COUNT = re.compile(r'db;[^,]*desc="(\d+) queries"')
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return None
+
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class Seed(object):
+    """Ids of the generated rows, to build requests from and to delete afterwards."""
+
+    def __init__(self):
+        self.community_ids = []
+        self.user_ids = []
+        self.listing_ids = []
+        self.lodging_listing_ids = []
+
+
+def seed_database(args, rng: random.Random) -> Seed:
+    seed = Seed()
+    run_id = uuid.uuid4().hex[:8]
+    now = datetime.datetime.now()
+
+    seed.community_ids = [uuid.uuid4() for _ in range(args.communities)]
+    seed.user_ids = [uuid.uuid4() for _ in range(args.users)]
+    db.session.execute(insert(Community), [
+        {"id": community_id, "name": f"Benchmark {i}", "uri": f"bench-{run_id}-{i}"}
+        for i, community_id in enumerate(seed.community_ids)
+    ])
+    db.session.execute(insert(User), [
+        {"id": user_id, "email": f"bench-{run_id}-{i}@example.com", "first_name": "Bench", "last_name": str(i)}
+        for i, user_id in enumerate(seed.user_ids)
+    ])
+    db.session.execute(insert(CommunityProfile), [
+        {"community_id": community_id, "user_id": user_id, "alias": f"user{i}"}
+        for community_id in seed.community_ids
+        for i, user_id in enumerate(seed.user_ids)
+    ])
+
+    for chunk_start in range(0, args.listings, args.chunk_size):
+        listings, items, listing_items, lodgings, listing_lodgings = [], [], [], [], []
+        for i in range(chunk_start, min(args.listings, chunk_start + args.chunk_size)):
+            listing_id, community_id = uuid.uuid4(), rng.choice(seed.community_ids)
+            is_lodging = rng.random() < args.lodging_share
+            listings.append({
+                "id": listing_id,
+                "community_id": community_id,
+                "listed_by_id": rng.choice(seed.user_ids),
+                "listed_on": now - datetime.timedelta(minutes=i),
+                "status": "active" if rng.random() < 0.9 else "draft",
+                "listing_type": "lodging" if is_lodging else "item",
+                "sale_type": "book" if is_lodging else "sell",
+                "listing_price_cents": rng.randrange(100, 100000),
+                "listing_title": " ".join(rng.sample(TITLE_WORDS, 3)),
+                "listing_desc": " ".join(rng.choices(TITLE_WORDS, k=12)),
+                "available_count": rng.randrange(1, 5),
+            })
+            seed.listing_ids.append(listing_id)
+
+            if is_lodging:
+                lodging_id = uuid.uuid4()
+                start_date = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(0, 300))
+                lodgings.append({
+                    "id": lodging_id,
+                    "lodging_name": f"Lodging {i}",
+                    "address": f"{i} Main St",
+                    "start_date": start_date,
+                    "end_date": start_date + datetime.timedelta(days=rng.randrange(7, 60)),
+                    "lodging_type": rng.choice(LODGING_TYPES),
+                    "lodging_details": {"beds": rng.randrange(1, 5)},
+                })
+                listing_lodgings.append({
+                    "listing_id": listing_id, "community_id": community_id, "lodging_id": lodging_id,
+                })
+                seed.lodging_listing_ids.append(listing_id)
+            else:
+                item_id = uuid.uuid4()
+                items.append({
+                    "id": item_id,
+                    "item_name": " ".join(rng.sample(TITLE_WORDS, 2)),
+                    "condition": rng.choice(CONDITIONS),
+                    "shipping_zipcode": f"{rng.randrange(10000, 99999)}",
+                    "photos": [{"url": f"https://cdn.example.com/{uuid.uuid4().hex}.jpg"}],
+                    "item_details": {"size": rng.randrange(5, 15), "color": rng.choice(COLORS)},
+                })
+                listing_items.append({"listing_id": listing_id, "community_id": community_id, "item_id": item_id})
+
+        for model, rows in [
+            (Listing, listings), (Item, items), (ListingItem, listing_items),
+            (Lodging, lodgings), (ListingLodging, listing_lodgings),
+        ]:
+            if rows:
+                db.session.execute(insert(model), rows)
+
+        if use_postgres_search():
+            refresh_search_vectors([row["id"] for row in listings])
+
+    db.session.commit()
+    search_index.reset()
+
+    return seed
+
+
+def delete_seed(seed: Seed) -> None:
+    """Delete everything in the seeded communities, including listings created by the benchmark."""
+    db.session.rollback()
+    listing_ids = select(Listing.id).where(Listing.community_id.in_(seed.community_ids))
+    item_ids = db.session.scalars(select(ListingItem.item_id).where(ListingItem.listing_id.in_(listing_ids))).all()
+    lodging_ids = db.session.scalars(
+        select(ListingLodging.lodging_id).where(ListingLodging.listing_id.in_(listing_ids))
+    ).all()
+
+    for statement in [
+        delete(ListingReservation).where(ListingReservation.listing_id.in_(listing_ids)),
+        delete(LodgingBooking).where(LodgingBooking.listing_id.in_(listing_ids)),
+        delete(ListingItem).where(ListingItem.listing_id.in_(listing_ids)),
+        delete(ListingLodging).where(ListingLodging.listing_id.in_(listing_ids)),
+        delete(Item).where(Item.id.in_(item_ids)),
+        delete(Lodging).where(Lodging.id.in_(lodging_ids)),
+        delete(Listing).where(Listing.community_id.in_(seed.community_ids)),
+        delete(CommunityProfile).where(CommunityProfile.community_id.in_(seed.community_ids)),
+        delete(CommunityListingStats).where(CommunityListingStats.community_id.in_(seed.community_ids)),
+        delete(User).where(User.id.in_(seed.user_ids)),
+        delete(Community).where(Community.id.in_(seed.community_ids)),
+    ]:
+        db.session.execute(statement)
+    db.session.commit()
+
+
+def build_request(scenario: str, seed: Seed, rng: random.Random):
+    """(method, path, query string, JSON body) of one request of a scenario."""
+    community_id = rng.choice(seed.community_ids).hex
+
+    if scenario == "get_listing":
+        return "GET", f"/marketplace/api/listing/{rng.choice(seed.listing_ids).hex}", {}, None
+    if scenario == "listings_batch":
+        ids = [listing_id.hex for listing_id in rng.sample(seed.listing_ids, min(20, len(seed.listing_ids)))]
+        return "POST", "/marketplace/api/listings/batch", {}, {"ids": ids}
+    if scenario == "community_feed":
+        return "GET", f"/marketplace/api/community/{community_id}/listings", {"limit": 20}, None
+    if scenario == "community_feed_filtered":
+        query = {"listing_type": "item", "max_price_cents": rng.randrange(1000, 50000), "limit": 20}
+        return "GET", f"/marketplace/api/community/{community_id}/listings", query, None
+    if scenario == "search":
+        query = {"q": " ".join(rng.sample(TITLE_WORDS, 2)), "limit": 20}
+        return "GET", f"/marketplace/api/community/{community_id}/listings/search", query, None
+    if scenario == "lodging_availability":
+        check_in = datetime.date(2024, 1, 1) + datetime.timedelta(days=rng.randrange(0, 300))
+        query = {"check_in": check_in.isoformat(), "check_out": (check_in + datetime.timedelta(days=3)).isoformat()}
+        return "GET", f"/marketplace/api/community/{community_id}/lodgings/availability", query, None
+    if scenario == "create_listing":
+        return "POST", "/marketplace/api/listing/create", {}, {
+            "community_id": community_id,
+            "listed_by_id": rng.choice(seed.user_ids).hex,
+            "status": "active",
+            "listing_type": "item",
+            "sale_type": "sell",
+            "listing_price_cents": rng.randrange(100, 100000),
+            "listing_title": " ".join(rng.sample(TITLE_WORDS, 3)),
+            "available_count": 1,
+            "item_name": " ".join(rng.sample(TITLE_WORDS, 2)),
+            "condition": rng.choice(CONDITIONS),
+            "shipping_zipcode": "94115",
+            "item_details": {"size": rng.randrange(5, 15), "color": rng.choice(COLORS)},
+        }
+
+    raise ValueError(f"unknown scenario {scenario}")
+
+
+class ClientTransport(object):
+    """Calls the app in-process, skipping the network and WSGI server."""
+
+    def __init__(self, app):
+        self.app = app
+
+    def send(self, method: str, path: str, query: dict, body):
+        response = self.app.test_client().open(path, method=method, query_string=query, json=body)
+        return response.status_code, response.headers.get("Server-Timing"), response.get_data()
+
+
+class HTTPTransport(object):
+    def __init__(self, base_url: str):
+        self.base_url = base_url.rstrip("/")
+
+    def send(self, method: str, path: str, query: dict, body):
+        url = self.base_url + path
+        if query:
+            url += "?" + urllib.parse.urlencode(query)
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+
+        try:
+            with urllib.request.urlopen(request) as response:
+                return response.status, response.headers.get("Server-Timing"), response.read()
+        except urllib.error.HTTPError as err:
+            return err.code, err.headers.get("Server-Timing"), err.read()
+
+
+def drive(transport, scenario: str, seed: Seed, concurrency: int, requests: int, warmup: int, rng_seed: int) -> dict:
+    rng_lock = threading.Lock()
+    rng = random.Random(rng_seed)
+
+    def one_request(_):
+        with rng_lock:
+            method, path, query, body = build_request(scenario, seed, rng)
+
+        started = time.perf_counter()
+        status, server_timing, _ = transport.send(method, path, query, body)
+        latency_ms = (time.perf_counter() - started) * 1000
+
+        query_count = QUERY_COUNT.search(server_timing or "")
+        return status, latency_ms, int(query_count.group(1)) if query_count else None
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one_request, range(warmup)))
+
+        started = time.perf_counter()
+        outcomes = list(executor.map(one_request, range(requests)))
+        seconds = time.perf_counter() - started
+
+    latencies = sorted(latency_ms for _, latency_ms, _ in outcomes)
+    query_counts = [query_count for _, _, query_count in outcomes if query_count is not None]
+
+    return {
+        "requests": requests,
+        "errors": sum(1 for status, _, _ in outcomes if status >= 400),
+        "throughput_rps": round(requests / seconds, 1),
+        "mean_ms": round(sum(latencies) / len(latencies), 3),
+        "p50_ms": round(percentile(latencies, 0.50), 3),
+        "p95_ms": round(percentile(latencies, 0.95), 3),
+        "p99_ms": round(percentile(latencies, 0.99), 3),
+        "queries_per_request": round(sum(query_counts) / len(query_counts), 2) if query_counts else None,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--sqlite", metavar="PATH", help="seed and serve a SQLite database file instead")
+    arg_parser.add_argument("--url", help="drive a running server at this base URL for the http transport")
+    arg_parser.add_argument("--communities", type=int, default=5)
+    arg_parser.add_argument("--users", type=int, default=200)
+    arg_parser.add_argument("--listings", type=int, default=10000)
+    arg_parser.add_argument("--lodging-share", type=float, default=0.2)
+    arg_parser.add_argument("--chunk-size", type=int, default=1000)
+    arg_parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=SCENARIOS)
+    arg_parser.add_argument("--transports", nargs="+", choices=TRANSPORTS, default=TRANSPORTS)
+    arg_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    arg_parser.add_argument("--requests", type=int, default=500, help="measured requests per scenario and level")
+    arg_parser.add_argument("--warmup", type=int, default=20)
+    arg_parser.add_argument("--listing-cache", action="store_true", help="keep the get_listing cache enabled")
+    arg_parser.add_argument("--seed", type=int, default=1, help="random seed of the generated data and requests")
+    arg_parser.add_argument("--keep", action="store_true", help="don't delete the seeded rows afterwards")
+    arg_parser.add_argument("--output", help="write the report to this file")
+    args = arg_parser.parse_args()
+
+    config = {"QUERY_PROFILING_ENABLED": True, "LISTING_CACHE_ENABLED": args.listing_cache}
+    if args.sqlite:
+        config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.abspath(args.sqlite)}"
+
+    # per-request profile records would drown the output; N+1 and slow query warnings still show
+    logging.getLogger("marketplace.profiling").setLevel(logging.WARNING)
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)
+    app = create_app(config=config)
+    rng = random.Random(args.seed)
+    results = []
+    server = None
+
+    with app.app_context():
+        db.create_all()
+        seed_started = time.perf_counter()
+        seed = seed_database(args, rng)
+        seed_seconds = time.perf_counter() - seed_started
+        dialect = db.engine.dialect.name
+
+        try:
+            transports = {}
+            if "client" in args.transports:
+                transports["client"] = ClientTransport(app)
+            if "http" in args.transports:
+                base_url = args.url
+                if base_url is None:
+                    server = make_server("127.0.0.1", 0, app, threaded=True)
+                    threading.Thread(target=server.serve_forever, daemon=True).start()
+                    base_url = f"http://127.0.0.1:{server.server_port}"
+                transports["http"] = HTTPTransport(base_url)
+
+            for transport_name, transport in transports.items():
+                for scenario in args.scenarios:
+                    for concurrency in args.concurrency:
+                        result = drive(
+                            transport, scenario, seed, concurrency, args.requests, args.warmup, args.seed,
+                        )
+                        results.append({
+                            "scenario": scenario, "transport": transport_name, "concurrency": concurrency, **result,
+                        })
+        finally:
+            if server is not None:
+                server.shutdown()
+            if not args.keep:
+                delete_seed(seed)
+
+    report = {
+        "commit": git_commit(),
+        "database": dialect,
+        "seed": {
+            "communities": args.communities,
+            "users": args.users,
+            "listings": args.listings,
+            "lodging_share": args.lodging_share,
+            "seconds": round(seed_seconds, 2),
+        },
+        "listing_cache": args.listing_cache,
+        "results": results,
+    }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
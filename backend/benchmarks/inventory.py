@@ -0,0 +1,85 @@
+"""
+Contention benchmark of the purchase path: many threads buying from one hot listing.
+
+For each thread count, a listing is created with `--stock` units and `--stock` * 2 purchases are
+sent at it; the report shows throughput and checks that exactly `--stock` purchases succeeded.
+Throughput should stay roughly flat as threads are added, as each purchase holds the listing's
+row lock only for a single UPDATE. Needs the database from the app configuration; the rows it
+creates are deleted afterwards.
+
+    python benchmarks/inventory.py --stock 500 --threads 1 4 16 32
+"""
+import argparse
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlalchemy import delete
+
+from marketplace.extensions import db
+from marketplace.server import create_app
+from marketplace.models import Community, CommunityListingStats, Listing, User
+
+
+def run(app, listing_id, purchases: int, threads: int) -> dict:
+    def purchase(_):
+        with app.app_context():
+            return app.test_client().post(f"/marketplace/api/listing/{listing_id}/purchase", json={}).status_code
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        status_codes = list(executor.map(purchase, range(purchases)))
+    seconds = time.perf_counter() - started
+
+    return {
+        "threads": threads,
+        "sold": status_codes.count(200),
+        "sold_out": status_codes.count(409),
+        "requests_per_second": round(purchases / seconds, 1),
+    }
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--stock", type=int, default=500)
+    arg_parser.add_argument("--threads", type=int, nargs="+", default=[1, 4, 16, 32])
+    args = arg_parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        community = Community(name="Inventory Benchmark", uri="inventorybenchmark")
+        user = User(email="inventory-benchmark@example.com")
+        db.session.add_all([community, user])
+        db.session.commit()
+
+        results = []
+        try:
+            for threads in args.threads:
+                listing = Listing(
+                    community_id=community.id,
+                    listed_by_id=user.id,
+                    status="active",
+                    listing_type="empty",
+                    sale_type="sell",
+                    listing_title="Hot listing",
+                    available_count=args.stock,
+                )
+                db.session.add(listing)
+                db.session.commit()
+
+                result = run(app, listing.id, args.stock * 2, threads)
+                assert result["sold"] == args.stock, f"oversold or undersold: {result}"
+                results.append(result)
+        finally:
+            db.session.rollback()
+            db.session.execute(delete(Listing).where(Listing.community_id == community.id))
+            db.session.execute(delete(CommunityListingStats).where(CommunityListingStats.community_id == community.id))
+            db.session.execute(delete(Community).where(Community.id == community.id))
+            db.session.execute(delete(User).where(User.id == user.id))
+            db.session.commit()
+
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,148 @@
+"""
+Per-community read latency as the listings table grows, to check that partitioning by community keeps
+one community's reads steady however many listings the other communities hold.
+
+A probe community is seeded with `--probe-listings` listings, then listings of `--communities` other
+communities are added until the table holds each of `--totals` rows. After each step the probe
+community's feed and a listing by id are timed, and the partitions each query reads are reported.
+Run it before and after `marketplace/partition_listings.py` to compare the two layouts. Needs a
+PostgreSQL database from the app configuration; the rows it creates are deleted afterwards.
+
+    python benchmarks/partitions.py --totals 50000 200000 1000000
+"""
+import argparse
+import datetime
+import json
+import time
+import uuid
+
+from sqlalchemy import delete, insert, text
+
+from marketplace.extensions import db
+from marketplace.server import create_app
+from marketplace.models import Community, CommunityListingStats, CommunityProfile, Listing, User
+from marketplace.api.feed import community_feed_select
+from marketplace.api.read import listing_details_select
+from marketplace.partition_listings import is_partitioned, scanned_partitions
+
+# filler listings are generated by the database, so millions of rows take seconds rather than minutes
+INSERT_FILLER_LISTINGS = """
+INSERT INTO listings (
+    id, community_id, listed_by_id, created_on, listed_on, status, listing_type, sale_type,
+    listing_price_cents, listing_title, available_count
+)
+SELECT
+    gen_random_uuid(), (CAST(:community_ids AS uuid[]))[1 + n % :community_count], :user_id, now(),
+    now() - n * interval '1 second', CASE WHEN n % 10 = 0 THEN 'sold' ELSE 'active' END, 'item', 'sell',
+    100 + n % 10000, 'Filler listing', 1
+FROM generate_series(1, :rows) AS n
+"""
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def time_query(statement, repeats: int) -> dict:
+    latencies = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        db.session.execute(statement).all()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    return {"p50_ms": round(percentile(latencies, 0.50), 3), "p95_ms": round(percentile(latencies, 0.95), 3)}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--totals", type=int, nargs="+", default=[20000, 100000, 500000])
+    arg_parser.add_argument("--communities", type=int, default=200, help="communities sharing the filler listings")
+    arg_parser.add_argument("--probe-listings", type=int, default=2000)
+    arg_parser.add_argument("--repeats", type=int, default=200, help="timed runs of each query per step")
+    arg_parser.add_argument("--output", help="write the report to this file")
+    args = arg_parser.parse_args()
+
+    app = create_app(routes=False)
+    results = []
+
+    with app.app_context():
+        db.create_all()
+        user = User(email=f"bench-{uuid.uuid4().hex[:8]}@example.com", first_name="Bench")
+        probe = Community(name="Benchmark probe", uri="bench-probe")
+        fillers = [Community(name=f"Benchmark {i}", uri=f"bench-{i}") for i in range(args.communities)]
+        db.session.add_all([user, probe, *fillers])
+        db.session.flush()
+        db.session.add(CommunityProfile(community_id=probe.id, user_id=user.id, alias="bench"))
+        community_ids = [probe.id] + [filler.id for filler in fillers]
+
+        now = datetime.datetime.now()
+        probe_listing_ids = [uuid.uuid4() for _ in range(args.probe_listings)]
+        db.session.execute(insert(Listing), [
+            {
+                "id": listing_id, "community_id": probe.id, "listed_by_id": user.id,
+                "listed_on": now - datetime.timedelta(minutes=i), "status": "active", "listing_type": "item",
+                "sale_type": "sell", "listing_price_cents": 1000 + i, "listing_title": f"Probe {i}",
+            }
+            for i, listing_id in enumerate(probe_listing_ids)
+        ])
+        db.session.commit()
+
+        statements = {
+            "community_feed": community_feed_select(probe.id, {}).limit(51),
+            "community_feed_by_type": community_feed_select(probe.id, {"listing_type": "item"}).limit(51),
+            "get_listing": listing_details_select().where(Listing.id == probe_listing_ids[-1]),
+        }
+
+        try:
+            total = args.probe_listings
+            for target_total in sorted(args.totals):
+                if target_total > total:
+                    db.session.execute(text(INSERT_FILLER_LISTINGS), {
+                        "community_ids": [str(filler.id) for filler in fillers],
+                        "community_count": len(fillers),
+                        "user_id": user.id,
+                        "rows": target_total - total,
+                    })
+                    db.session.commit()
+                    total = target_total
+                db.session.execute(text("ANALYZE listings"))
+                db.session.commit()
+
+                connection = db.session.connection()
+                for name, statement in statements.items():
+                    results.append({
+                        "total_listings": total,
+                        "query": name,
+                        "partitions_read": len(scanned_partitions(connection, statement)),
+                        **time_query(statement, args.repeats),
+                    })
+                db.session.commit()
+        finally:
+            db.session.rollback()
+            for statement in [
+                delete(Listing).where(Listing.community_id.in_(community_ids)),
+                delete(CommunityProfile).where(CommunityProfile.community_id == probe.id),
+                delete(CommunityListingStats).where(CommunityListingStats.community_id.in_(community_ids)),
+                delete(Community).where(Community.id.in_(community_ids)),
+                delete(User).where(User.id == user.id),
+            ]:
+                db.session.execute(statement)
+            db.session.commit()
+
+        report = {
+            "partitioned": is_partitioned(db.session.connection(), "listings"),
+            "probe_listings": args.probe_listings,
+            "communities": args.communities + 1,
+            "results": results,
+        }
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output_file:
+            output_file.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    main()
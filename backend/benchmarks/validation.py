@@ -0,0 +1,101 @@
+"""
+Micro-benchmark of create-listing request parsing, before and after the compiled request schemas.
+
+The "legacy" path is the old `create_listing` parse: `parser.parse` over the listing args, then again over
+the item or lodging args, each call decoding the JSON body and building a schema class from the dict.
+The "compiled" path is a single parse with the prebuilt `create_listing_schema`. No database is needed.
+
+    python benchmarks/validation.py --listing-type lodging
+"""
+import argparse
+import json
+import timeit
+import uuid
+
+import marshmallow
+from webargs.flaskparser import parser
+
+from marketplace.server import create_app
+from marketplace.api.listing import (
+    create_item_args, create_listing_args, create_listing_schema, create_lodging_args, split_create_listing,
+)
+
+TYPE_ARGS = {"item": create_item_args, "lodging": create_lodging_args}
+
+
+def legacy_parse(request):
+    listing_dict = parser.parse(create_listing_args, request, unknown=marshmallow.EXCLUDE)
+    type_args = TYPE_ARGS.get(listing_dict.get("listing_type"))
+    type_dict = parser.parse(type_args, request, unknown=marshmallow.EXCLUDE) if type_args else {}
+
+    return listing_dict, type_dict
+
+
+def compiled_parse(request):
+    return split_create_listing(parser.parse(create_listing_schema, request, unknown=marshmallow.EXCLUDE))
+
+
+def create_body(listing_type: str, photo_count: int) -> dict:
+    body = {
+        "community_id": uuid.uuid4().hex,
+        "listed_by_id": uuid.uuid4().hex,
+        "status": "active",
+        "listing_type": listing_type,
+        "sale_type": "sell" if listing_type == "item" else "book",
+        "listing_price_cents": 10099,
+        "listing_title": "Air Jordan Retro 4",
+        "listing_desc": "Lightly worn. " * 20,
+        "available_count": 1,
+    }
+    if listing_type == "item":
+        body.update({
+            "item_name": "Air Jordan Retro 4",
+            "condition": "excellent",
+            "photos": [{"url": f"https://cdn.example.com/photos/{i}.jpg"} for i in range(photo_count)],
+            "shipping_zipcode": "94115",
+            "item_details": {"size": 9, "color": "red"},
+        })
+    if listing_type == "lodging":
+        body.update({
+            "lodging_name": "Cabin",
+            "address": "1 Lake Rd",
+            "start_date": "2024-01-01",
+            "end_date": "2024-01-08",
+            "lodging_type": "airbnb",
+            "lodging_details": {"parking": True},
+        })
+
+    return body
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument("--listing-type", choices=["item", "lodging", "empty"], default="item")
+    arg_parser.add_argument("--photos", type=int, default=10)
+    arg_parser.add_argument("--number", type=int, default=2000)
+    args = arg_parser.parse_args()
+
+    app = create_app(routes=False)
+    body = create_body(args.listing_type, args.photos)
+    results = {}
+
+    for name, parse in [("legacy", legacy_parse), ("compiled", compiled_parse)]:
+        def parse_request():
+            # a fresh request per parse, so neither path benefits from a body decoded by the previous one
+            with app.test_request_context("/marketplace/api/listing/create", method="POST", json=body) as context:
+                return parse(context.request)
+
+        with app.test_request_context("/marketplace/api/listing/create", method="POST", json=body) as context:
+            assert legacy_parse(context.request) == compiled_parse(context.request)
+
+        seconds = min(timeit.repeat(parse_request, number=args.number, repeat=5))
+        results[name] = seconds / args.number * 1e6
+
+    results["saved_us_per_request"] = results["legacy"] - results["compiled"]
+    results["speedup"] = results["legacy"] / results["compiled"]
+
+    print(json.dumps({key: round(val, 2) for key, val in results.items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Production gunicorn settings, from the `backend` directory:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Each worker process has its own connection pool, so the database sees up to
+GUNICORN_WORKERS * (DB_POOL_SIZE + DB_MAX_OVERFLOW) connections.
+"""
+import multiprocessing
+import os
+
+os.environ.setdefault("MARKETPLACE_CONFIG", "ProductionConfiguration")
+
+bind = os.environ.get("GUNICORN_BIND", "0.0.0.0:8000")
+# "gthread" for a thread pool per worker, or "gevent" for many greenlets per worker
+worker_class = os.environ.get("GUNICORN_WORKER_CLASS", "gthread")
+workers = int(os.environ.get("GUNICORN_WORKERS", multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+worker_connections = int(os.environ.get("GUNICORN_WORKER_CONNECTIONS", 100))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 30))
+graceful_timeout = int(os.environ.get("GUNICORN_GRACEFUL_TIMEOUT", 30))
+keepalive = int(os.environ.get("GUNICORN_KEEPALIVE", 5))
+# recycle workers now and then to bound memory growth, staggered so they don't all restart together
+max_requests = int(os.environ.get("GUNICORN_MAX_REQUESTS", 10000))
+max_requests_jitter = int(os.environ.get("GUNICORN_MAX_REQUESTS_JITTER", 1000))
+accesslog = "-"
+
+# one pooled connection per concurrent request a worker can serve; gevent workers serve many more
+# requests than they should hold connections, so their pool stays at the default and requests queue on it
+if worker_class == "gthread":
+    os.environ.setdefault("DB_POOL_SIZE", str(threads))
+
+
+def post_fork(server, worker):
+    if worker_class == "gevent":
+        # psycopg2 blocks the whole worker on queries unless it yields to other greenlets
+        from psycogreen.gevent import patch_psycopg
+
+        patch_psycopg()
@@ -0,0 +1,245 @@
+import csv
+import io
+import json
+import uuid
+from typing import Iterable, Iterator
+from flask import abort, Blueprint, request
+import marshmallow
+from sqlalchemy import func, insert, select
+from sqlalchemy.exc import SQLAlchemyError
+from marketplace.extensions import db
+from marketplace.models import Item, Listing, ListingItem, ListingLodging, Lodging
+from marketplace.search import refresh_search_vectors, search_index, use_postgres_search
+from marketplace.stats import apply_stats_deltas, listing_deltas
+import marketplace.api.validate as v
+from marketplace.api.listing import create_listing_schema, split_create_listing
+from marketplace.api.utils import json_dict
+
+blueprint = Blueprint("bulk", __name__)
+
+
+IMPORT_CHUNK_SIZE = 1000
+
+# CSV cells are flat strings, so structured columns are expected to hold JSON
+CSV_JSON_COLUMNS = ["photos", "item_details", "lodging_details"]
+
+
+class MalformedRow(object):
+    """Placeholder for a line that couldn't be decoded, so it is reported as that row's error."""
+
+    def __init__(self, message: str):
+        self.message = message
+
+
+def read_jsonl_rows(stream: Iterable[str]) -> Iterator[dict]:
+    for line in stream:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError as err:
+                yield MalformedRow(f"Invalid JSON: {err}")
+
+
+def read_csv_rows(stream: Iterable[str]) -> Iterator[dict]:
+    for csv_row in csv.DictReader(stream):
+        row = {key: val for key, val in csv_row.items() if val not in (None, "")}
+        for column in CSV_JSON_COLUMNS:
+            if column in row:
+                try:
+                    row[column] = json.loads(row[column])
+                except ValueError:
+                    pass
+        yield row
+
+
+IMPORT_READERS = {
+    "jsonl": read_jsonl_rows,
+    "csv": read_csv_rows,
+}
+
+
+def validate_import_row(row: dict):
+    """
+    Validate one import row with the same rules as `create_listing`.
+    Returns the listing and type-specific dicts, raising `marshmallow.ValidationError` with every field error.
+    """
+    if isinstance(row, MalformedRow):
+        raise marshmallow.ValidationError(row.message)
+    if not isinstance(row, dict):
+        raise marshmallow.ValidationError("Row must be an object.")
+
+    listing_dict, type_dict = split_create_listing(create_listing_schema.load(row))
+    v.validate_create_listing(listing_dict)
+
+    return listing_dict, type_dict
+
+
+def build_import_records(listing_dict: dict, type_dict: dict, listed_on) -> dict:
+    """
+    Turn a validated row into table records, with UUIDs generated client-side so the
+    join rows can be built without flushing to learn ids.
+    """
+    listing_id = uuid.uuid4()
+    records = {
+        "listings": [{
+            "id": listing_id,
+            "community_id": listing_dict.get("community_id"),
+            "listed_by_id": listing_dict.get("listed_by_id"),
+            "listed_on": listed_on if listing_dict.get("status") == "active" else None,
+            "status": listing_dict.get("status"),
+            "listing_type": listing_dict.get("listing_type"),
+            "sale_type": listing_dict.get("sale_type"),
+            "listing_price_cents": listing_dict.get("listing_price_cents", 0),
+            "listing_title": listing_dict.get("listing_title"),
+            "listing_desc": listing_dict.get("listing_desc"),
+            "available_count": listing_dict.get("available_count"),
+        }],
+        "items": [],
+        "listing_items": [],
+        "lodgings": [],
+        "listing_lodgings": [],
+    }
+
+    if listing_dict.get("listing_type") == "item":
+        item_id = uuid.uuid4()
+        records["items"].append({
+            "id": item_id,
+            "source_item_id": type_dict.get("source_item_id"),
+            "item_name": type_dict.get("item_name"),
+            "condition": type_dict.get("condition"),
+            "photos": type_dict.get("photos"),
+            "shipping_zipcode": type_dict.get("shipping_zipcode"),
+            "item_details": type_dict.get("item_details"),
+        })
+        records["listing_items"].append({
+            "listing_id": listing_id, "community_id": listing_dict.get("community_id"), "item_id": item_id,
+        })
+
+    if listing_dict.get("listing_type") == "lodging":
+        lodging_id = uuid.uuid4()
+        records["lodgings"].append({
+            "id": lodging_id,
+            "lodging_name": type_dict.get("lodging_name"),
+            "address": type_dict.get("address"),
+            "start_date": type_dict.get("start_date"),
+            "end_date": type_dict.get("end_date"),
+            "lodging_type": type_dict.get("lodging_type"),
+            "lodging_url": type_dict.get("lodging_url"),
+            "lodging_details": type_dict.get("lodging_details"),
+        })
+        records["listing_lodgings"].append({
+            "listing_id": listing_id, "community_id": listing_dict.get("community_id"), "lodging_id": lodging_id,
+        })
+
+    return records
+
+
+# parents before the join rows that reference them
+IMPORT_TABLES = [
+    ("listings", Listing),
+    ("items", Item),
+    ("lodgings", Lodging),
+    ("listing_items", ListingItem),
+    ("listing_lodgings", ListingLodging),
+]
+
+
+def insert_import_records(record_groups: list) -> None:
+    """
+    Insert every table's records with one batched executemany statement per table, count the new
+    listings into the community stats with one upsert, then fill in the new listings' search vectors
+    with one set-based UPDATE.
+    """
+    for table_key, model in IMPORT_TABLES:
+        records = [record for group in record_groups for record in group[table_key]]
+        if records:
+            db.session.execute(insert(model), records)
+
+    apply_stats_deltas(
+        db.session.connection(), listing_deltas(record for group in record_groups for record in group["listings"])
+    )
+
+    if use_postgres_search():
+        refresh_search_vectors([record["id"] for group in record_groups for record in group["listings"]])
+
+
+def import_chunk(chunk: list, errors: list) -> int:
+    """
+    Insert a chunk of (row number, listing dict, type dict) in one transaction.
+    If the chunk fails, i.e. on a foreign key violation, rows are retried one by one
+    so only the offending rows are reported and the rest are still imported.
+    """
+    listed_on = db.session.scalar(select(func.now()))
+    record_groups = [
+        (row_number, build_import_records(listing_dict, type_dict, listed_on))
+        for row_number, listing_dict, type_dict in chunk
+    ]
+
+    try:
+        insert_import_records([records for _, records in record_groups])
+        db.session.commit()
+        return len(record_groups)
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    imported = 0
+    for row_number, records in record_groups:
+        try:
+            insert_import_records([records])
+            db.session.commit()
+            imported += 1
+        except SQLAlchemyError as err:
+            db.session.rollback()
+            errors.append({"row": row_number, "errors": [str(getattr(err, "orig", None) or err).strip()]})
+
+    return imported
+
+
+def import_listings(rows: Iterable[dict], chunk_size: int = IMPORT_CHUNK_SIZE) -> dict:
+    """
+    Validate and insert listing rows in chunks. Rows are numbered from 1 in the order given;
+    invalid rows are reported and skipped without aborting the rest of the import.
+    """
+    imported = 0
+    errors = []
+    chunk = []
+
+    for row_number, row in enumerate(rows, start=1):
+        try:
+            listing_dict, type_dict = validate_import_row(row)
+        except marshmallow.ValidationError as err:
+            errors.append({"row": row_number, "errors": err.normalized_messages()})
+            continue
+
+        chunk.append((row_number, listing_dict, type_dict))
+        if len(chunk) >= chunk_size:
+            imported += import_chunk(chunk, errors)
+            chunk = []
+
+    if chunk:
+        imported += import_chunk(chunk, errors)
+
+    # the fallback search index reloads with the imported listings on its next search
+    search_index.reset()
+
+    return {"imported": imported, "errors": errors}
+
+
+@blueprint.route("/marketplace/api/listing/import", methods=["POST"])
+def import_listings_route():
+    """
+    Bulk listing import. Accepts a JSON array of rows, or a JSON Lines (`application/x-ndjson`)
+    or CSV (`text/csv`) body. Each row holds the same fields as `create_listing`.
+    """
+    if request.mimetype == "application/json":
+        rows = request.get_json(silent=True)
+        if not isinstance(rows, list):
+            abort(400, description="expected a JSON array of listings")
+    elif request.mimetype in ("application/x-ndjson", "application/jsonl"):
+        rows = read_jsonl_rows(io.StringIO(request.get_data(as_text=True)))
+    elif request.mimetype == "text/csv":
+        rows = read_csv_rows(io.StringIO(request.get_data(as_text=True)))
+    else:
+        abort(415, description="unsupported import format")
+
+    return json_dict(import_listings(rows))
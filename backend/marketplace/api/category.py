@@ -0,0 +1,69 @@
+from uuid import UUID
+from flask import abort, Blueprint, request
+import marshmallow
+from webargs import fields
+from webargs.flaskparser import parser
+from marketplace.extensions import db
+from marketplace.models import Category
+from marketplace.categories import category_tree
+import marketplace.api.validate as v
+from marketplace.api.utils import json_dict
+
+blueprint = Blueprint("category", __name__)
+
+
+create_category_args = {
+    "name": fields.Str(required=True),
+    "parent_id": fields.UUID(),
+}
+create_category_schema = v.compile_schema(create_category_args, "CreateCategorySchema")
+
+
+def category_summary(tree, category_id: UUID) -> dict:
+    return {"id": category_id, "name": tree.names.get(category_id)}
+
+
+def get_tree_with(category_id: UUID):
+    tree = category_tree.get()
+    if category_id not in tree:
+        abort(404, description="category does not exist")
+
+    return tree
+
+
+@blueprint.route("/marketplace/api/category/create", methods=["POST"])
+def create_category():
+    category_dict = parser.parse(create_category_schema, request, unknown=marshmallow.EXCLUDE)
+    parent_id = category_dict.get("parent_id")
+
+    if parent_id is not None and db.session.get(Category, parent_id) is None:
+        abort(422, description="parent category does not exist")
+
+    # its closure rows are inserted along with it (see marketplace/categories.py)
+    category = Category(name=category_dict.get("name"), parent_id=parent_id)
+    db.session.add(category)
+    db.session.commit()
+
+    return json_dict({"category": {"id": category.id, "name": category.name, "parent_id": category.parent_id}})
+
+
+@blueprint.route("/marketplace/api/category/<uuid:category_id>/ancestors", methods=["GET"])
+def get_category_ancestors(category_id: UUID):
+    tree = get_tree_with(category_id)
+    return json_dict({
+        "ancestors": [category_summary(tree, ancestor_id) for ancestor_id in tree.ancestors(category_id)]
+    })
+
+
+@blueprint.route("/marketplace/api/category/<uuid:category_id>/descendants", methods=["GET"])
+def get_category_descendants(category_id: UUID):
+    tree = get_tree_with(category_id)
+    return json_dict({
+        "descendants": [category_summary(tree, descendant_id) for descendant_id in tree.descendants(category_id)]
+    })
+
+
+@blueprint.route("/marketplace/api/category/<uuid:category_id>/breadcrumbs", methods=["GET"])
+def get_category_breadcrumbs(category_id: UUID):
+    tree = get_tree_with(category_id)
+    return json_dict({"breadcrumbs": tree.breadcrumbs(category_id)})
@@ -0,0 +1,80 @@
+import datetime
+from uuid import UUID
+from typing import Iterator
+from flask import abort, Blueprint, current_app, request, stream_with_context
+import marshmallow
+from webargs import fields
+from webargs.flaskparser import parser
+from sqlalchemy import tuple_
+from marketplace.extensions import db
+from marketplace.models import Listing
+import marketplace.api.validate as v
+from marketplace.api.read import listing_details_select, listing_row_to_response
+
+blueprint = Blueprint("export", __name__)
+
+
+EXPORT_BATCH_SIZE = 500
+
+community_export_args = {
+    "since": fields.DateTime(),
+    # the id of the last row exported at `since`, to resume after it rather than after every row sharing it
+    "after_id": fields.UUID(),
+    "status": fields.Str(validate=v.validate_listing_status),
+}
+community_export_schema = v.compile_schema(community_export_args, "CommunityExportSchema")
+
+
+def community_export_rows(community_id: UUID, since=None, status: str = None, after_id: UUID = None) -> Iterator[dict]:
+    """
+    Every listing in a community with its item/lodging details, least recently updated first.
+    Rows come from a server-side cursor `EXPORT_BATCH_SIZE` at a time, so memory stays flat however
+    large the community is. Each row carries a `cursor`; passing the last one seen as `since` and
+    `after_id` resumes an incremental export with every listing created or updated after it, including
+    rows sharing the last timestamp, i.e. a bulk import. Read by keyset on ix_listings_community_updated.
+
+    `updated_on` is set when a write's transaction starts, not when it commits, so a listing written by a
+    transaction still open when the last export ran can commit with a time before its cursor. Resuming
+    reads EXPORT_OVERLAP_SECONDS further back to pick those up. The listings in the overlap that were
+    exported last time come again, unchanged: consumers de-duplicate on (`updated_on`, id), or upsert by id.
+    """
+    query = (
+        listing_details_select()
+        .add_columns(Listing.created_on.label("export__created_on"))
+        .where(Listing.community_id == community_id)
+        .order_by(Listing.updated_on, Listing.id)
+    )
+
+    if since is not None:
+        since = since - datetime.timedelta(seconds=current_app.config["EXPORT_OVERLAP_SECONDS"])
+    if since is not None and after_id is not None:
+        query = query.where(tuple_(Listing.updated_on, Listing.id) > tuple_(since, after_id))
+    elif since is not None:
+        query = query.where(Listing.updated_on > since)
+    if status is not None:
+        query = query.where(Listing.status == status)
+
+    result = db.session.execute(query, execution_options={"yield_per": EXPORT_BATCH_SIZE})
+    for row in result:
+        response = listing_row_to_response(row)
+        response["listing"]["created_on"] = row._mapping["export__created_on"]
+        response["cursor"] = {"since": row._mapping["listing__updated_on"], "after_id": row._mapping["listing__id"]}
+        yield response
+
+
+def ndjson_lines(rows: Iterator[dict]) -> Iterator[str]:
+    for row in rows:
+        yield current_app.json.dumps(row) + "\n"
+
+
+@blueprint.route("/marketplace/api/community/<uuid:community_id>/listings/export", methods=["GET"])
+def export_community_listings(community_id: UUID):
+    export_dict = parser.parse(community_export_schema, request, location="query", unknown=marshmallow.EXCLUDE)
+    if export_dict.get("after_id") is not None and export_dict.get("since") is None:
+        abort(422, description="after_id needs since")
+
+    rows = community_export_rows(
+        community_id, export_dict.get("since"), export_dict.get("status"), export_dict.get("after_id")
+    )
+
+    return current_app.response_class(stream_with_context(ndjson_lines(rows)), mimetype="application/x-ndjson")
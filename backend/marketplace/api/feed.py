@@ -0,0 +1,226 @@
+import datetime
+import json
+from uuid import UUID
+from flask import abort, Blueprint, request
+import marshmallow
+from webargs import fields, validate
+from webargs.flaskparser import parser
+from sqlalchemy import func, or_, select, tuple_, union
+from marketplace.extensions import db
+from marketplace.models import Item, Listing, ListingItem, ListingLodging, Lodging, SourceItem, Zipcode
+from marketplace.categories import category_subtree_select
+from marketplace.geo import EARTH_RADIUS_MILES, bounding_box, normalize_zipcode
+from marketplace.search import search_index, search_rank_and_match, use_postgres_search
+import marketplace.api.validate as v
+from marketplace.api.read import listing_details_select, listing_row_to_response
+from marketplace.api.utils import decode_cursor, encode_cursor, json_dict
+
+blueprint = Blueprint("feed", __name__)
+
+
+DEFAULT_FEED_LIMIT = 50
+MAX_FEED_LIMIT = 200
+DEFAULT_RADIUS_MILES = 25
+MAX_RADIUS_MILES = 500
+
+community_feed_args = {
+    "listing_type": fields.Str(validate=v.validate_listing_type),
+    "sale_type": fields.Str(validate=v.validate_sale_type),
+    "category_id": fields.UUID(),
+    "min_price_cents": fields.Int(validate=validate.Range(min=0)),
+    "max_price_cents": fields.Int(validate=validate.Range(min=0)),
+    "limit": fields.Int(load_default=DEFAULT_FEED_LIMIT, validate=validate.Range(min=1, max=MAX_FEED_LIMIT)),
+    "cursor": fields.Str(),
+    # items shipping from within radius_miles of near_zipcode
+    "near_zipcode": fields.Str(),
+    "radius_miles": fields.Float(
+        load_default=DEFAULT_RADIUS_MILES, validate=validate.Range(min=0, max=MAX_RADIUS_MILES)
+    ),
+}
+community_feed_schema = v.compile_schema(community_feed_args, "CommunityFeedSchema")
+
+
+def parse_feed_cursor(cursor: str):
+    try:
+        listed_on, listing_id = decode_cursor(cursor)
+        return datetime.datetime.fromisoformat(listed_on), UUID(listing_id)
+    except (ValueError, TypeError):
+        abort(422, description="invalid cursor")
+
+
+def zipcode_miles(latitude: float, longitude: float):
+    """SQL haversine distance from a point to each zipcode's centroid, as geo.haversine_miles computes it."""
+    lat1, lat2 = func.radians(latitude), func.radians(Zipcode.latitude)
+    a = (
+        func.power(func.sin((lat2 - lat1) / 2), 2)
+        + func.cos(lat1) * func.cos(lat2) * func.power(func.sin(func.radians(Zipcode.longitude - longitude) / 2), 2)
+    )
+
+    # rounding can push `a` past 1 for antipodal points, outside asin's domain
+    return 2 * EARTH_RADIUS_MILES * func.asin(func.sqrt(func.least(a, 1.0)))
+
+
+def filter_by_distance(query, near_zipcode: str, radius_miles: float):
+    """
+    Match items shipping from a zipcode within the radius, against the zipcodes table: the radius' bounding
+    box narrows the zipcodes on ix_zipcodes_location, and only those are measured. The box is split in two
+    where it crosses the antimeridian.
+    """
+    origin = db.session.execute(
+        select(Zipcode.latitude, Zipcode.longitude).where(Zipcode.zipcode == normalize_zipcode(near_zipcode))
+    ).first()
+    if origin is None:
+        abort(422, description="unknown zipcode")
+
+    min_latitude, max_latitude, longitude_ranges = bounding_box(origin.latitude, origin.longitude, radius_miles)
+    nearby = select(Zipcode.zipcode).where(
+        Zipcode.latitude.between(min_latitude, max_latitude),
+        or_(*(Zipcode.longitude.between(west, east) for west, east in longitude_ranges)),
+        zipcode_miles(origin.latitude, origin.longitude) <= radius_miles,
+    )
+
+    # stored zipcodes may carry a +4 suffix
+    return query.where(func.substr(Item.shipping_zipcode, 1, 5).in_(nearby))
+
+
+DETAILS_PARAM_PREFIX = "details."
+
+
+def parse_details_filter(args) -> dict:
+    """
+    Collect `details.<key>=<value>` query parameters into one containment document.
+    Values are read as JSON where they parse as a number, boolean or null (`details.size=14`),
+    and as strings otherwise; quote a value to force a string (`details.zipcode="94115"`).
+    """
+    details_filter = {}
+    for param, value in args.items(multi=True):
+        if not param.startswith(DETAILS_PARAM_PREFIX) or len(param) == len(DETAILS_PARAM_PREFIX):
+            continue
+
+        try:
+            parsed = json.loads(value)
+        except ValueError:
+            parsed = value
+        if isinstance(parsed, (dict, list)):
+            parsed = value
+
+        details_filter[param[len(DETAILS_PARAM_PREFIX):]] = parsed
+
+    return details_filter
+
+
+def filter_by_details(query, details_filter: dict, listing_type: str = None):
+    """
+    Match listings whose item or lodging details contain every filtered key and value.
+    `@>` against the jsonb_path_ops GIN indexes; narrowing to a listing type checks a single table.
+    Without a type, the listings matching in either table are collected by a UNION of one filter per
+    table, so each can use its own index rather than the community's listings being scanned.
+    """
+    if not details_filter:
+        return query
+
+    if listing_type == "item":
+        return query.where(Item.item_details.contains(details_filter))
+    if listing_type == "lodging":
+        return query.where(Lodging.lodging_details.contains(details_filter))
+
+    matching_listings = union(
+        select(ListingItem.listing_id)
+        .join(Item, Item.id == ListingItem.item_id)
+        .where(Item.item_details.contains(details_filter)),
+        select(ListingLodging.listing_id)
+        .join(Lodging, Lodging.id == ListingLodging.lodging_id)
+        .where(Lodging.lodging_details.contains(details_filter)),
+    )
+
+    return query.where(Listing.id.in_(matching_listings))
+
+
+def community_feed_select(community_id: UUID, feed_dict: dict):
+    """
+    Active listings of a community, newest first.
+    Pages are keyed on (listed_on, id) rather than OFFSET, so every page is an index range scan
+    on ix_listings_community_feed (or ix_listings_community_type_feed) no matter how deep it is.
+    """
+    query = (
+        listing_details_select()
+        .where(Listing.community_id == community_id, Listing.status == "active")
+        .order_by(Listing.listed_on.desc(), Listing.id.desc())
+    )
+
+    if feed_dict.get("listing_type") is not None:
+        query = query.where(Listing.listing_type == feed_dict.get("listing_type"))
+    if feed_dict.get("sale_type") is not None:
+        query = query.where(Listing.sale_type == feed_dict.get("sale_type"))
+    if feed_dict.get("category_id") is not None:
+        # every listing under a category, i.e. Sneaker brands > Nike, via the closure table
+        query = query.where(SourceItem.category_id.in_(category_subtree_select(feed_dict.get("category_id"))))
+    if feed_dict.get("min_price_cents") is not None:
+        query = query.where(Listing.listing_price_cents >= feed_dict.get("min_price_cents"))
+    if feed_dict.get("max_price_cents") is not None:
+        query = query.where(Listing.listing_price_cents <= feed_dict.get("max_price_cents"))
+
+    query = filter_by_details(query, feed_dict.get("details", {}), feed_dict.get("listing_type"))
+
+    if feed_dict.get("near_zipcode") is not None:
+        query = filter_by_distance(query, feed_dict.get("near_zipcode"), feed_dict.get("radius_miles"))
+
+    if feed_dict.get("cursor") is not None:
+        query = query.where(
+            tuple_(Listing.listed_on, Listing.id) < tuple_(*parse_feed_cursor(feed_dict.get("cursor")))
+        )
+
+    return query
+
+
+@blueprint.route("/marketplace/api/community/<uuid:community_id>/listings", methods=["GET"])
+def get_community_feed(community_id: UUID):
+    feed_dict = parser.parse(community_feed_schema, request, location="query", unknown=marshmallow.EXCLUDE)
+    feed_dict["details"] = parse_details_filter(request.args)
+    limit = feed_dict.get("limit")
+
+    # fetch one extra row to learn whether another page exists
+    rows = db.session.execute(community_feed_select(community_id, feed_dict).limit(limit + 1)).all()
+    page = [listing_row_to_response(row) for row in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_listing = page[-1]["listing"]
+        next_cursor = encode_cursor(last_listing["listed_on"], last_listing["id"])
+
+    return json_dict({"listings": page, "next_cursor": next_cursor})
+
+
+community_search_args = {
+    "q": fields.Str(required=True, validate=validate.Length(min=1)),
+    "status": fields.Str(load_default="active", validate=v.validate_listing_status),
+    "limit": fields.Int(load_default=DEFAULT_FEED_LIMIT, validate=validate.Range(min=1, max=MAX_FEED_LIMIT)),
+}
+community_search_schema = v.compile_schema(community_search_args, "CommunitySearchSchema")
+
+
+@blueprint.route("/marketplace/api/community/<uuid:community_id>/listings/search", methods=["GET"])
+def search_community_listings(community_id: UUID):
+    """
+    Ranked full-text search over listing titles, descriptions, item names and source item names.
+    Runs against the GIN-indexed `search_vector` on PostgreSQL, or the in-process inverted index otherwise.
+    """
+    search_dict = parser.parse(community_search_schema, request, location="query", unknown=marshmallow.EXCLUDE)
+    limit = search_dict.get("limit")
+    query = listing_details_select().where(
+        Listing.community_id == community_id, Listing.status == search_dict.get("status")
+    )
+    query = filter_by_details(query, parse_details_filter(request.args))
+
+    if use_postgres_search():
+        rank, match = search_rank_and_match(search_dict.get("q"))
+        rows = db.session.execute(query.where(match).order_by(rank.desc(), Listing.id).limit(limit)).all()
+    else:
+        ranked_ids = [listing_id for listing_id, _ in search_index.get().search(search_dict.get("q"), community_id)]
+        rows_by_id = {
+            row._mapping["listing__id"]: row
+            for row in db.session.execute(query.where(Listing.id.in_(ranked_ids))).all()
+        }
+        rows = [rows_by_id[listing_id] for listing_id in ranked_ids if listing_id in rows_by_id][:limit]
+
+    return json_dict({"listings": [listing_row_to_response(row) for row in rows]})
@@ -1,104 +1,145 @@
 from uuid import UUID
-from flask import abort, request
+from flask import abort, Blueprint, current_app, request
 import marshmallow
-from webargs import fields
+from webargs import fields, validate
 from webargs.flaskparser import parser
-from sqlalchemy import and_, func
-from marketplace.server import app, db
-from marketplace.models import CommunityProfile, Item, Listing, ListingItem, ListingLodging, Lodging, SourceItem
+from sqlalchemy import func
+from marketplace.extensions import db, listing_cache, profile_cache, replica_router
+from marketplace.models import Item, Listing, ListingItem, ListingLodging, Lodging
 import marketplace.api.validate as v
-from marketplace.api.utils import json_dict, row_to_dict, row_to_json
-
-
-def get_listing_item(listing_id: UUID):
-    item = (
-        db.session.query(
-            Item.id,
-            Item.item_name,
-            Item.condition,
-            Item.photos,
-            Item.shipping_zipcode,
-            Item.item_details,
-            SourceItem.source_item_name,
-            SourceItem.category_id,
-            SourceItem.source_item_details,
-        )
-        .filter(ListingItem, ListingItem.listing_id == listing_id)
-        .join(Item, ListingItem.item_id == Item.id)
-        .outerjoin(SourceItem, SourceItem.id == Item.source_item_id)
-    ).one_or_none()
+from marketplace.replicas import replica_reads
+from marketplace.search import new_listing_search_vector, search_index
+from marketplace.api.read import (
+    cached_listing, listing_details_select, listing_etag, listing_row_to_response, listing_validators_select,
+    must_validate_listing, shipping_estimate, shipping_etag, validate_listing,
+)
+from marketplace.api.utils import json_dict, row_to_dict
 
-    if item is None:
-        return None
+blueprint = Blueprint("listing", __name__)
 
-    return item
+
+get_listing_args = {
+    # the buyer's zipcode, to estimate shipping from the item's
+    "zipcode": fields.Str(validate=validate.Regexp(r"^\d{5}(-\d{4})?$")),
+}
+get_listing_schema = v.compile_schema(get_listing_args, "GetListingSchema")
 
 
-def get_listing_lodging(listing_id: UUID):
-    lodging = (
-        db.session.query(
-            Lodging.id,
-            Lodging.lodging_name,
-            Lodging.address,
-            Lodging.start_date,
-            Lodging.end_date,
-            Lodging.lodging_type,
-            Lodging.lodging_url,
-            Lodging.lodging_details,
+@blueprint.route("/marketplace/api/listing/<uuid:listing_id>", methods=["GET"])
+def get_listing(listing_id: UUID):
+    """
+    General idea: each broad type of listing will have its own table and related metadata.
+    This provides some structure to the listing types and can be extended easily for new types.
+    The "details" JSON field in each type's table also allows a lot of extensibility and optional fields.
+    Once a "sub-type" becomes popular or complex enough it can be spun off into a new listing type.
+
+    The listing, its seller alias and type-specific details are read in a single keyed statement, and the
+    serialized response is cached until the listing or the seller's profile is written to again.
+    Passing the buyer's `zipcode` adds a `shipping` estimate, computed in process over the cached listing.
+
+    Responses carry a strong ETag and Last-Modified. A conditional request (If-None-Match or
+    If-Modified-Since) first reads only the listing's version, and gets a bodiless 304 if it still matches.
+    Clients that just wrote check a cached response the same way, as another process may have cached the
+    listing before their write. A response read from the replica is only cached if the primary has the
+    same version.
+    """
+    to_zipcode = parser.parse(get_listing_schema, request, location="query", unknown=marshmallow.EXCLUDE).get("zipcode")
+    cached = listing_cache.get(listing_id)
+
+    if must_validate_listing(
+        cached, request.if_none_match, request.if_modified_since, replica_router.pinned_to_primary(request.cookies)
+    ):
+        validators = db.session.execute(listing_validators_select(listing_id)).one_or_none()
+        if validators is None:
+            abort(404, description="listing does not exist")
+
+        not_modified_etag, cached = validate_listing(
+            validators, cached, request.if_none_match, request.if_modified_since, to_zipcode
         )
-        .filter(ListingLodging, ListingLodging.listing_id == listing_id)
-        .join(Lodging, ListingLodging.lodging_id == Lodging.id)
+        if not_modified_etag is not None:
+            response = current_app.response_class(status=304)
+            response.set_etag(not_modified_etag)
+            response.last_modified = validators.updated_on
+            return response
+
+    listing_response = None
+    if cached is None:
+        row = db.session.execute(listing_details_select().where(Listing.id == listing_id)).one_or_none()
+
+        if row is None:
+            abort(404, description="listing does not exist")
+
+        listing_response = listing_row_to_response(row)
+        cached = cached_listing(listing_response, json_dict(listing_response).get_data(as_text=True))
+        # a lagging replica can return a version the cache was already invalidated for, which would then be
+        # served by every process until the next write; only cache it once the primary confirms it
+        if not replica_router.reading_replica() or cached.etag == primary_listing_etag(listing_id):
+            listing_cache.set(listing_id, cached)
+
+    if to_zipcode is None:
+        response = current_app.response_class(cached.body, mimetype=current_app.json.mimetype)
+    else:
+        listing_response = listing_response or current_app.json.loads(cached.body)
+        listing_response["shipping"] = shipping_estimate(listing_response, to_zipcode)
+        response = json_dict(listing_response)
+
+    response.set_etag(shipping_etag(cached.etag, to_zipcode))
+    if cached.last_modified:
+        response.headers["Last-Modified"] = cached.last_modified
+
+    return response
+
+
+def primary_listing_etag(listing_id: UUID):
+    """The listing's current ETag on the primary, whichever database the request reads from."""
+    validators = db.session.execute(
+        listing_validators_select(listing_id), bind_arguments={"bind": db.engine}
     ).one_or_none()
 
-    if lodging is None:
-        return None
+    return listing_etag(validators.version, validators.seller_alias) if validators is not None else None
 
-    return lodging
 
+@blueprint.route("/marketplace/api/listing/cache/stats", methods=["GET"])
+def get_listing_cache_stats():
+    return json_dict(listing_cache.stats())
 
-@app.route("/marketplace/api/listing/<uuid:id>", methods=["GET"])
-def get_listing(listing_id: UUID):
-    listing = (
-        db.session.query(
-            Listing.id,
-            Listing.listed_by_id,
-            Listing.listed_on,
-            Listing.status,
-            Listing.listing_type,
-            Listing.sale_type,
-            Listing.listing_price_cents,
-            Listing.listing_title,
-            Listing.listing_desc,
-            Listing.available_count,
-            CommunityProfile.alias.label("listed_by_alias"),
-        )
-        .join(CommunityProfile, and_(
-                CommunityProfile.community_id == Listing.community_id,
-                CommunityProfile.user_id == Listing.listed_by_id,
-            )
-        )
-    ).one_or_none()
 
-    if listing is None:
-        abort(404, description="listing does not exist")
+@blueprint.route("/marketplace/api/profile/cache/stats", methods=["GET"])
+def get_profile_cache_stats():
+    """Lookups of the profile cache behind the membership check of listing creates, in this process."""
+    return json_dict(profile_cache.stats())
 
-    response = {
-        "listing": row_to_dict(listing),
-    }
 
+MAX_BATCH_LISTINGS = 500
+
+batch_listing_args = {
+    "ids": fields.List(
+        fields.UUID(), required=True, validate=validate.Length(min=1, max=MAX_BATCH_LISTINGS)
+    ),
+}
+batch_listing_schema = v.compile_schema(batch_listing_args, "BatchListingSchema")
+
+
+@blueprint.route("/marketplace/api/listings/batch", methods=["POST"])
+@replica_reads
+def get_listings_batch():
     """
-    General idea: each broad type of listing will have its own table and related metadata.
-    This provides some structure to the listing types and can be extended easily for new types.
-    The "details" JSON field in each type's table also allows a lot of extensibility and optional fields.
-    Once a "sub-type" becomes popular or complex enough it can be spun off into a new listing type.
+    Hydrate many listings at once, i.e. for search results and storefronts.
+    All listings are read by one set-based statement regardless of how many ids are requested,
+    and returned in the requested order with the same per-listing shape as `get_listing`.
     """
-    item = get_listing_item(listing_id) if listing.get("listing_type") == "item" else None
-    if item is not None:
-        response["item"] = row_to_dict(item)
+    batch_dict = parser.parse(batch_listing_schema, request, unknown=marshmallow.EXCLUDE)
+    listing_ids = list(dict.fromkeys(batch_dict.get("ids")))
 
-    lodging = get_listing_lodging(listing_id) if listing.get("listing_type") == "lodging" else None
-    if lodging is not None:
-        response["lodging"] = row_to_dict(lodging)
+    rows = db.session.execute(
+        listing_details_select().where(Listing.id.in_(listing_ids))
+    ).all()
+    listings_by_id = {row._mapping["listing__id"]: listing_row_to_response(row) for row in rows}
+
+    response = {
+        "listings": [listings_by_id[listing_id] for listing_id in listing_ids if listing_id in listings_by_id],
+        "not_found": [listing_id for listing_id in listing_ids if listing_id not in listings_by_id],
+    }
 
     return json_dict(response)
 
@@ -121,7 +162,7 @@ create_item_args = {
     "condition": fields.Str(required=True, validate=v.validate_condition),
     "photos": fields.List(fields.Raw()),
     "shipping_zipcode": fields.Str(required=True),
-    "item_details": fields.Raw(),
+    "item_details": v.JSONObject(),
 }
 
 create_lodging_args = {
@@ -131,9 +172,27 @@ create_lodging_args = {
     "end_date": fields.Date(required=True),
     "lodging_type": fields.Str(required=True, validate=v.validate_lodging_type),
     "lodging_url": fields.Str(),
-    "lodging_details": fields.Raw(),
+    "lodging_details": v.JSONObject(),
 }
 
+# one schema per listing type over the listing and type-specific fields, so a create body is parsed once
+create_listing_schema = v.TaggedUnionSchema(
+    "listing_type",
+    base_schema=v.compile_schema(create_listing_args, "CreateListingSchema"),
+    variants={
+        "item": v.compile_schema({**create_listing_args, **create_item_args}, "CreateItemListingSchema"),
+        "lodging": v.compile_schema({**create_listing_args, **create_lodging_args}, "CreateLodgingListingSchema"),
+    },
+)
+
+
+def split_create_listing(create_dict: dict) -> tuple:
+    """Separate a loaded create body into the listing's fields and its item or lodging fields."""
+    listing_dict = {key: val for key, val in create_dict.items() if key in create_listing_args}
+    type_dict = {key: val for key, val in create_dict.items() if key not in create_listing_args}
+
+    return listing_dict, type_dict
+
 
 def create_item(item_dict):
     item = Item(
@@ -162,11 +221,14 @@ def create_lodging(lodging_dict):
     return lodging
 
 
-@app.route("/marketplace/api/listing/create", methods=["POST"])
+@blueprint.route("/marketplace/api/listing/create", methods=["POST"])
 def create_listing() -> str:
-    listing_dict = parser.parse(create_listing_args, request, unknown=marshmallow.EXCLUDE)
+    listing_dict, type_dict = split_create_listing(parser.parse(
+        create_listing_schema, request, unknown=marshmallow.EXCLUDE, validate=v.validate_create_listing
+    ))
 
-    v.validate_create_listing(listing_dict)
+    item_dict = type_dict if listing_dict.get("listing_type") == "item" else None
+    lodging_dict = type_dict if listing_dict.get("listing_type") == "lodging" else None
 
     listed_on = func.now() if listing_dict.get("status") == "active" else None
 
@@ -181,40 +243,45 @@ def create_listing() -> str:
         listing_title=listing_dict.get("listing_title"),
         listing_desc=listing_dict.get("listing_desc"),
         available_count=listing_dict.get("available_count"),
+        search_vector=new_listing_search_vector(listing_dict, item_dict),
     )
     db.session.add(listing)
 
-    if listing_dict.get("listing_type") == "item":
-        item_dict = parser.parse(create_item_args, request, unknown=marshmallow.EXCLUDE)
+    item = None
+    if item_dict is not None:
         item = create_item(item_dict)
         db.session.flush()
 
         listing_item = ListingItem(
             listing_id=listing.id,
+            community_id=listing.community_id,
             item_id=item.id,
         )
         db.session.add(listing_item)
 
-    if listing_dict.get("listing_type") == "lodging":
-        lodging_dict = parser.parse(create_lodging_args, request, unknown=marshmallow.EXCLUDE)
+    lodging = None
+    if lodging_dict is not None:
         lodging = create_lodging(lodging_dict)
         db.session.flush()
 
         listing_lodging = ListingLodging(
             listing_id=listing.id,
+            community_id=listing.community_id,
             lodging_id=lodging.id,
         )
         db.session.add(listing_lodging)
 
     db.session.commit()
+    listing_cache.invalidate(listing.id)
     db.session.refresh(listing)
+    search_index.add_listing(listing, item)
 
     response = {}
     response["listing"] = row_to_dict(listing)
-    if listing_dict.get("listing_type") == "item":
+    if item is not None:
         db.session.refresh(item)
         response["item"] = row_to_dict(item)
-    if listing_dict.get("listing_type") == "lodging":
+    if lodging is not None:
         db.session.refresh(lodging)
         response["lodging"] = row_to_dict(lodging)
 
@@ -0,0 +1,150 @@
+from uuid import UUID
+from flask import abort, Blueprint, request
+import marshmallow
+from webargs import fields, validate
+from webargs.flaskparser import parser
+from sqlalchemy import and_, exists, func, select
+from marketplace.extensions import db
+from marketplace.models import Listing, ListingLodging, Lodging, LodgingBooking
+import marketplace.api.validate as v
+from marketplace.api.read import listing_details_select, listing_row_to_response
+from marketplace.api.utils import json_dict, row_to_dict
+
+blueprint = Blueprint("lodging", __name__)
+
+
+def validate_stay(stay_dict: dict):
+    if stay_dict["check_out"] <= stay_dict["check_in"]:
+        raise marshmallow.ValidationError("check_out must be after check_in", field_name="check_out")
+
+
+def lodging_window_contains(start, end):
+    """The lodging's availability window covers the whole stay."""
+    if db.engine.dialect.name == "postgresql":
+        return func.daterange(Lodging.start_date, Lodging.end_date).op("@>")(func.daterange(start, end))
+
+    return and_(Lodging.start_date <= start, Lodging.end_date >= end)
+
+
+def lodging_window_overlaps(start, end):
+    if db.engine.dialect.name == "postgresql":
+        return func.daterange(Lodging.start_date, Lodging.end_date).op("&&")(func.daterange(start, end))
+
+    return and_(Lodging.start_date < end, Lodging.end_date > start)
+
+
+def booking_overlaps(lodging_id, start, end):
+    """
+    Bookings of a lodging that overlap the stay. Written as plain comparisons so the
+    (lodging_id, check_in) index bounds the lookup to one lodging's bookings before check-out.
+    """
+    return and_(
+        LodgingBooking.lodging_id == lodging_id,
+        LodgingBooking.check_in < end,
+        LodgingBooking.check_out > start,
+    )
+
+
+lodging_availability_args = {
+    "check_in": fields.Date(required=True),
+    "check_out": fields.Date(required=True),
+    "lodging_type": fields.Str(validate=v.validate_lodging_type),
+    # available: open for the whole stay and not booked; overlapping: any window touching the dates
+    "match": fields.Str(load_default="available", validate=validate.OneOf(["available", "overlapping"])),
+    "limit": fields.Int(load_default=50, validate=validate.Range(min=1, max=200)),
+}
+lodging_availability_schema = v.compile_schema(lodging_availability_args, "LodgingAvailabilitySchema")
+
+
+@blueprint.route("/marketplace/api/community/<uuid:community_id>/lodgings/availability", methods=["GET"])
+def get_lodging_availability(community_id: UUID):
+    availability_dict = parser.parse(
+        lodging_availability_schema, request, location="query", unknown=marshmallow.EXCLUDE, validate=validate_stay
+    )
+
+    check_in = availability_dict.get("check_in")
+    check_out = availability_dict.get("check_out")
+
+    query = (
+        listing_details_select()
+        .where(
+            Listing.community_id == community_id,
+            Listing.status == "active",
+            Listing.listing_type == "lodging",
+        )
+        .order_by(Lodging.start_date, Listing.id)
+        .limit(availability_dict.get("limit"))
+    )
+
+    if availability_dict.get("match") == "available":
+        query = query.where(
+            lodging_window_contains(check_in, check_out),
+            ~exists().where(booking_overlaps(Lodging.id, check_in, check_out)),
+        )
+    else:
+        query = query.where(lodging_window_overlaps(check_in, check_out))
+
+    if availability_dict.get("lodging_type") is not None:
+        query = query.where(Lodging.lodging_type == availability_dict.get("lodging_type"))
+
+    rows = db.session.execute(query).all()
+
+    return json_dict({"listings": [listing_row_to_response(row) for row in rows]})
+
+
+book_lodging_args = {
+    "check_in": fields.Date(required=True),
+    "check_out": fields.Date(required=True),
+    "booked_by_id": fields.UUID(),
+}
+book_lodging_schema = v.compile_schema(book_lodging_args, "BookLodgingSchema")
+
+
+@blueprint.route("/marketplace/api/listing/<uuid:listing_id>/book", methods=["POST"])
+def book_lodging(listing_id: UUID):
+    """
+    Book a stay on a `sale_type='book'` lodging listing.
+    The lodging row is locked for the rest of the transaction, so concurrent bookings of the same
+    lodging are checked one after another and can't both pass the overlap check.
+    """
+    booking_dict = parser.parse(book_lodging_schema, request, unknown=marshmallow.EXCLUDE, validate=validate_stay)
+
+    check_in = booking_dict.get("check_in")
+    check_out = booking_dict.get("check_out")
+
+    lodging = db.session.execute(
+        select(Listing.community_id, Listing.status, Listing.sale_type, Lodging.id, Lodging.start_date, Lodging.end_date)
+        .join(ListingLodging, ListingLodging.listing_id == Listing.id)
+        .join(Lodging, Lodging.id == ListingLodging.lodging_id)
+        .where(Listing.id == listing_id)
+        .with_for_update(of=Lodging)
+    ).one_or_none()
+
+    error = None
+    if lodging is None:
+        error = (404, "lodging listing does not exist")
+    elif lodging.status != "active" or lodging.sale_type != "book":
+        error = (422, "listing is not open for booking")
+    elif check_in < lodging.start_date or check_out > lodging.end_date:
+        error = (422, "stay is outside the lodging's available dates")
+    elif db.session.scalar(select(exists().where(booking_overlaps(lodging.id, check_in, check_out)))):
+        error = (409, "lodging is already booked for those dates")
+
+    if error is not None:
+        # release the row lock now rather than whenever the session is torn down
+        db.session.rollback()
+        abort(error[0], description=error[1])
+
+    booking = LodgingBooking(
+        lodging_id=lodging.id,
+        listing_id=listing_id,
+        community_id=lodging.community_id,
+        booked_by_id=booking_dict.get("booked_by_id"),
+        check_in=check_in,
+        check_out=check_out,
+    )
+    db.session.add(booking)
+    db.session.commit()
+    db.session.refresh(booking)
+
+    return json_dict({"booking": row_to_dict(booking)})
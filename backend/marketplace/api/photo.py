@@ -0,0 +1,72 @@
+from uuid import UUID
+from flask import abort, Blueprint, current_app, request, send_from_directory
+from sqlalchemy import select
+from marketplace.extensions import db, listing_cache
+from marketplace.models import Item, ListingItem
+from marketplace.photos import InvalidPhoto, LocalPhotoStore, ingest_photos, photo_entry, photo_store
+from marketplace.api.utils import json_dict
+
+blueprint = Blueprint("photo", __name__)
+
+
+def read_uploads() -> list:
+    """The bytes of every file uploaded under the `photo` form field."""
+    files = request.files.getlist("photo")
+    if not files:
+        abort(422, description="no photo uploaded")
+
+    uploads = [upload.read() for upload in files]
+    max_bytes = current_app.config["PHOTO_MAX_BYTES"]
+    if any(len(data) > max_bytes for data in uploads):
+        abort(422, description=f"photos can be at most {max_bytes} bytes")
+
+    return uploads
+
+
+def ingest_uploads() -> list:
+    try:
+        return ingest_photos(read_uploads())
+    except InvalidPhoto as err:
+        db.session.rollback()
+        abort(422, description=str(err))
+
+
+@blueprint.route("/marketplace/api/photos", methods=["POST"])
+def upload_photos():
+    """
+    Store one or more images sent as multipart `photo` fields and return their `Item.photos` entries,
+    i.e. to pass as `photos` when creating a listing. An image uploaded before is returned as is.
+    """
+    photos = ingest_uploads()
+    db.session.commit()
+
+    return json_dict({"photos": [photo_entry(photo) for photo in photos]})
+
+
+@blueprint.route("/marketplace/api/listing/<uuid:listing_id>/photos", methods=["POST"])
+def add_listing_photos(listing_id: UUID):
+    """
+    Store images and append them to an item listing's photos. The item row is only locked once the
+    images are rendered, so concurrent uploads to the same listing append rather than overwrite.
+    """
+    item_id = db.session.scalar(select(ListingItem.item_id).where(ListingItem.listing_id == listing_id))
+    if item_id is None:
+        abort(404, description="item listing does not exist")
+
+    photos = ingest_uploads()
+    item = db.session.execute(select(Item).where(Item.id == item_id).with_for_update()).scalar_one()
+    item.photos = (item.photos or []) + [photo_entry(photo) for photo in photos]
+    db.session.commit()
+    listing_cache.invalidate(listing_id)
+
+    return json_dict({"photos": item.photos})
+
+
+@blueprint.route("/marketplace/photos/<path:key>", methods=["GET"])
+def get_photo_file(key: str):
+    """Serves the local photo store; with an object store, PHOTO_BASE_URL points clients at the bucket instead."""
+    store = photo_store()
+    if not isinstance(store, LocalPhotoStore):
+        abort(404, description="photo does not exist")
+
+    return send_from_directory(store.root, key, max_age=31536000)
@@ -0,0 +1,139 @@
+import datetime
+from uuid import UUID
+from flask import abort, Blueprint, current_app, request
+import marshmallow
+from webargs import fields, validate
+from webargs.flaskparser import parser
+from sqlalchemy import select
+from marketplace.extensions import db, listing_cache
+from marketplace.models import Listing, ListingReservation
+from marketplace.inventory import (
+    close_reservation, release_expired_reservations, return_stock, take_stock,
+)
+import marketplace.api.validate as v
+from marketplace.api.utils import json_dict, row_to_dict
+
+blueprint = Blueprint("purchase", __name__)
+
+
+MAX_HOLD_SECONDS = 3600
+
+
+def stock_response(listing_id: UUID, stock) -> dict:
+    return {"id": listing_id, "available_count": stock.available_count, "status": stock.status}
+
+
+def abort_out_of_stock(listing_id: UUID):
+    """Only reached when the conditional decrement matched nothing, to say why."""
+    db.session.rollback()
+    listing = db.session.execute(
+        select(Listing.status, Listing.available_count).where(Listing.id == listing_id)
+    ).one_or_none()
+
+    if listing is None:
+        abort(404, description="listing does not exist")
+    if listing.status not in ["active", "sold"]:
+        abort(422, description="listing is not for sale")
+
+    abort(409, description="not enough stock left")
+
+
+purchase_args = {
+    # 1 by default; with a reservation, its held quantity, which a given quantity has to match
+    "quantity": fields.Int(validate=validate.Range(min=1)),
+    # purchase stock already held by a reservation instead of taking more
+    "reservation_id": fields.UUID(),
+}
+purchase_schema = v.compile_schema(purchase_args, "PurchaseSchema")
+
+
+@blueprint.route("/marketplace/api/listing/<uuid:listing_id>/purchase", methods=["POST"])
+def purchase_listing(listing_id: UUID):
+    """
+    Buy from a listing's stock. Without a reservation, the stock is taken by a single conditional
+    UPDATE, so any number of concurrent buyers of a hot listing can't oversell it.
+    Purchases aren't recorded beyond the stock they take; a reservation keeps who it was held for.
+    """
+    purchase_dict = parser.parse(purchase_schema, request, unknown=marshmallow.EXCLUDE)
+    reservation_id = purchase_dict.get("reservation_id")
+    quantity = purchase_dict.get("quantity")
+
+    if reservation_id is not None:
+        reservation = close_reservation(reservation_id, "purchased", listing_id)
+        if reservation is None:
+            db.session.rollback()
+            abort(409, description="reservation is not held or has expired")
+        if quantity is not None and quantity != reservation.quantity:
+            db.session.rollback()
+            abort(422, description=f"quantity doesn't match the {reservation.quantity} reserved")
+
+        db.session.commit()
+        stock = db.session.execute(
+            select(Listing.available_count, Listing.status).where(Listing.id == listing_id)
+        ).one()
+
+        return json_dict({"listing": stock_response(listing_id, stock), "quantity": reservation.quantity})
+
+    quantity = quantity or 1
+    release_expired_reservations(listing_id)
+    stock = take_stock(listing_id, quantity)
+    if stock is None:
+        abort_out_of_stock(listing_id)
+
+    db.session.commit()
+    listing_cache.invalidate(listing_id)
+
+    return json_dict({"listing": stock_response(listing_id, stock), "quantity": quantity})
+
+
+reserve_args = {
+    "quantity": fields.Int(load_default=1, validate=validate.Range(min=1)),
+    "reserved_by_id": fields.UUID(),
+    "hold_seconds": fields.Int(validate=validate.Range(min=1, max=MAX_HOLD_SECONDS)),
+}
+reserve_schema = v.compile_schema(reserve_args, "ReserveSchema")
+
+
+@blueprint.route("/marketplace/api/listing/<uuid:listing_id>/reserve", methods=["POST"])
+def reserve_listing(listing_id: UUID):
+    """
+    Hold stock for a buyer for a short while. The stock is taken now, so held units can't be sold
+    to anyone else, and is given back if the hold is released or expires before it is purchased.
+    Expired holds are swept lazily by the next reservation or purchase of the listing,
+    and for every listing by `marketplace/release_reservations.py`.
+    """
+    reserve_dict = parser.parse(reserve_schema, request, unknown=marshmallow.EXCLUDE)
+    hold_seconds = reserve_dict.get("hold_seconds") or current_app.config["RESERVATION_HOLD_SECONDS"]
+
+    release_expired_reservations(listing_id)
+    stock = take_stock(listing_id, reserve_dict.get("quantity"))
+    if stock is None:
+        abort_out_of_stock(listing_id)
+
+    reservation = ListingReservation(
+        listing_id=listing_id,
+        community_id=stock.community_id,
+        reserved_by_id=reserve_dict.get("reserved_by_id"),
+        quantity=reserve_dict.get("quantity"),
+        expires_on=datetime.datetime.now() + datetime.timedelta(seconds=hold_seconds),
+    )
+    db.session.add(reservation)
+    db.session.commit()
+    listing_cache.invalidate(listing_id)
+    db.session.refresh(reservation)
+
+    return json_dict({"reservation": row_to_dict(reservation), "listing": stock_response(listing_id, stock)})
+
+
+@blueprint.route("/marketplace/api/reservation/<uuid:reservation_id>/release", methods=["POST"])
+def release_reservation(reservation_id: UUID):
+    reservation = close_reservation(reservation_id, "released")
+    if reservation is None:
+        db.session.rollback()
+        abort(409, description="reservation is not held or has expired")
+
+    stock = return_stock(reservation.listing_id, reservation.quantity)
+    db.session.commit()
+    listing_cache.invalidate(reservation.listing_id)
+
+    return json_dict({"listing": stock_response(reservation.listing_id, stock)})
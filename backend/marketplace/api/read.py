@@ -0,0 +1,193 @@
+import datetime
+import hashlib
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import and_, select
+from werkzeug.http import http_date
+from marketplace.cache import CachedListing
+from marketplace.geo import zipcode_directory
+from marketplace.models import CommunityProfile, Item, Listing, ListingItem, ListingLodging, Lodging, SourceItem
+
+
+# Each response section maps its output keys to the columns it is read from. A listing and whichever
+# type-specific rows it has are read in a single statement, with every column labelled "<section>__<key>"
+# so the flat row can be split back into the nested response shape.
+LISTING_COLUMNS = {
+    "id": Listing.id,
+    "listed_by_id": Listing.listed_by_id,
+    "listed_on": Listing.listed_on,
+    "status": Listing.status,
+    "listing_type": Listing.listing_type,
+    "sale_type": Listing.sale_type,
+    "listing_price_cents": Listing.listing_price_cents,
+    "listing_title": Listing.listing_title,
+    "listing_desc": Listing.listing_desc,
+    "available_count": Listing.available_count,
+    "listed_by_alias": CommunityProfile.alias,
+    "version": Listing.version,
+    "updated_on": Listing.updated_on,
+}
+
+ITEM_COLUMNS = {
+    "id": Item.id,
+    "item_name": Item.item_name,
+    "condition": Item.condition,
+    "photos": Item.photos,
+    "shipping_zipcode": Item.shipping_zipcode,
+    "item_details": Item.item_details,
+    "source_item_name": SourceItem.source_item_name,
+    "category_id": SourceItem.category_id,
+    "source_item_details": SourceItem.source_item_details,
+}
+
+LODGING_COLUMNS = {
+    "id": Lodging.id,
+    "lodging_name": Lodging.lodging_name,
+    "address": Lodging.address,
+    "start_date": Lodging.start_date,
+    "end_date": Lodging.end_date,
+    "lodging_type": Lodging.lodging_type,
+    "lodging_url": Lodging.lodging_url,
+    "lodging_details": Lodging.lodging_details,
+}
+
+RESPONSE_SECTIONS = {
+    "listing": LISTING_COLUMNS,
+    "item": ITEM_COLUMNS,
+    "lodging": LODGING_COLUMNS,
+}
+
+
+def listing_details_select():
+    """
+    Select a listing, its seller alias and its item or lodging details in one statement.
+    The type tables are outer joined, so only the columns of the listing's own type are populated.
+    Callers add their own filters, i.e. `listing_details_select().where(Listing.id == listing_id)`.
+    The alias is joined by the profile's primary key rather than read from the profile cache, so the
+    sync and async read paths, and the ETags they send, see the same alias without an app context.
+    """
+    columns = [
+        column.label(f"{section}__{key}")
+        for section, section_columns in RESPONSE_SECTIONS.items()
+        for key, column in section_columns.items()
+    ]
+
+    query = select(*columns).select_from(Listing).outerjoin(CommunityProfile, and_(
+        CommunityProfile.community_id == Listing.community_id,
+        CommunityProfile.user_id == Listing.listed_by_id,
+    ))
+
+    return (
+        query
+        .outerjoin(ListingItem, ListingItem.listing_id == Listing.id)
+        .outerjoin(Item, Item.id == ListingItem.item_id)
+        .outerjoin(SourceItem, SourceItem.id == Item.source_item_id)
+        .outerjoin(ListingLodging, ListingLodging.listing_id == Listing.id)
+        .outerjoin(Lodging, Lodging.id == ListingLodging.lodging_id)
+    )
+
+
+def section_to_dict(row, section: str) -> dict:
+    mapping = row._mapping
+    return {key: mapping[f"{section}__{key}"] for key in RESPONSE_SECTIONS[section]}
+
+
+def listing_row_to_response(row) -> dict:
+    """Split a `listing_details_select` row into the nested listing/item/lodging response."""
+    response = {
+        "listing": section_to_dict(row, "listing"),
+    }
+
+    listing_type = response["listing"]["listing_type"]
+    if listing_type in ("item", "lodging") and row._mapping[f"{listing_type}__id"] is not None:
+        response[listing_type] = section_to_dict(row, listing_type)
+
+    return response
+
+
+def shipping_estimate(listing_response: dict, to_zipcode: str):
+    """Shipping from an item listing's zipcode to the buyer's, or None when either zipcode is unknown."""
+    item = listing_response.get("item") or {}
+
+    return zipcode_directory.estimate_shipping(item.get("shipping_zipcode"), to_zipcode)
+
+
+def listing_validators_select(listing_id: UUID):
+    """
+    What a conditional get_listing needs to answer 304: the listing row's version and modification time,
+    and the seller alias, joined like `listing_details_select` joins it so both build the same ETag.
+    One keyed row, without the item/lodging joins.
+    """
+    return (
+        select(Listing.version, Listing.updated_on, CommunityProfile.alias.label("seller_alias"))
+        .select_from(Listing)
+        .outerjoin(CommunityProfile, and_(
+            CommunityProfile.community_id == Listing.community_id,
+            CommunityProfile.user_id == Listing.listed_by_id,
+        ))
+        .where(Listing.id == listing_id)
+    )
+
+
+def listing_etag(version: int, alias: Optional[str]) -> str:
+    """
+    Strong ETag of a get_listing body. The version covers the listing and its item or lodging,
+    and the seller alias is the one part read from elsewhere.
+    """
+    return f"{version}-{hashlib.sha1(str(alias).encode()).hexdigest()[:12]}"
+
+
+def shipping_etag(etag: str, to_zipcode: Optional[str]) -> str:
+    """The ETag of a get_listing body with a shipping estimate to `to_zipcode` added."""
+    return f"{etag}-{to_zipcode}" if to_zipcode else etag
+
+
+def cached_listing(listing_response: dict, body: str) -> CachedListing:
+    """The listing cache entry of a serialized get_listing body, with its validators."""
+    listing = listing_response["listing"]
+
+    return CachedListing(
+        listing_etag(listing["version"], listing["listed_by_alias"]),
+        http_date(listing["updated_on"]) if listing["updated_on"] else "",
+        body,
+    )
+
+
+def must_validate_listing(cached: Optional[CachedListing], if_none_match, if_modified_since, pinned_to_primary: bool):
+    """
+    Whether get_listing reads the listing's validators before answering: for a conditional request, and for
+    a cached entry when the client wrote recently, as another process may have cached it before the write.
+    """
+    return bool(if_none_match or if_modified_since or (cached is not None and pinned_to_primary))
+
+
+def validate_listing(
+    validators, cached: Optional[CachedListing], if_none_match, if_modified_since, to_zipcode: Optional[str]
+) -> tuple:
+    """
+    Check a `listing_validators_select` row against a conditional request and the cached entry.
+    Returns the ETag to answer 304 with, or None when the client's copy is stale, and the cached entry,
+    or None when it holds an older version than the row.
+    """
+    etag = listing_etag(validators.version, validators.seller_alias)
+    if is_not_modified(if_none_match, if_modified_since, shipping_etag(etag, to_zipcode), validators.updated_on):
+        return shipping_etag(etag, to_zipcode), cached
+
+    # the entry may hold an older version, i.e. cached by another process before the write
+    return None, cached if cached is not None and cached.etag == etag else None
+
+
+def is_not_modified(if_none_match, if_modified_since, etag: str, last_modified: Optional[datetime.datetime]) -> bool:
+    """
+    Whether a conditional GET can be answered with 304. If-None-Match (a werkzeug `ETags`) decides when
+    sent; If-Modified-Since is only used without it, at the one second precision of HTTP dates.
+    """
+    if if_none_match:
+        return if_none_match.contains_weak(etag)
+
+    if if_modified_since is None or last_modified is None:
+        return False
+    if last_modified.tzinfo is None:
+        last_modified = last_modified.replace(tzinfo=datetime.timezone.utc)
+
+    return last_modified.replace(microsecond=0) <= if_modified_since
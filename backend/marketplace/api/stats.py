@@ -0,0 +1,32 @@
+from uuid import UUID
+from flask import abort, Blueprint, request
+import marshmallow
+from webargs import fields
+from webargs.flaskparser import parser
+from marketplace.extensions import db
+from marketplace.models import Community
+from marketplace.stats import community_stats
+import marketplace.api.validate as v
+from marketplace.api.utils import json_dict
+
+blueprint = Blueprint("stats", __name__)
+
+
+community_stats_args = {
+    # only count listings in this status
+    "status": fields.Str(validate=v.validate_listing_status),
+}
+community_stats_schema = v.compile_schema(community_stats_args, "CommunityStatsSchema")
+
+
+@blueprint.route("/marketplace/api/community/<uuid:community_id>/stats", methods=["GET"])
+def get_community_stats(community_id: UUID):
+    """
+    Listing counts by status, listing type and sale type, and the price distribution, for a community dashboard.
+    Served from the maintained stats rows, so it costs the same for a community of ten listings or ten million.
+    """
+    stats_dict = parser.parse(community_stats_schema, request, location="query", unknown=marshmallow.EXCLUDE)
+    if db.session.get(Community, community_id) is None:
+        abort(404, description="community does not exist")
+
+    return json_dict(community_stats(community_id, stats_dict.get("status")))
@@ -0,0 +1,19 @@
+import os
+from flask import Blueprint
+from marketplace.extensions import db, replica_router
+from marketplace.pool import pool_stats
+from marketplace.api.utils import json_dict
+
+blueprint = Blueprint("status", __name__)
+
+
+@blueprint.route("/marketplace/api/db/pool/stats", methods=["GET"])
+def get_db_pool_stats():
+    """Connection pool usage and checkout waits of the worker process that serves the request."""
+    return json_dict({"pid": os.getpid(), **pool_stats(db.engine.pool)})
+
+
+@blueprint.route("/marketplace/api/db/replica/stats", methods=["GET"])
+def get_db_replica_stats():
+    """How this worker process routed reads, and the replica's health as of its last check."""
+    return json_dict({"pid": os.getpid(), **replica_router.stats()})
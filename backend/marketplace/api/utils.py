@@ -1,33 +1,50 @@
+import base64
 import datetime
 import uuid
 import json
 from flask import jsonify
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import inspect
+from sqlalchemy.engine import Row
 from sqlalchemy.dialects import postgresql
 
 
 def alchemy_encoder(obj):
     """JSON encoder function for SQLAlchemy special classes."""
-    instanceof = type(obj)
-
-    if instanceof in [datetime.datetime, datetime.date, datetime.time]:
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
         return obj.isoformat()
-    elif instanceof == datetime.timedelta:
+    elif isinstance(obj, datetime.timedelta):
         return (datetime.datetime.min + obj).time().isoformat()
-    elif instanceof == uuid.UUID:
+    elif isinstance(obj, uuid.UUID):
         return obj.hex
+    elif isinstance(obj, Row):
+        return obj._asdict()
+    elif hasattr(obj, "__mapper__"):
+        return row_to_dict(obj)
+
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
-    return obj
+
+class MarketplaceJSONProvider(DefaultJSONProvider):
+    """
+    Serializes responses in a single pass, with `alchemy_encoder` handling UUIDs, dates, rows and
+    model instances as they are encountered.
+    """
+    default = staticmethod(alchemy_encoder)
+    sort_keys = False
 
 
 def json_dict(d):
-    json_obj = json.dumps(d, default=alchemy_encoder)
-    return jsonify(json.loads(json_obj))
+    return jsonify(d)
 
 
 def row_to_dict(row):
-    dict_row = dict(row.__dict__)
-    dict_row.pop('_sa_instance_state', None)
-    return dict_row
+    """Plain dict of a result `Row` or a model instance's loaded columns (deferred columns aren't loaded)."""
+    if isinstance(row, Row):
+        return row._asdict()
+
+    state = inspect(row)
+    return {attr.key: state.dict[attr.key] for attr in state.mapper.column_attrs if attr.key in state.dict}
 
 
 def row_to_json(row):
@@ -35,5 +52,15 @@ def row_to_json(row):
     return json_dict(dict_row)
 
 
+def encode_cursor(*values) -> str:
+    """Opaque, URL-safe page cursor for keyset pagination."""
+    json_obj = json.dumps(values, default=alchemy_encoder)
+    return base64.urlsafe_b64encode(json_obj.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> list:
+    return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+
+
 def print_query(query):
     print(str(query.statement.compile(dialect=postgresql.dialect())))
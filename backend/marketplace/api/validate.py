@@ -1,42 +1,92 @@
+import json
+from typing import Mapping
+import marshmallow
 from webargs import ValidationError
+from marketplace.profiles import community_profile
 
-LISTING_TYPES = ["item", "lodging", "empty"]
-LISTING_STATUSES = ["draft", "active", "suspended", "sold", "closed", "rejected", "spam"]
-SALE_TYPES = ["sell", "rent", "book", "trade", "free"]
-CONDITIONS = ["n/a", "new", "excellent", "very good", "good", "acceptable", "damaged"]
-LODGING_TYPES = ["hotel", "airbnb", "cruise"]
+LISTING_TYPES = frozenset(["item", "lodging", "empty"])
+LISTING_STATUSES = frozenset(["draft", "active", "suspended", "sold", "closed", "rejected", "spam"])
+SALE_TYPES = frozenset(["sell", "rent", "book", "trade", "free"])
+CONDITIONS = frozenset(["n/a", "new", "excellent", "very good", "good", "acceptable", "damaged"])
+LODGING_TYPES = frozenset(["hotel", "airbnb", "cruise"])
 
 
-def validate_listing_status(val: str):
-    if val not in LISTING_STATUSES:
-        raise ValidationError("Listing status doesn't exist")
+def one_of(choices: frozenset, message: str):
+    """Validator accepting only members of `choices`, checked by hash lookup."""
+    def validator(val: str):
+        if val not in choices:
+            raise ValidationError(message)
 
+    return validator
 
-def validate_listing_type(val: str):
-    if val not in LISTING_TYPES:
-        raise ValidationError("Listing type doesn't exist")
 
+validate_listing_status = one_of(LISTING_STATUSES, "Listing status doesn't exist")
+validate_listing_type = one_of(LISTING_TYPES, "Listing type doesn't exist")
+validate_sale_type = one_of(SALE_TYPES, "Sale type doesn't exist")
+validate_condition = one_of(CONDITIONS, "Condition doesn't exist")
+validate_lodging_type = one_of(LODGING_TYPES, "Lodging type doesn't exist")
 
-def validate_sale_type(val: str):
-    if val not in SALE_TYPES:
-        raise ValidationError("Sale type doesn't exist")
+
+class JSONObject(marshmallow.fields.Field):
+    """
+    A JSON object, also accepted JSON-encoded in a string (i.e. '{"size": 14}'). Either way it loads as a
+    dict, so details are stored as JSONB objects that `@>` filters can match, never as string scalars.
+    """
+    default_error_messages = {"invalid": "Must be a JSON object."}
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, str):
+            try:
+                value = json.loads(value)
+            except ValueError as err:
+                raise self.make_error("invalid") from err
+        if not isinstance(value, dict):
+            raise self.make_error("invalid")
+
+        return value
+
+
+def compile_schema(argmap: dict, name: str) -> marshmallow.Schema:
+    """
+    A schema instance built once from an argmap. `parser.parse` handed the dict itself builds a new
+    schema class on every request.
+    """
+    return marshmallow.Schema.from_dict(argmap, name=name)(unknown=marshmallow.EXCLUDE)
 
 
-def validate_condition(val: str):
-    if val not in CONDITIONS:
-        raise ValidationError("Condition doesn't exist")
+class TaggedUnionSchema(marshmallow.Schema):
+    """
+    Loads a body with the compiled schema of its variant, picked by the `tag` field, so the body
+    is validated in a single pass against the shared and variant fields together.
+    A missing or unknown tag falls back to `base_schema`, which reports the tag's own error.
+    """
 
+    def __init__(
+        self, tag: str, base_schema: marshmallow.Schema, variants: Mapping[str, marshmallow.Schema], **kwargs
+    ):
+        super().__init__(**kwargs)
+        self.tag = tag
+        self.base_schema = base_schema
+        self.variants = variants
 
-def validate_lodging_type(val: str):
-    if val not in LODGING_TYPES:
-        raise ValidationError("Lodging type doesn't exist")
+    def variant_schema(self, data) -> marshmallow.Schema:
+        tag = data.get(self.tag) if isinstance(data, Mapping) else None
+        if not isinstance(tag, str):
+            return self.base_schema
+
+        return self.variants.get(tag, self.base_schema)
+
+    def load(self, data, *, many=None, partial=None, unknown=None):
+        return self.variant_schema(data).load(data, many=many, partial=partial, unknown=unknown)
 
 
 def validate_create_listing(listing_dict: dict):
-    """TODO:
+    """
+    The seller must be a member of the listing's community. Memberships are read through the profile cache,
+    so the check doesn't cost a query per create.
+    TODO:
         * confirm listed_by_id is the current user in session
-        * confirm the user is a valid within the listing's community
         * confirm the user has marketplace listing priviledges within the community
     """
-    pass
-    # raise ValidationError("User does not have permission to create this listing.")
+    if community_profile(listing_dict["community_id"], listing_dict["listed_by_id"]) is None:
+        raise ValidationError({"listed_by_id": ["User is not a member of the listing's community."]})
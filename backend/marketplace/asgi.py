@@ -0,0 +1,278 @@
+"""
+ASGI entry point serving the listing read endpoints on an asyncio engine, with every other route
+passed through to the Flask app:
+
+    uvicorn marketplace.asgi:application --workers 4
+
+A request waiting on Postgres here holds a coroutine rather than a worker thread, so read concurrency
+isn't capped by the thread count. The async routes build the same statements as the Flask views
+(`listing_details_select`, `community_feed_select`), share the listing cache and its validation
+(`validate_listing`, including the read-your-writes check of clients pinned to the primary), and serialize
+with the app's JSON provider, so their responses are identical. The asyncio engine takes the app's
+SQLALCHEMY_ENGINE_OPTIONS, and needs PostgreSQL (asyncpg).
+"""
+import json
+import re
+from typing import Optional
+from urllib.parse import parse_qsl
+import marshmallow
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.exceptions import HTTPException
+from werkzeug.http import http_date, parse_cookie, parse_date, parse_etags, quote_etag
+from marketplace.extensions import listing_cache, replica_router
+from marketplace.server import HexUUIDConverter, create_app
+from marketplace.models import Listing
+from marketplace.api.feed import community_feed_schema, community_feed_select, parse_details_filter
+from marketplace.api.listing import batch_listing_schema, get_listing_schema
+from marketplace.api.read import (
+    cached_listing, listing_details_select, listing_row_to_response, listing_validators_select,
+    must_validate_listing, shipping_estimate, shipping_etag, validate_listing,
+)
+from marketplace.api.utils import encode_cursor
+
+ASYNC_DRIVERS = {
+    "postgresql": "postgresql+asyncpg",
+}
+
+app = create_app()
+
+
+def async_database_url(database_uri):
+    url = make_url(database_uri)
+    if url.get_backend_name() not in ASYNC_DRIVERS:
+        raise ValueError(f"the async read API needs PostgreSQL, not {url.get_backend_name()}")
+
+    return url.set(drivername=ASYNC_DRIVERS[url.get_backend_name()])
+
+
+def async_connect_args(connect_args: dict) -> dict:
+    """
+    psycopg2 connect_args as asyncpg takes them: `-c name=value` options and the application name
+    become server settings.
+    """
+    connect_args = dict(connect_args)
+    server_settings = dict(connect_args.pop("server_settings", {}))
+    options = connect_args.pop("options", "").split()
+    for flag, option in zip(options, options[1:]):
+        if flag == "-c":
+            name, _, value = option.partition("=")
+            server_settings[name] = value
+    if "application_name" in connect_args:
+        server_settings["application_name"] = connect_args.pop("application_name")
+
+    return {**connect_args, "server_settings": server_settings} if server_settings else connect_args
+
+
+def async_engine_options(engine_options: dict) -> dict:
+    """
+    SQLALCHEMY_ENGINE_OPTIONS for the asyncio engine: the timeouts, recycling and connect arguments carry over,
+    sized by ASYNC_DB_POOL_SIZE. A configured poolclass is a blocking QueuePool, so the engine keeps its
+    AsyncAdaptedQueuePool instead.
+    """
+    options = {key: value for key, value in engine_options.items() if key != "poolclass"}
+    options.update({
+        "pool_size": app.config["ASYNC_DB_POOL_SIZE"],
+        "max_overflow": app.config["ASYNC_DB_MAX_OVERFLOW"],
+        "pool_pre_ping": options.get("pool_pre_ping", True),
+    })
+    if "connect_args" in options:
+        options["connect_args"] = async_connect_args(options["connect_args"])
+
+    return options
+
+
+def create_read_engine() -> AsyncEngine:
+    return create_async_engine(
+        async_database_url(app.config["SQLALCHEMY_DATABASE_URI"]),
+        **async_engine_options(app.config.get("SQLALCHEMY_ENGINE_OPTIONS", {})),
+    )
+
+
+async_engine: AsyncEngine = create_read_engine()
+
+
+class JSONResponse(object):
+    def __init__(self, body, status: int = 200, text: Optional[str] = None, headers: Optional[dict] = None):
+        self.status = status
+        # byte for byte what `jsonify` writes, so cached bodies are interchangeable with the Flask views
+        self.text = text if text is not None else f"{app.json.dumps(body, separators=(',', ':'))}\n"
+        self.headers = headers or {}
+
+    async def send(self, send):
+        body = self.text.encode()
+        headers = [(name.lower().encode(), value.encode()) for name, value in self.headers.items() if value]
+        if self.status != 304:
+            headers += [
+                (b"content-type", app.json.mimetype.encode()),
+                (b"content-length", str(len(body)).encode()),
+            ]
+        await send({"type": "http.response.start", "status": self.status, "headers": headers})
+        await send({"type": "http.response.body", "body": body if self.status != 304 else b""})
+
+
+def error_response(err: HTTPException) -> JSONResponse:
+    """Same bodies as the Flask error handlers."""
+    if err.code == 404:
+        return JSONResponse({"error": err.description}, status=404)
+
+    return JSONResponse({"errors": [err.description]}, status=err.code)
+
+
+def validation_error_response(err: marshmallow.ValidationError, location: str) -> JSONResponse:
+    return JSONResponse({"errors": {location: err.messages}}, status=422)
+
+
+async def get_listing(listing_id, query: MultiDict, headers: Headers, body: bytes) -> JSONResponse:
+    try:
+        to_zipcode = get_listing_schema.load(query).get("zipcode")
+    except marshmallow.ValidationError as err:
+        return validation_error_response(err, "query")
+    cached = listing_cache.get(listing_id)
+
+    if_none_match = parse_etags(headers.get("If-None-Match"))
+    if_modified_since = parse_date(headers.get("If-Modified-Since"))
+    pinned_to_primary = replica_router.pinned_to_primary(parse_cookie(headers.get("Cookie", "")))
+    if must_validate_listing(cached, if_none_match, if_modified_since, pinned_to_primary):
+        async with async_engine.connect() as connection:
+            validators = (await connection.execute(listing_validators_select(listing_id))).one_or_none()
+        if validators is None:
+            return JSONResponse({"error": "listing does not exist"}, status=404)
+
+        not_modified_etag, cached = validate_listing(validators, cached, if_none_match, if_modified_since, to_zipcode)
+        if not_modified_etag is not None:
+            return JSONResponse(None, status=304, text="", headers={
+                "ETag": quote_etag(not_modified_etag),
+                "Last-Modified": http_date(validators.updated_on) if validators.updated_on else "",
+            })
+
+    listing_response = None
+    if cached is None:
+        async with async_engine.connect() as connection:
+            row = (await connection.execute(listing_details_select().where(Listing.id == listing_id))).one_or_none()
+
+        if row is None:
+            return JSONResponse({"error": "listing does not exist"}, status=404)
+
+        listing_response = listing_row_to_response(row)
+        cached = cached_listing(listing_response, JSONResponse(listing_response).text)
+        listing_cache.set(listing_id, cached)
+
+    validator_headers = {
+        "ETag": quote_etag(shipping_etag(cached.etag, to_zipcode)),
+        "Last-Modified": cached.last_modified,
+    }
+    if to_zipcode is None:
+        return JSONResponse(None, text=cached.body, headers=validator_headers)
+
+    listing_response = listing_response or app.json.loads(cached.body)
+    listing_response["shipping"] = shipping_estimate(listing_response, to_zipcode)
+
+    return JSONResponse(listing_response, headers=validator_headers)
+
+
+async def get_listings_batch(query: MultiDict, headers: Headers, body: bytes) -> JSONResponse:
+    try:
+        batch_dict = batch_listing_schema.load(json.loads(body or b"{}"))
+    except ValueError:
+        return JSONResponse({"errors": ["Invalid JSON body."]}, status=400)
+    except marshmallow.ValidationError as err:
+        return validation_error_response(err, "json")
+    listing_ids = list(dict.fromkeys(batch_dict.get("ids")))
+
+    async with async_engine.connect() as connection:
+        rows = (await connection.execute(listing_details_select().where(Listing.id.in_(listing_ids)))).all()
+    listings_by_id = {row._mapping["listing__id"]: listing_row_to_response(row) for row in rows}
+
+    return JSONResponse({
+        "listings": [listings_by_id[listing_id] for listing_id in listing_ids if listing_id in listings_by_id],
+        "not_found": [listing_id for listing_id in listing_ids if listing_id not in listings_by_id],
+    })
+
+
+async def get_community_feed(community_id, query: MultiDict, headers: Headers, body: bytes) -> JSONResponse:
+    try:
+        feed_dict = community_feed_schema.load(query)
+    except marshmallow.ValidationError as err:
+        return validation_error_response(err, "query")
+    feed_dict["details"] = parse_details_filter(query)
+    limit = feed_dict.get("limit")
+
+    async with async_engine.connect() as connection:
+        rows = (await connection.execute(community_feed_select(community_id, feed_dict).limit(limit + 1))).all()
+    page = [listing_row_to_response(row) for row in rows[:limit]]
+
+    next_cursor = None
+    if len(rows) > limit:
+        last_listing = page[-1]["listing"]
+        next_cursor = encode_cursor(last_listing["listed_on"], last_listing["id"])
+
+    return JSONResponse({"listings": page, "next_cursor": next_cursor})
+
+
+UUID_PATTERN = f"({HexUUIDConverter.regex})"
+ASYNC_ROUTES = [
+    ("GET", re.compile(rf"^/marketplace/api/listing/{UUID_PATTERN}$"), get_listing),
+    ("POST", re.compile(r"^/marketplace/api/listings/batch$"), get_listings_batch),
+    ("GET", re.compile(rf"^/marketplace/api/community/{UUID_PATTERN}/listings$"), get_community_feed),
+]
+
+
+def match_async_route(method: str, path: str):
+    for route_method, pattern, handler in ASYNC_ROUTES:
+        match = pattern.match(path)
+        if match is not None and method == route_method:
+            return handler, [HexUUIDConverter(app.url_map).to_python(group) for group in match.groups()]
+
+    return None, None
+
+
+async def read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+class MarketplaceASGI(object):
+    """Routes the async read endpoints to their handlers and everything else to the WSGI app."""
+
+    def __init__(self, wsgi_app):
+        self.wsgi = WsgiToAsgi(wsgi_app)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            return await self.lifespan(receive, send)
+
+        handler, path_args = None, None
+        if scope["type"] == "http":
+            handler, path_args = match_async_route(scope["method"], scope["path"])
+        if handler is None:
+            return await self.wsgi(scope, receive, send)
+
+        query = MultiDict(parse_qsl(scope["query_string"].decode(), keep_blank_values=True))
+        headers = Headers([(name.decode("latin-1"), value.decode("latin-1")) for name, value in scope["headers"]])
+        body = await read_body(receive)
+        try:
+            response = await handler(*path_args, query, headers, body)
+        except HTTPException as err:
+            response = error_response(err)
+
+        await response.send(send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await async_engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+application = MarketplaceASGI(app)
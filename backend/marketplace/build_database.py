@@ -1,8 +1,16 @@
-import marketplace.models as models
-import marketplace.server as server
+"""
+Create any missing tables in the configured database.
 
-app = server.init_flask_app()
+    python marketplace/build_database.py
+"""
+from marketplace.extensions import db
+from marketplace.server import create_app
 
-with app.app_context():
-    models.db.init_app(app)
-    models.db.create_all()
+
+def main():
+    with create_app(routes=False).app_context():
+        db.create_all()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+import json
+import threading
+import time
+from collections import OrderedDict, namedtuple
+from typing import Callable, Optional
+from uuid import UUID
+
+
+class CacheBackend(object):
+    """
+    Key/value storage behind a cache. Values are serialized strings, so any Redis-like store
+    that supports get, set with a TTL and delete can implement this interface. Subclasses call
+    `super().__init__()` for the lock.
+    """
+    # backends that can't observe their own evictions (i.e. a remote store) leave this at 0
+    evictions = 0
+
+    def __init__(self):
+        # guards the backend's in-process state, and the hit/miss counters of the cache using it
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        raise NotImplementedError
+
+    def delete(self, key: str) -> None:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        raise NotImplementedError
+
+
+class LRUCacheBackend(CacheBackend):
+    """In-process cache bounded by entry count, evicting the least recently used entry first."""
+
+    def __init__(self, max_size: int = 1024):
+        super().__init__()
+        self.max_size = max_size
+        self.evictions = 0
+        self._entries = OrderedDict()
+
+    def get(self, key: str) -> Optional[str]:
+        with self.lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: int) -> None:
+        with self.lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key: str) -> None:
+        with self.lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self.lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class Cache(object):
+    """
+    Configuration and hit/miss counting shared by the caches over a `CacheBackend`. Subclasses name their
+    settings with `config_prefix`, i.e. LISTING_CACHE for LISTING_CACHE_SIZE, _TTL and _ENABLED.
+    """
+    config_prefix = None
+    default_ttl = 60
+
+    def __init__(self, backend: CacheBackend, ttl: Optional[int] = None, enabled: bool = True):
+        self.backend = backend
+        self.ttl = ttl if ttl is not None else self.default_ttl
+        self.enabled = enabled
+        self.hits = 0
+        self.misses = 0
+
+    def init_app(self, app, backend: Optional[CacheBackend] = None) -> None:
+        """
+        Configure from the app, with an in-process LRU backend sized by <config_prefix>_SIZE by default.
+        There is one cache per process, so the last app created configures it.
+        """
+        self.backend = backend or LRUCacheBackend(max_size=app.config[f"{self.config_prefix}_SIZE"])
+        self.ttl = app.config[f"{self.config_prefix}_TTL"]
+        self.enabled = app.config[f"{self.config_prefix}_ENABLED"]
+
+    def record_lookup(self, hit: bool) -> None:
+        # gthread workers look entries up from several threads
+        with self.backend.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def clear(self) -> None:
+        self.backend.clear()
+
+    def stats(self) -> dict:
+        with self.backend.lock:
+            hits, misses, evictions = self.hits, self.misses, self.backend.evictions
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": hits / lookups if lookups else None,
+        }
+
+
+# a serialized `get_listing` body with the validators it was served with, so a cache hit
+# sends the same ETag and Last-Modified headers as the response that filled it
+CachedListing = namedtuple("CachedListing", ["etag", "last_modified", "body"])
+
+
+class ListingCache(Cache):
+    """
+    Read-through cache of serialized `get_listing` responses, keyed by listing id.
+    Every write to a listing must call `invalidate` so the next read repopulates the entry.
+    """
+    config_prefix = "LISTING_CACHE"
+
+    @staticmethod
+    def key(listing_id: UUID) -> str:
+        return f"listing:{listing_id.hex}"
+
+    def get(self, listing_id: UUID) -> Optional[CachedListing]:
+        if not self.enabled:
+            return None
+
+        value = self.backend.get(self.key(listing_id))
+        self.record_lookup(value is not None)
+        if value is None:
+            return None
+
+        # neither validator contains a newline, and the body comes last
+        return CachedListing(*value.split("\n", 2))
+
+    def set(self, listing_id: UUID, cached: CachedListing) -> None:
+        if self.enabled:
+            self.backend.set(self.key(listing_id), "\n".join(cached), self.ttl)
+
+    def invalidate(self, listing_id: UUID) -> None:
+        self.backend.delete(self.key(listing_id))
+
+
+class ProfileCache(Cache):
+    """
+    Read-through cache of community profiles keyed by (community_id, user_id), read by the membership
+    check of listing creates. Listing reads join the seller's alias instead (see `listing_details_select`).
+    Non-members are cached as well, so repeated checks for a user outside the community don't query either.
+    Profiles are written rarely, so entries live longer than listings; ORM writes invalidate them in this
+    process and the TTL bounds how long other processes see the old profile.
+    """
+    config_prefix = "PROFILE_CACHE"
+    default_ttl = 300
+
+    @staticmethod
+    def key(community_id: UUID, user_id: UUID) -> str:
+        return f"profile:{community_id.hex}:{user_id.hex}"
+
+    def get(self, community_id: UUID, user_id: UUID, load: Callable[[], Optional[dict]]) -> Optional[dict]:
+        """The cached profile, or `load()` stored for next time. None when the user isn't a member."""
+        if not self.enabled:
+            return load()
+
+        key = self.key(community_id, user_id)
+        value = self.backend.get(key)
+        self.record_lookup(value is not None)
+        if value is not None:
+            return json.loads(value)
+
+        profile = load()
+        self.backend.set(key, json.dumps(profile), self.ttl)
+
+        return profile
+
+    def invalidate(self, community_id: UUID, user_id: UUID) -> None:
+        self.backend.delete(self.key(community_id, user_id))
@@ -0,0 +1,209 @@
+import threading
+import time
+from collections import deque
+from typing import Optional
+from uuid import UUID
+from flask import current_app
+from sqlalchemy import delete, event, inspect, insert, literal, select, true
+from sqlalchemy.orm import object_session
+from marketplace.extensions import db
+from marketplace.models import Category, CategoryClosure
+
+
+class CategoryTree(object):
+    """
+    Immutable in-memory snapshot of the category tree.
+    Walking it costs no database round trips, which is what breadcrumbs need on every listing page.
+    """
+
+    def __init__(self, categories: list):
+        self.names = {category_id: name for category_id, name, _ in categories}
+        self.parents = {category_id: parent_id for category_id, _, parent_id in categories}
+        self.children = {}
+        for category_id, parent_id in self.parents.items():
+            self.children.setdefault(parent_id, []).append(category_id)
+
+    def __contains__(self, category_id: UUID):
+        return category_id in self.names
+
+    def ancestors(self, category_id: UUID) -> list:
+        """Parent first, up to the root."""
+        ancestors = []
+        parent_id = self.parents.get(category_id)
+        while parent_id is not None and parent_id not in ancestors:
+            ancestors.append(parent_id)
+            parent_id = self.parents.get(parent_id)
+
+        return ancestors
+
+    def descendants(self, category_id: UUID) -> list:
+        """Every category below this one, breadth first."""
+        descendants = []
+        pending = deque(self.children.get(category_id, []))
+        while pending:
+            child_id = pending.popleft()
+            descendants.append(child_id)
+            pending.extend(self.children.get(child_id, []))
+
+        return descendants
+
+    def breadcrumbs(self, category_id: UUID) -> list:
+        """Root first, i.e. Sneaker brands > Nike > Air Jordan > Retro 4."""
+        path = list(reversed(self.ancestors(category_id))) + [category_id]
+        return [{"id": path_id, "name": self.names.get(path_id)} for path_id in path]
+
+
+class CategoryTreeCache(object):
+    """
+    Holds the current `CategoryTree`. Writes through the ORM mark it stale in this process; the TTL
+    bounds how long other processes keep serving a tree from before someone else's change.
+    """
+
+    def __init__(self):
+        self._tree = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> CategoryTree:
+        ttl = current_app.config["CATEGORY_TREE_TTL"]
+        with self._lock:
+            if self._tree is None or time.monotonic() - self._loaded_at > ttl:
+                rows = db.session.execute(select(Category.id, Category.name, Category.parent_id)).all()
+                self._tree = CategoryTree(rows)
+                self._loaded_at = time.monotonic()
+
+            return self._tree
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._tree = None
+
+
+category_tree = CategoryTreeCache()
+
+
+# the tree is rebuilt only after the change commits, so a concurrent reload can't cache the old state
+@event.listens_for(Category, "after_insert")
+@event.listens_for(Category, "after_update")
+@event.listens_for(Category, "after_delete")
+def mark_category_tree_stale(mapper, connection, target):
+    object_session(target).info["category_tree_stale"] = True
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_category_tree(session):
+    if session.info.pop("category_tree_stale", False):
+        category_tree.invalidate()
+
+
+@event.listens_for(db.session, "after_rollback")
+def discard_category_tree_change(session):
+    session.info.pop("category_tree_stale", None)
+
+
+def add_category_closure(connection, category_id: UUID, parent_id: Optional[UUID]) -> None:
+    """
+    Insert the closure rows of a new leaf category: itself at depth 0, plus every ancestor of
+    its parent one level further away.
+    """
+    connection.execute(
+        insert(CategoryClosure).values(ancestor_id=category_id, descendant_id=category_id, depth=0)
+    )
+
+    if parent_id is not None:
+        parent_ancestors = select(
+            CategoryClosure.ancestor_id,
+            literal(category_id, CategoryClosure.descendant_id.type),
+            CategoryClosure.depth + 1,
+        ).where(CategoryClosure.descendant_id == parent_id)
+
+        connection.execute(
+            insert(CategoryClosure).from_select(["ancestor_id", "descendant_id", "depth"], parent_ancestors)
+        )
+
+
+def move_category_closure(connection, category_id: UUID, parent_id: Optional[UUID]) -> None:
+    """
+    Re-hang a category's subtree under `parent_id`: the rows pairing the subtree with its old ancestors
+    are deleted, and every ancestor of the new parent is paired with every category of the subtree.
+    Rows within the subtree don't change. Raises ValueError if the parent is in the subtree itself.
+    """
+    subtree = select(CategoryClosure.descendant_id).where(CategoryClosure.ancestor_id == category_id)
+    if parent_id is not None and connection.scalar(
+        select(CategoryClosure.depth).where(
+            CategoryClosure.ancestor_id == category_id, CategoryClosure.descendant_id == parent_id
+        )
+    ) is not None:
+        raise ValueError("a category can't be moved under itself or one of its descendants")
+
+    connection.execute(
+        delete(CategoryClosure).where(
+            CategoryClosure.descendant_id.in_(subtree),
+            CategoryClosure.ancestor_id.not_in(subtree),
+        )
+    )
+
+    if parent_id is not None:
+        parent_ancestors = select(CategoryClosure).where(CategoryClosure.descendant_id == parent_id).subquery()
+        subtree_paths = select(CategoryClosure).where(CategoryClosure.ancestor_id == category_id).subquery()
+        connection.execute(insert(CategoryClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(
+                parent_ancestors.c.ancestor_id,
+                subtree_paths.c.descendant_id,
+                parent_ancestors.c.depth + subtree_paths.c.depth + 1,
+            ).select_from(parent_ancestors).join(subtree_paths, true()),
+        ))
+
+
+# ORM writes keep the closure table in step with `parent_id`, in the same flush. Categories written
+# around the ORM need `rebuild_category_closure` (marketplace/rebuild_category_closure.py).
+@event.listens_for(Category, "after_insert")
+def add_inserted_category_closure(mapper, connection, target):
+    add_category_closure(connection, target.id, target.parent_id)
+
+
+@event.listens_for(Category, "after_update")
+def move_updated_category_closure(mapper, connection, target):
+    if inspect(target).attrs.parent_id.history.has_changes():
+        move_category_closure(connection, target.id, target.parent_id)
+
+
+@event.listens_for(Category, "before_delete")
+def delete_category_closure(mapper, connection, target):
+    """Only a leaf can be deleted, as its children still reference it; its rows go first."""
+    connection.execute(delete(CategoryClosure).where(
+        (CategoryClosure.ancestor_id == target.id) | (CategoryClosure.descendant_id == target.id)
+    ))
+
+
+def rebuild_category_closure() -> None:
+    """Recompute the whole closure table from `Category.parent_id`, i.e. to backfill or repair it."""
+    category_paths = (
+        select(
+            Category.id.label("ancestor_id"),
+            Category.id.label("descendant_id"),
+            literal(0).label("depth"),
+        )
+        .cte("category_paths", recursive=True)
+    )
+    category_paths = category_paths.union_all(
+        select(
+            category_paths.c.ancestor_id,
+            Category.id,
+            category_paths.c.depth + 1,
+        ).where(Category.parent_id == category_paths.c.descendant_id)
+    )
+
+    db.session.execute(CategoryClosure.__table__.delete())
+    db.session.execute(
+        insert(CategoryClosure).from_select(
+            ["ancestor_id", "descendant_id", "depth"],
+            select(category_paths.c.ancestor_id, category_paths.c.descendant_id, category_paths.c.depth),
+        )
+    )
+
+
+def category_subtree_select(category_id: UUID):
+    """Ids of a category and all of its descendants, for `IN` filters over listings."""
+    return select(CategoryClosure.descendant_id).where(CategoryClosure.ancestor_id == category_id)
@@ -2,6 +2,9 @@ import os
 
 from sqlalchemy.engine.url import URL
 
+from marketplace.geo import DEFAULT_ZIPCODE_DATASET
+from marketplace.pool import timed_queue_pool
+
 
 class Configuration(object):
     ###################################
@@ -14,7 +17,7 @@ class Configuration(object):
 
     ###################################
     # FLASK-SQLALCHEMY CONFIG
-    SQLALCHEMY_DATABASE_URI = URL.create(
+    SQLALCHEMY_DATABASE_URI = os.environ.get("DATABASE_URL") or URL.create(
         "postgresql",
         username="postgres",
         password="",
@@ -23,4 +26,123 @@ class Configuration(object):
         database="lomatest",
     )
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_RECORD_QUERIES = False
+    SQLALCHEMY_RECORD_QUERIES = os.environ.get("SQLALCHEMY_RECORD_QUERIES", "false").lower() == "true"
+
+    ###################################
+    # QUERY PROFILING CONFIG
+    # per-request query counts and timings in Server-Timing headers and logs (see marketplace/profiling.py)
+    QUERY_PROFILING_ENABLED = os.environ.get("QUERY_PROFILING_ENABLED", "false").lower() == "true"
+    # statements at least this slow are logged on their own
+    SLOW_QUERY_MS = float(os.environ.get("SLOW_QUERY_MS", 200))
+    # times the same statement can run in one request before it's flagged as an N+1
+    N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", 5))
+
+    ###################################
+    # READ REPLICA CONFIG
+    # reads of GET requests go to this database while it is healthy (see marketplace/replicas.py);
+    # add ?connect_timeout=2 so an unreachable replica fails its health check quickly
+    SQLALCHEMY_BINDS = {"replica": os.environ["REPLICA_DATABASE_URL"]} if os.environ.get("REPLICA_DATABASE_URL") else {}
+    # the replica is skipped while it is further behind the primary than this
+    REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 5))
+    # seconds between health checks of the replica, per process
+    REPLICA_CHECK_INTERVAL = float(os.environ.get("REPLICA_CHECK_INTERVAL", 5))
+    # seconds a client that wrote reads from the primary; keep it above the lag the replica is allowed
+    READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", 10))
+
+    ###################################
+    # ASYNC READ API CONFIG
+    # pool of the asyncio engine behind marketplace/asgi.py, separate from the WSGI app's pool
+    ASYNC_DB_POOL_SIZE = int(os.environ.get("ASYNC_DB_POOL_SIZE", 20))
+    ASYNC_DB_MAX_OVERFLOW = int(os.environ.get("ASYNC_DB_MAX_OVERFLOW", 10))
+
+    ###################################
+    # LISTING CACHE CONFIG
+    LISTING_CACHE_ENABLED = os.environ.get("LISTING_CACHE_ENABLED", "true").lower() == "true"
+    LISTING_CACHE_SIZE = int(os.environ.get("LISTING_CACHE_SIZE", 10000))
+    LISTING_CACHE_TTL = int(os.environ.get("LISTING_CACHE_TTL", 60))
+
+    ###################################
+    # PROFILE CACHE CONFIG
+    # community memberships, read by create checks (see marketplace/profiles.py)
+    PROFILE_CACHE_ENABLED = os.environ.get("PROFILE_CACHE_ENABLED", "true").lower() == "true"
+    PROFILE_CACHE_SIZE = int(os.environ.get("PROFILE_CACHE_SIZE", 50000))
+    PROFILE_CACHE_TTL = int(os.environ.get("PROFILE_CACHE_TTL", 300))
+
+    ###################################
+    # CATEGORY TREE CONFIG
+    # seconds before a process reloads the category tree to pick up changes made by other processes
+    CATEGORY_TREE_TTL = int(os.environ.get("CATEGORY_TREE_TTL", 300))
+
+    ###################################
+    # SEARCH CONFIG
+    # "postgres" full-text search, the in-process "memory" index, or "auto" to pick by database
+    SEARCH_BACKEND = os.environ.get("SEARCH_BACKEND", "auto")
+
+    ###################################
+    # EXPORT CONFIG
+    # seconds before a resumed export's cursor to read again. A listing's updated_on is its transaction's start,
+    # so a transaction committing after an export ran can land behind the cursor; this should exceed the
+    # longest write transaction. Rows in the overlap are exported again, for consumers to upsert by listing id
+    EXPORT_OVERLAP_SECONDS = int(os.environ.get("EXPORT_OVERLAP_SECONDS", 300))
+
+    ###################################
+    # INVENTORY CONFIG
+    # seconds a reservation holds stock before it expires and the stock is released
+    RESERVATION_HOLD_SECONDS = int(os.environ.get("RESERVATION_HOLD_SECONDS", 600))
+
+    ###################################
+    # SHIPPING CONFIG
+    # zipcode centroids behind shipping estimates and radius filters (see marketplace/geo.py)
+    ZIPCODE_DATASET = os.environ.get("ZIPCODE_DATASET", DEFAULT_ZIPCODE_DATASET)
+    # refuse to start on a dataset of fewer zipcodes, i.e. the bundled sample; 0 accepts any
+    ZIPCODE_DATASET_MIN_ZIPCODES = int(os.environ.get("ZIPCODE_DATASET_MIN_ZIPCODES", 0))
+    # shipping zone -> estimated cost of a parcel
+    SHIPPING_RATES_CENTS = {1: 795, 2: 845, 3: 895, 4: 995, 5: 1145, 6: 1295, 7: 1445, 8: 1695}
+
+    ###################################
+    # PHOTO CONFIG
+    # "local" writes under PHOTO_LOCAL_ROOT and serves from PHOTO_BASE_URL; "s3" writes to PHOTO_S3_BUCKET
+    # (needs boto3), with PHOTO_BASE_URL pointing at the bucket or its CDN
+    PHOTO_STORE = os.environ.get("PHOTO_STORE", "local")
+    PHOTO_LOCAL_ROOT = os.environ.get("PHOTO_LOCAL_ROOT", os.path.join(os.getcwd(), "photos"))
+    PHOTO_BASE_URL = os.environ.get("PHOTO_BASE_URL", "/marketplace/photos/")
+    PHOTO_S3_BUCKET = os.environ.get("PHOTO_S3_BUCKET")
+    # thumbnail name -> longest edge in pixels
+    PHOTO_THUMBNAIL_SIZES = {"small": 160, "medium": 480, "large": 1080}
+    PHOTO_THUMBNAIL_QUALITY = int(os.environ.get("PHOTO_THUMBNAIL_QUALITY", 85))
+    PHOTO_MAX_BYTES = int(os.environ.get("PHOTO_MAX_BYTES", 15 * 1024 * 1024))
+    # comma separated hosts that reprocess_photos.py may fetch the originals of photos from before the pipeline
+    # from, besides the photo store; urls elsewhere, or resolving to private or local addresses, are skipped
+    PHOTO_FETCH_HOSTS = [host for host in os.environ.get("PHOTO_FETCH_HOSTS", "").split(",") if host]
+    # processes rendering thumbnails; 0 renders them in the request's own thread
+    PHOTO_WORKERS = int(os.environ.get("PHOTO_WORKERS", os.cpu_count() or 1))
+
+
+class ProductionConfiguration(Configuration):
+    """
+    Selected with MARKETPLACE_CONFIG=ProductionConfiguration, as gunicorn.conf.py does.
+    Size the pool to the threads of a worker process (DB_POOL_SIZE defaults to GUNICORN_THREADS there),
+    so a request never waits on the pool while its worker has a free thread.
+    """
+    ###################################
+    # CONNECTION POOL CONFIG
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "poolclass": timed_queue_pool(slow_checkout_ms=float(os.environ.get("DB_SLOW_CHECKOUT_MS", 100))),
+        "pool_size": int(os.environ.get("DB_POOL_SIZE", 10)),
+        # extra connections opened past pool_size under bursts, closed again once returned
+        "max_overflow": int(os.environ.get("DB_MAX_OVERFLOW", 5)),
+        # seconds to wait for a connection before failing the request
+        "pool_timeout": float(os.environ.get("DB_POOL_TIMEOUT", 10)),
+        # seconds before a connection is replaced, under server and load balancer idle timeouts
+        "pool_recycle": int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        "pool_pre_ping": os.environ.get("DB_POOL_PRE_PING", "true").lower() == "true",
+        "connect_args": {
+            "options": f"-c statement_timeout={int(os.environ.get('DB_STATEMENT_TIMEOUT_MS', 30000))}",
+            "application_name": os.environ.get("DB_APPLICATION_NAME", "marketplace"),
+        },
+    }
+
+    ###################################
+    # SHIPPING CONFIG
+    # the Census ZCTA Gazetteer lists ~33k zipcodes; fail at startup rather than estimate from the sample
+    ZIPCODE_DATASET_MIN_ZIPCODES = int(os.environ.get("ZIPCODE_DATASET_MIN_ZIPCODES", 30000))
@@ -0,0 +1,42 @@
+"""
+Stream every listing in a community to a JSON Lines file.
+
+    python marketplace/export_listings.py <community id> > listings.jsonl
+    python marketplace/export_listings.py <community id> --since 2024-01-01T00:00:00 --output listings.jsonl
+    python marketplace/export_listings.py <community id> --since <cursor since> --after-id <cursor after_id>
+"""
+import argparse
+import datetime
+import sys
+import uuid
+
+from marketplace.server import create_app
+from marketplace.api.export import community_export_rows, ndjson_lines
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Export a community's listings as JSON Lines.")
+    arg_parser.add_argument("community_id", type=uuid.UUID)
+    arg_parser.add_argument(
+        "--since", type=datetime.datetime.fromisoformat,
+        help="only listings created or updated after this time, less EXPORT_OVERLAP_SECONDS",
+    )
+    arg_parser.add_argument("--after-id", type=uuid.UUID, help="resume after this listing at --since")
+    arg_parser.add_argument("--status")
+    arg_parser.add_argument("--output", help="defaults to stdout")
+    args = arg_parser.parse_args()
+    if args.after_id is not None and args.since is None:
+        arg_parser.error("--after-id needs --since")
+
+    output = open(args.output, "w") if args.output else sys.stdout
+    try:
+        with create_app(routes=False).app_context():
+            rows = community_export_rows(args.community_id, args.since, args.status, args.after_id)
+            output.writelines(ndjson_lines(rows))
+    finally:
+        if args.output:
+            output.close()
+
+
+if __name__ == "__main__":
+    main()
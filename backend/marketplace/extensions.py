@@ -0,0 +1,12 @@
+"""
+Extensions created unbound, so modules can import them without building an app.
+`create_app` in marketplace/server.py binds them to the app it creates.
+"""
+from flask_sqlalchemy import SQLAlchemy
+from marketplace.cache import ListingCache, LRUCacheBackend, ProfileCache
+from marketplace.replicas import ReplicaRouter, RoutingSession
+
+db = SQLAlchemy(session_options={"class_": RoutingSession})
+replica_router = ReplicaRouter()
+listing_cache = ListingCache(LRUCacheBackend())
+profile_cache = ProfileCache(LRUCacheBackend())
@@ -0,0 +1,257 @@
+"""
+Zipcode distances for shipping estimates and "near me" feeds. Shipping estimates are answered in process;
+feeds match items against the `zipcodes` table, loaded from the same dataset by marketplace/load_zipcodes.py.
+
+marketplace/data/zipcodes.csv is a small sample of US zipcode centroids, for development and tests: distances
+to any other zipcode are unknown. Point ZIPCODE_DATASET at the Census ZCTA Gazetteer file
+(https://www.census.gov/geographies/reference-files/time-series/geo/gazetteer-files.html) for every zipcode;
+both its tab-separated columns and the sample's `zipcode,latitude,longitude` are read. Apps configured with
+ZIPCODE_DATASET_MIN_ZIPCODES (ProductionConfiguration) refuse to start on a dataset with fewer zipcodes.
+"""
+import csv
+import logging
+import math
+import os
+import threading
+from array import array
+from typing import Iterable, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ZIPCODE_DATASET = os.path.join(os.path.dirname(__file__), "data", "zipcodes.csv")
+EARTH_RADIUS_MILES = 3958.8
+MILES_PER_DEGREE_LATITUDE = 69.0
+# cells of the spatial index, in degrees; about 69 x 55 miles across the continental US
+GRID_DEGREES = 1.0
+
+# zone -> distance ceiling in miles, after the USPS zone chart (zone 8 is everything further)
+SHIPPING_ZONE_MILES = [(1, 50), (2, 150), (3, 300), (4, 600), (5, 1000), (6, 1400), (7, 1800)]
+FARTHEST_SHIPPING_ZONE = 8
+
+ZIPCODE_COLUMNS = ("zipcode", "GEOID")
+LATITUDE_COLUMNS = ("latitude", "INTPTLAT")
+LONGITUDE_COLUMNS = ("longitude", "INTPTLONG")
+
+
+def normalize_zipcode(zipcode: Optional[str]) -> Optional[str]:
+    """The 5 digit zipcode of "94115" or "94115-1234", or None for anything else."""
+    if not zipcode:
+        return None
+
+    zipcode = zipcode.strip()[:5]
+    return zipcode if len(zipcode) == 5 and zipcode.isdigit() else None
+
+
+def haversine_miles(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+
+    return 2 * EARTH_RADIUS_MILES * math.asin(math.sqrt(a))
+
+
+def grid_cell(latitude: float, longitude: float) -> tuple:
+    return math.floor(latitude / GRID_DEGREES), math.floor(longitude / GRID_DEGREES)
+
+
+def bounding_box(latitude: float, longitude: float, radius_miles: float) -> tuple:
+    """
+    (min latitude, max latitude, longitude ranges) of a box around every point within the radius.
+    The longitude ranges are split in two where the box crosses the antimeridian, and cover every
+    longitude where it reaches a pole.
+    """
+    latitude_span = radius_miles / MILES_PER_DEGREE_LATITUDE
+    min_latitude, max_latitude = latitude - latitude_span, latitude + latitude_span
+    if min_latitude <= -90 or max_latitude >= 90:
+        return max(min_latitude, -90.0), min(max_latitude, 90.0), [(-180.0, 180.0)]
+
+    # degrees of longitude shrink towards the poles
+    longitude_span = radius_miles / (MILES_PER_DEGREE_LATITUDE * math.cos(math.radians(latitude)))
+    if longitude_span >= 180:
+        return min_latitude, max_latitude, [(-180.0, 180.0)]
+
+    west, east = longitude - longitude_span, longitude + longitude_span
+    if west < -180:
+        longitude_ranges = [(west + 360, 180.0), (-180.0, east)]
+    elif east > 180:
+        longitude_ranges = [(west, 180.0), (-180.0, east - 360)]
+    else:
+        longitude_ranges = [(west, east)]
+
+    return min_latitude, max_latitude, longitude_ranges
+
+
+def read_zipcode_rows(path: str) -> Iterable[tuple]:
+    with open(path, newline="") as stream:
+        header = stream.readline()
+        stream.seek(0)
+        reader = csv.DictReader(stream, delimiter="\t" if "\t" in header else ",")
+        # the Gazetteer pads its last header with spaces
+        reader.fieldnames = [name.strip() for name in reader.fieldnames]
+        zipcode_column, = (name for name in ZIPCODE_COLUMNS if name in reader.fieldnames)
+        latitude_column, = (name for name in LATITUDE_COLUMNS if name in reader.fieldnames)
+        longitude_column, = (name for name in LONGITUDE_COLUMNS if name in reader.fieldnames)
+
+        for row in reader:
+            yield row[zipcode_column].strip(), float(row[latitude_column]), float(row[longitude_column])
+
+
+class ZipcodeIndex(object):
+    """
+    Zipcode centroids in parallel arrays, with each zipcode's position bucketed into a grid cell.
+    A point lookup is one dict probe; a radius query only measures the zipcodes in the cells overlapping
+    the radius' bounding box. Every US zipcode (~33k) fits in a few MB this way.
+    """
+
+    def __init__(self, rows: Iterable[tuple]):
+        self.zipcodes = []
+        self.latitudes = array("d")
+        self.longitudes = array("d")
+        self.positions = {}
+        self.cells = {}
+
+        for zipcode, latitude, longitude in rows:
+            if zipcode in self.positions:
+                continue
+            position = len(self.zipcodes)
+            self.zipcodes.append(zipcode)
+            self.latitudes.append(latitude)
+            self.longitudes.append(longitude)
+            self.positions[zipcode] = position
+            self.cells.setdefault(grid_cell(latitude, longitude), array("i")).append(position)
+
+    @classmethod
+    def from_file(cls, path: str) -> "ZipcodeIndex":
+        return cls(read_zipcode_rows(path))
+
+    def __len__(self):
+        return len(self.zipcodes)
+
+    def __contains__(self, zipcode: str):
+        return normalize_zipcode(zipcode) in self.positions
+
+    def location(self, zipcode: str) -> Optional[tuple]:
+        position = self.positions.get(normalize_zipcode(zipcode))
+        if position is None:
+            return None
+
+        return self.latitudes[position], self.longitudes[position]
+
+    def distance_miles(self, from_zipcode: str, to_zipcode: str) -> Optional[float]:
+        """Great-circle distance between two zipcodes' centroids, or None if either is unknown."""
+        origin = self.location(from_zipcode)
+        destination = self.location(to_zipcode)
+        if origin is None or destination is None:
+            return None
+
+        return haversine_miles(*origin, *destination)
+
+    def within(self, zipcode: str, radius_miles: float) -> Optional[list]:
+        """(zipcode, miles) of every zipcode within the radius, nearest first, or None for an unknown zipcode."""
+        origin = self.location(zipcode)
+        if origin is None:
+            return None
+
+        latitude, longitude = origin
+        min_latitude, max_latitude, longitude_ranges = bounding_box(latitude, longitude, radius_miles)
+        min_row, max_row = grid_cell(min_latitude, 0)[0], grid_cell(max_latitude, 0)[0]
+        columns = set()
+        for west, east in longitude_ranges:
+            columns.update(range(grid_cell(0, west)[1], grid_cell(0, east)[1] + 1))
+
+        nearby = []
+        for row in range(min_row, max_row + 1):
+            for column in columns:
+                for position in self.cells.get((row, column), ()):
+                    miles = haversine_miles(latitude, longitude, self.latitudes[position], self.longitudes[position])
+                    if miles <= radius_miles:
+                        nearby.append((self.zipcodes[position], miles))
+
+        return sorted(nearby, key=lambda zipcode_miles: zipcode_miles[1])
+
+
+def shipping_zone(distance_miles: float) -> int:
+    for zone, ceiling_miles in SHIPPING_ZONE_MILES:
+        if distance_miles <= ceiling_miles:
+            return zone
+
+    return FARTHEST_SHIPPING_ZONE
+
+
+def checked_zipcode_index(path: str, min_zipcodes: int = 0) -> ZipcodeIndex:
+    """
+    The index of a dataset, refusing one of fewer than `min_zipcodes` zipcodes rather than leaving
+    distances unknown for most addresses. Without a minimum, using the bundled sample only logs a warning.
+    """
+    if not path or not os.path.exists(path):
+        raise RuntimeError(f"ZIPCODE_DATASET doesn't exist: {path!r}")
+
+    index = ZipcodeIndex.from_file(path)
+    if len(index) < min_zipcodes:
+        raise RuntimeError(
+            f"ZIPCODE_DATASET {path} has {len(index)} zipcodes, fewer than ZIPCODE_DATASET_MIN_ZIPCODES "
+            f"({min_zipcodes}); point it at the Census ZCTA Gazetteer file"
+        )
+    if os.path.abspath(path) == os.path.abspath(DEFAULT_ZIPCODE_DATASET):
+        logger.warning(
+            "Using the sample zipcode dataset of %d zipcodes; shipping estimates and distance filters only "
+            "work between them. Set ZIPCODE_DATASET to the Census ZCTA Gazetteer file", len(index)
+        )
+
+    return index
+
+
+class ZipcodeDirectory(object):
+    """
+    The process' `ZipcodeIndex`, loaded from ZIPCODE_DATASET on first use, and the shipping rates.
+    Configured once by `init_app`, so it can be used outside an app context, i.e. by the ASGI handlers.
+    """
+
+    def __init__(self, path: str = DEFAULT_ZIPCODE_DATASET, shipping_rates_cents: Optional[dict] = None):
+        self.path = path
+        self.min_zipcodes = 0
+        self.shipping_rates_cents = shipping_rates_cents or {}
+        self._index = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app) -> None:
+        """Apps requiring a full dataset (ZIPCODE_DATASET_MIN_ZIPCODES) load it now, failing at startup."""
+        path = app.config["ZIPCODE_DATASET"]
+        with self._lock:
+            if path != self.path:
+                self._index = None
+            self.path = path
+            self.min_zipcodes = app.config["ZIPCODE_DATASET_MIN_ZIPCODES"]
+            self.shipping_rates_cents = app.config["SHIPPING_RATES_CENTS"]
+
+        if self.min_zipcodes:
+            self.index
+
+    @property
+    def index(self) -> ZipcodeIndex:
+        index = self._index
+        if index is not None:
+            return index
+
+        with self._lock:
+            if self._index is None:
+                self._index = checked_zipcode_index(self.path, self.min_zipcodes)
+
+            return self._index
+
+    def estimate_shipping(self, from_zipcode: Optional[str], to_zipcode: Optional[str]) -> Optional[dict]:
+        """Distance, zone and cost of shipping between two zipcodes, or None if either is unknown."""
+        distance = self.index.distance_miles(from_zipcode, to_zipcode) if from_zipcode and to_zipcode else None
+        if distance is None:
+            return None
+
+        zone = shipping_zone(distance)
+        return {
+            "from_zipcode": normalize_zipcode(from_zipcode),
+            "to_zipcode": normalize_zipcode(to_zipcode),
+            "distance_miles": round(distance, 1),
+            "zone": zone,
+            "estimated_cost_cents": self.shipping_rates_cents.get(zone),
+        }
+
+
+zipcode_directory = ZipcodeDirectory()
@@ -0,0 +1,116 @@
+"""
+Image processing for uploaded photos: thumbnails and blurhash placeholders.
+Kept free of Flask and the database, so process pool workers import only Pillow and this module.
+"""
+import io
+import math
+from PIL import Image, ImageOps
+
+THUMBNAIL_FORMAT = "JPEG"
+THUMBNAIL_CONTENT_TYPE = "image/jpeg"
+BLURHASH_COMPONENTS = (4, 3)
+# the placeholder only carries a handful of colors, so it is computed from a tiny copy of the image
+BLURHASH_SAMPLE_EDGE = 32
+
+BASE83_CHARACTERS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def encode_base83(value: int, length: int) -> str:
+    return "".join(BASE83_CHARACTERS[value // 83 ** (length - digit - 1) % 83] for digit in range(length))
+
+
+def srgb_to_linear(value: int) -> float:
+    value = value / 255
+    if value <= 0.04045:
+        return value / 12.92
+
+    return ((value + 0.055) / 1.055) ** 2.4
+
+
+def linear_to_srgb(value: float) -> int:
+    value = max(0.0, min(1.0, value))
+    if value <= 0.0031308:
+        return int(value * 12.92 * 255 + 0.5)
+
+    return int((1.055 * value ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def sign_pow(value: float, exponent: float) -> float:
+    return math.copysign(abs(value) ** exponent, value)
+
+
+def blurhash_encode(image: Image.Image, x_components: int = 4, y_components: int = 3) -> str:
+    """
+    Encode a small RGB image as a blurhash (https://blurha.sh), a short string clients decode into
+    a blurred placeholder while the real image loads.
+    """
+    width, height = image.size
+    pixels = [tuple(srgb_to_linear(channel) for channel in pixel) for pixel in image.getdata()]
+    x_bases = [[math.cos(math.pi * i * x / width) for x in range(width)] for i in range(x_components)]
+    y_bases = [[math.cos(math.pi * j * y / height) for y in range(height)] for j in range(y_components)]
+
+    factors = []
+    for j in range(y_components):
+        for i in range(x_components):
+            normalisation = 1 if i == 0 and j == 0 else 2
+            r = g = b = 0.0
+            for y in range(height):
+                y_basis = y_bases[j][y]
+                row = y * width
+                for x in range(width):
+                    basis = x_bases[i][x] * y_basis
+                    pixel = pixels[row + x]
+                    r += basis * pixel[0]
+                    g += basis * pixel[1]
+                    b += basis * pixel[2]
+            scale = normalisation / (width * height)
+            factors.append((r * scale, g * scale, b * scale))
+
+    dc, ac = factors[0], factors[1:]
+    blurhash = encode_base83((x_components - 1) + (y_components - 1) * 9, 1)
+
+    if ac:
+        quantised_max = max(0, min(82, int(max(abs(value) for factor in ac for value in factor) * 166 - 0.5)))
+        max_ac = (quantised_max + 1) / 166
+    else:
+        quantised_max, max_ac = 0, 1.0
+    blurhash += encode_base83(quantised_max, 1)
+
+    blurhash += encode_base83((linear_to_srgb(dc[0]) << 16) + (linear_to_srgb(dc[1]) << 8) + linear_to_srgb(dc[2]), 4)
+    for factor in ac:
+        r, g, b = (max(0, min(18, int(sign_pow(value / max_ac, 0.5) * 9 + 9.5))) for value in factor)
+        blurhash += encode_base83(r * 19 * 19 + g * 19 + b, 2)
+
+    return blurhash
+
+
+def process_photo(data: bytes, sizes: dict, quality: int = 85) -> dict:
+    """
+    Decode an uploaded image and render a JPEG thumbnail bounded by each of `sizes` ({name: max edge}).
+    Thumbnails are never upscaled, so a small original yields thumbnails at its own size.
+    Runs in a process pool worker, so it takes and returns only plain, picklable values.
+    Raises `PIL.UnidentifiedImageError` (or another `OSError`) when the data isn't a readable image.
+    """
+    with Image.open(io.BytesIO(data)) as original:
+        image_format = original.format
+        # phones store rotation as an EXIF tag rather than rotating the pixels
+        image = ImageOps.exif_transpose(original).convert("RGB")
+
+    variants = {}
+    for name, max_edge in sizes.items():
+        thumbnail = image.copy()
+        thumbnail.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS)
+        buffer = io.BytesIO()
+        thumbnail.save(buffer, THUMBNAIL_FORMAT, quality=quality, optimize=True, progressive=True)
+        variants[name] = {"width": thumbnail.width, "height": thumbnail.height, "data": buffer.getvalue()}
+
+    sample = image.copy()
+    sample.thumbnail((BLURHASH_SAMPLE_EDGE, BLURHASH_SAMPLE_EDGE))
+
+    return {
+        "format": image_format,
+        "width": image.width,
+        "height": image.height,
+        "blurhash": blurhash_encode(sample, *BLURHASH_COMPONENTS),
+        "variants": variants,
+    }
@@ -0,0 +1,35 @@
+"""
+Bulk import listings from a CSV or JSON Lines file.
+
+    python marketplace/import_listings.py listings.jsonl
+    python marketplace/import_listings.py listings.csv --chunk-size 5000
+"""
+import argparse
+import json
+import os
+
+from marketplace.server import create_app
+from marketplace.api.bulk import IMPORT_CHUNK_SIZE, IMPORT_READERS, import_listings
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Bulk import listings from a CSV or JSON Lines file.")
+    arg_parser.add_argument("path")
+    arg_parser.add_argument("--format", choices=sorted(IMPORT_READERS), help="defaults to the file extension")
+    arg_parser.add_argument("--chunk-size", type=int, default=IMPORT_CHUNK_SIZE)
+    args = arg_parser.parse_args()
+
+    import_format = args.format or os.path.splitext(args.path)[1].lstrip(".").lower()
+    if import_format not in IMPORT_READERS:
+        arg_parser.error(f"unknown format '{import_format}', pass --format")
+
+    with open(args.path, newline="") as stream, create_app(routes=False).app_context():
+        result = import_listings(IMPORT_READERS[import_format](stream), chunk_size=args.chunk_size)
+
+    print(json.dumps({"imported": result["imported"], "failed": len(result["errors"])}))
+    for error in result["errors"]:
+        print(json.dumps(error, default=str))
+
+
+if __name__ == "__main__":
+    main()
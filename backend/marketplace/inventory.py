@@ -0,0 +1,116 @@
+import datetime
+from collections import Counter
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import case, select, update
+from marketplace.extensions import db
+from marketplace.models import Listing, ListingReservation
+from marketplace.stats import apply_stats_deltas, status_change_deltas
+
+# returned by the stock updates, to move a listing between stats rows when its status changes
+STATS_COLUMNS = (Listing.community_id, Listing.listing_type, Listing.sale_type, Listing.listing_price_cents)
+
+
+def take_stock(listing_id: UUID, quantity: int):
+    """
+    Take `quantity` from an active listing's stock with one conditional UPDATE, marking it sold when
+    the last one goes. The row lock of the UPDATE serializes concurrent buyers and the stock check is
+    re-evaluated against the latest count, so stock can't be oversold.
+    Returns the listing's (available_count, status) after the update, or None if there wasn't enough.
+    """
+    remaining = Listing.available_count - quantity
+    stock = db.session.execute(
+        update(Listing)
+        .where(
+            Listing.id == listing_id,
+            Listing.status == "active",
+            Listing.available_count >= quantity,
+        )
+        .values(
+            available_count=remaining,
+            status=case((remaining == 0, "sold"), else_=Listing.status),
+        )
+        .returning(Listing.available_count, Listing.status, *STATS_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).one_or_none()
+
+    if stock is not None and stock.status == "sold":
+        apply_stats_deltas(db.session.connection(), status_change_deltas(stock, "active", "sold"))
+
+    return stock
+
+
+def return_stock(listing_id: UUID, quantity: int):
+    """
+    Give stock back to a listing, reopening it if it had sold out. The status before the update is read
+    from the row it locks, in the same statement, to tell whether it reopened.
+    """
+    previous = select(Listing.id, Listing.status).where(Listing.id == listing_id).with_for_update().cte("previous")
+    stock = db.session.execute(
+        update(Listing)
+        .where(Listing.id == previous.c.id)
+        .values(
+            available_count=Listing.available_count + quantity,
+            status=case((Listing.status == "sold", "active"), else_=Listing.status),
+        )
+        .returning(Listing.available_count, Listing.status, previous.c.status.label("previous_status"), *STATS_COLUMNS)
+        .execution_options(synchronize_session=False)
+    ).one_or_none()
+
+    if stock is not None and stock.status != stock.previous_status:
+        apply_stats_deltas(
+            db.session.connection(), status_change_deltas(stock, stock.previous_status, stock.status)
+        )
+
+    return stock
+
+
+def close_reservation(reservation_id: UUID, status: str, listing_id: Optional[UUID] = None):
+    """
+    Move a held, unexpired reservation to `status`. Conditional on it still being held, so a hold
+    is only ever purchased or released once. Returns (listing_id, quantity), or None.
+    """
+    query = update(ListingReservation).where(
+        ListingReservation.id == reservation_id,
+        ListingReservation.status == "held",
+        ListingReservation.expires_on > datetime.datetime.now(),
+    )
+    if listing_id is not None:
+        query = query.where(ListingReservation.listing_id == listing_id)
+
+    return db.session.execute(
+        query
+        .values(status=status)
+        .returning(ListingReservation.listing_id, ListingReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).one_or_none()
+
+
+def release_expired_reservations(listing_id: Optional[UUID] = None) -> Counter:
+    """
+    Expire holds past their `expires_on` and return their stock, for one listing or all of them.
+    Returns the quantity given back per listing id; the caller commits.
+    """
+    query = update(ListingReservation).where(
+        ListingReservation.status == "held",
+        ListingReservation.expires_on <= datetime.datetime.now(),
+    )
+    if listing_id is not None:
+        query = query.where(ListingReservation.listing_id == listing_id)
+
+    expired = db.session.execute(
+        query
+        .values(status="expired")
+        .returning(ListingReservation.listing_id, ListingReservation.quantity)
+        .execution_options(synchronize_session=False)
+    ).all()
+
+    released = Counter()
+    for expired_listing_id, quantity in expired:
+        released[expired_listing_id] += quantity
+
+    # in a stable order, so concurrent sweeps lock listings in the same order
+    for expired_listing_id in sorted(released):
+        return_stock(expired_listing_id, released[expired_listing_id])
+
+    return released
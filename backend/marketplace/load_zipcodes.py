@@ -0,0 +1,39 @@
+"""
+Replace the zipcodes table with the centroids of ZIPCODE_DATASET, which feed distance filters join against.
+Run it after creating the database and whenever the dataset changes, in one transaction alongside live reads:
+
+    python marketplace/load_zipcodes.py
+"""
+from sqlalchemy import delete, insert
+
+from marketplace.extensions import db
+from marketplace.server import create_app
+from marketplace.geo import ZipcodeIndex, zipcode_directory
+from marketplace.models import Zipcode
+
+LOAD_BATCH_SIZE = 5000
+
+
+def load_zipcodes(index: ZipcodeIndex) -> int:
+    """Replace every zipcode with the index' ones. Returns how many were loaded."""
+    db.session.execute(delete(Zipcode))
+    rows = [
+        {"zipcode": zipcode, "latitude": latitude, "longitude": longitude}
+        for zipcode, latitude, longitude in zip(index.zipcodes, index.latitudes, index.longitudes)
+    ]
+    for start in range(0, len(rows), LOAD_BATCH_SIZE):
+        db.session.execute(insert(Zipcode), rows[start:start + LOAD_BATCH_SIZE])
+
+    return len(rows)
+
+
+def main():
+    with create_app(routes=False).app_context():
+        loaded = load_zipcodes(zipcode_directory.index)
+        db.session.commit()
+
+    print(f"loaded {loaded} zipcodes from {zipcode_directory.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Migrate the JSON details columns of an existing database to JSONB and add their GIN indexes, along with
+the indexes leading from matched items and lodgings back to their listings.
+
+Details that were stored as a JSON-encoded string (i.e. "{\"size\": 14}") are unwrapped into the
+object they hold, so containment filters can match them; strings that aren't JSON are kept as strings.
+Columns that are already JSONB are skipped, so the script can be re-run safely.
+
+    python marketplace/migrate_details_jsonb.py
+"""
+from marketplace.extensions import db
+from marketplace.server import create_app
+from sqlalchemy import text
+
+# (table, column, GIN index); photos are converted but never filtered on, so aren't indexed
+JSONB_COLUMNS = [
+    ("source_items", "source_item_details", "ix_source_items_details"),
+    ("items", "photos", None),
+    ("items", "item_details", "ix_items_details"),
+    ("lodgings", "lodging_details", "ix_lodgings_details"),
+]
+
+# the way back from details matched in items and lodgings to their listings
+MAPPING_INDEXES = [
+    ("listing_items", "item_id", "ix_listing_items_item"),
+    ("listing_lodgings", "lodging_id", "ix_listing_lodgings_lodging"),
+]
+
+TRY_JSONB_FUNCTION = """
+CREATE OR REPLACE FUNCTION pg_temp.try_jsonb(val json) RETURNS jsonb AS $$
+BEGIN
+    IF json_typeof(val) = 'string' THEN
+        BEGIN
+            RETURN (val #>> '{}')::jsonb;
+        EXCEPTION WHEN invalid_text_representation THEN
+            RETURN val::jsonb;
+        END;
+    END IF;
+    RETURN val::jsonb;
+END;
+$$ LANGUAGE plpgsql IMMUTABLE
+"""
+
+
+def column_type(connection, table: str, column: str) -> str:
+    return connection.execute(
+        text("SELECT data_type FROM information_schema.columns WHERE table_name = :table AND column_name = :column"),
+        {"table": table, "column": column},
+    ).scalar()
+
+
+def migrate(connection) -> list:
+    migrated = []
+    connection.execute(text(TRY_JSONB_FUNCTION))
+
+    for table, column, index_name in JSONB_COLUMNS:
+        if column_type(connection, table, column) == "json":
+            connection.execute(text(
+                f"ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB USING pg_temp.try_jsonb({column})"
+            ))
+            migrated.append(f"{table}.{column}")
+
+        if index_name is not None:
+            connection.execute(text(
+                f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} USING gin ({column} jsonb_path_ops)"
+            ))
+
+    for table, column, index_name in MAPPING_INDEXES:
+        connection.execute(text(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table} ({column})"))
+
+    return migrated
+
+
+def main():
+    with create_app(routes=False).app_context(), db.engine.begin() as connection:
+        migrated = migrate(connection)
+
+    print(f"migrated to JSONB: {', '.join(migrated) or 'nothing to migrate'}")
+
+
+if __name__ == "__main__":
+    main()
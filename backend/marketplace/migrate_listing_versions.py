@@ -0,0 +1,33 @@
+"""
+Add the version and updated_on columns that conditional listing reads validate against to the listings
+table of an existing database, and the index incremental exports page through them by. Existing listings
+start at version 1, last modified now. Columns and indexes that already exist are skipped, so the script
+can be re-run safely.
+
+    python marketplace/migrate_listing_versions.py
+"""
+from marketplace.extensions import db
+from marketplace.server import create_app
+from sqlalchemy import text
+
+ADD_COLUMNS = """
+ALTER TABLE listings
+    ADD COLUMN IF NOT EXISTS version integer NOT NULL DEFAULT 1,
+    ADD COLUMN IF NOT EXISTS updated_on timestamp with time zone DEFAULT now()
+"""
+
+CREATE_INDEX = """
+CREATE INDEX IF NOT EXISTS ix_listings_community_updated ON listings (community_id, updated_on, id)
+"""
+
+
+def main():
+    with create_app(routes=False).app_context(), db.engine.begin() as connection:
+        connection.execute(text(ADD_COLUMNS))
+        connection.execute(text(CREATE_INDEX))
+
+    print("listings have version and updated_on columns")
+
+
+if __name__ == "__main__":
+    main()
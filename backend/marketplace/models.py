@@ -1,9 +1,19 @@
 import uuid
-from sqlalchemy import func
-from sqlalchemy.dialects.postgresql import UUID
-from sqlalchemy.schema import PrimaryKeyConstraint
+from sqlalchemy import JSON, Text, event, func, literal_column, select, update
+from sqlalchemy.orm import object_session
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR, UUID
+from sqlalchemy.schema import DDL, CheckConstraint, ForeignKeyConstraint, Index, PrimaryKeyConstraint
 from werkzeug.security import generate_password_hash, check_password_hash
-from marketplace.server import db
+from marketplace.extensions import db, listing_cache
+
+# PostgreSQL types fall back to plain ones on SQLite, so the schema can also be created there
+# (i.e. by `benchmarks/api.py --sqlite`). Expressions keep the PostgreSQL operators, like `@>`.
+DetailsJSONB = JSONB().with_variant(JSON(), "sqlite")
+SearchTSVECTOR = TSVECTOR().with_variant(Text(), "sqlite")
+
+# listings are hash partitioned by community on PostgreSQL; changing the count means migrating the table again
+# (see marketplace/partition_listings.py)
+LISTING_PARTITIONS = 16
 
 
 class Community(db.Model):
@@ -56,8 +66,9 @@ class Listing(db.Model):
     """
     __tablename__ = "listings"
 
+    # the partition key has to be part of the primary key; rows are still identified by id alone
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=lambda: uuid.uuid4())
-    community_id = db.Column(UUID(as_uuid=True), db.ForeignKey('communities.id'))
+    community_id = db.Column(UUID(as_uuid=True), db.ForeignKey('communities.id'), primary_key=True)
     listed_by_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'))
     created_on = db.Column(db.DateTime, default=func.now())
     listed_on = db.Column(db.DateTime)
@@ -75,6 +86,40 @@ class Listing(db.Model):
     listing_title = db.Column(db.String(100), nullable=False)
     listing_desc = db.Column(db.Text)
     available_count = db.Column(db.Integer, nullable=False, default=1)
+    # bumped by every write to the listing, including its item or lodging (see `touch_listings`),
+    # so get_listing can answer conditional requests from these two columns alone
+    version = db.Column(
+        db.Integer, nullable=False, default=1, server_default="1", onupdate=literal_column("version") + 1
+    )
+    updated_on = db.Column(
+        db.DateTime(timezone=True), default=func.now(), server_default=func.now(), onupdate=func.now()
+    )
+    # weighted full-text document of the title, item/source item names and description,
+    # written along with the listing (see marketplace/search.py)
+    search_vector = db.deferred(db.Column(SearchTSVECTOR))
+
+    # community feeds page by keyset on (listed_on, id) within a community and status,
+    # optionally narrowed to one listing type. Price and sale type are filtered within the range scan.
+    __table_args__ = (
+        Index("ix_listings_community_feed", community_id, status, listed_on.desc(), id.desc()),
+        Index(
+            "ix_listings_community_type_feed", community_id, status, listing_type, listed_on.desc(), id.desc()
+        ),
+        Index("ix_listings_search_vector", search_vector, postgresql_using="gin"),
+        # incremental exports page by keyset on (updated_on, id) within a community
+        Index("ix_listings_community_updated", community_id, updated_on, id),
+        # every query is scoped to a community, so it only touches that community's partition and
+        # big communities don't bloat the indexes and vacuum work of everyone else's
+        {"postgresql_partition_by": "HASH (community_id)"},
+    )
+    __mapper_args__ = {"primary_key": [id]}
+
+
+for remainder in range(LISTING_PARTITIONS):
+    event.listen(Listing.__table__, "after_create", DDL(
+        f"CREATE TABLE listings_p{remainder} PARTITION OF listings "
+        f"FOR VALUES WITH (MODULUS {LISTING_PARTITIONS}, REMAINDER {remainder})"
+    ).execute_if(dialect="postgresql"))
 
 
 class Category(db.Model):
@@ -89,6 +134,23 @@ class Category(db.Model):
     parent_id = db.Column(UUID(as_uuid=True), db.ForeignKey('categories.id'))
 
 
+class CategoryClosure(db.Model):
+    """
+    Closure table over the category tree: one row per (ancestor, descendant) pair, including each
+    category paired with itself at depth 0. Ancestors and descendants at any depth are one indexed lookup.
+    """
+    __tablename__ = "category_closure"
+
+    ancestor_id = db.Column(UUID(as_uuid=True), db.ForeignKey('categories.id'), primary_key=True)
+    descendant_id = db.Column(UUID(as_uuid=True), db.ForeignKey('categories.id'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)
+
+    __table_args__ = (
+        PrimaryKeyConstraint('ancestor_id', 'descendant_id'),
+        Index("ix_category_closure_descendant", descendant_id, depth),
+    )
+
+
 class SourceItem(db.Model):
     """
     The common details of an item, distinct from a particular instance of it.
@@ -97,10 +159,18 @@ class SourceItem(db.Model):
 
     id = db.Column(UUID(as_uuid=True), primary_key=True, default=lambda: uuid.uuid4())
     source_item_name = db.Column(db.String)
-    category_id = db.Column(UUID(as_uuid=True), db.ForeignKey('categories.id'))
+    category_id = db.Column(UUID(as_uuid=True), db.ForeignKey('categories.id'), index=True)
     # leaving this wide open as a JSON blob, as this may hold all the metadata of an item
     # or simply be an API link to an outside source that holds the data.
-    source_item_details = db.Column(db.JSON)
+    source_item_details = db.Column(DetailsJSONB)
+
+    # details are filtered by containment (@>), which jsonb_path_ops GIN indexes serve
+    __table_args__ = (
+        Index(
+            "ix_source_items_details", source_item_details,
+            postgresql_using="gin", postgresql_ops={"source_item_details": "jsonb_path_ops"},
+        ),
+    )
 
 
 class Item(db.Model):
@@ -114,28 +184,61 @@ class Item(db.Model):
     source_item_id = db.Column(UUID(as_uuid=True), db.ForeignKey('source_items.id'))
     item_name = db.Column(db.String)
     condition = db.Column(db.String(20), nullable=False, default="n/a")
-    # both photos and shipping location should be in separate tables, but simplifying for time here
-    # photos stores image metadata and file locations
-    photos = db.Column(db.JSON)
+    # shipping location should be in a separate table, but simplifying for time here
+    # photos lists the item's `Photo` entries (id, urls, dimensions, blurhash) in display order,
+    # denormalized so listing reads don't join the photos table
+    photos = db.Column(DetailsJSONB)
     # needed to calculate shipping
     shipping_zipcode = db.Column(db.String)
     # if the table columns are known data about all items, this JSON allows flexible data to be stored
     # for unexpected item details. My general plan would be to harden certain fields here into new tables/columns
     # based on usage. The near term cost is minor performance and data obscurity, but it provides a flexible
     # structure to handle entirely new item categories without causing backend changes.
-    item_details = db.Column(db.JSON)
+    item_details = db.Column(DetailsJSONB)
+
+    __table_args__ = (
+        Index(
+            "ix_items_details", item_details,
+            postgresql_using="gin", postgresql_ops={"item_details": "jsonb_path_ops"},
+        ),
+    )
     
 
+class Zipcode(db.Model):
+    """
+    Zipcode centroids, loaded from ZIPCODE_DATASET by marketplace/load_zipcodes.py, so distance filters
+    join against them in SQL.
+    """
+    __tablename__ = "zipcodes"
+
+    zipcode = db.Column(db.String(5), primary_key=True)
+    latitude = db.Column(db.Float, nullable=False)
+    longitude = db.Column(db.Float, nullable=False)
+
+    __table_args__ = (
+        # the bounding box of a radius is a latitude range first
+        Index("ix_zipcodes_location", latitude, longitude),
+    )
+
+
 class ListingItem(db.Model):
     """
     Maps listings and items.
     """
     __tablename__ = "listing_items"
-    listing_id = db.Column(UUID(as_uuid=True), db.ForeignKey('listings.id'), primary_key=True)
+    listing_id = db.Column(UUID(as_uuid=True), primary_key=True)
+    # the listing's partition key: a unique key of the partitioned listings table, which the foreign key
+    # has to reference, includes it
+    community_id = db.Column(UUID(as_uuid=True), nullable=False)
     item_id = db.Column(UUID(as_uuid=True), db.ForeignKey('items.id'), primary_key=True)
 
     __table_args__ = (
         PrimaryKeyConstraint('listing_id', 'item_id'),
+        ForeignKeyConstraint(
+            ["listing_id", "community_id"], ["listings.id", "listings.community_id"], name="fk_listing_items_listing"
+        ),
+        # from items matched by their details back to their listings
+        Index("ix_listing_items_item", item_id),
     )
 
 
@@ -154,7 +257,18 @@ class Lodging(db.Model):
     end_date = db.Column(db.Date)
     lodging_type = db.Column(db.String)
     lodging_url = db.Column(db.String)
-    lodging_details = db.Column(db.JSON)
+    lodging_details = db.Column(DetailsJSONB)
+
+    __table_args__ = (
+        Index(
+            "ix_lodgings_details", lodging_details,
+            postgresql_using="gin", postgresql_ops={"lodging_details": "jsonb_path_ops"},
+        ),
+        # availability window as a date range, so "free from X to Y" is a GiST range lookup
+        Index(
+            "ix_lodgings_availability", func.daterange(start_date, end_date), postgresql_using="gist"
+        ).ddl_if(dialect="postgresql"),
+    )
 
 
 class ListingLodging(db.Model):
@@ -162,9 +276,167 @@ class ListingLodging(db.Model):
     Maps listings and lodgings
     """
     __tablename__ = "listing_lodgings"
-    listing_id = db.Column(UUID(as_uuid=True), db.ForeignKey('listings.id'), primary_key=True)
+    listing_id = db.Column(UUID(as_uuid=True), primary_key=True)
+    # the listing's partition key, as ListingItem.community_id
+    community_id = db.Column(UUID(as_uuid=True), nullable=False)
     lodging_id = db.Column(UUID(as_uuid=True), db.ForeignKey('lodgings.id'), primary_key=True)
 
     __table_args__ = (
         PrimaryKeyConstraint('listing_id', 'lodging_id'),
+        ForeignKeyConstraint(
+            ["listing_id", "community_id"], ["listings.id", "listings.community_id"],
+            name="fk_listing_lodgings_listing",
+        ),
+        Index("ix_listing_lodgings_lodging", lodging_id),
+    )
+
+
+def touch_listings(connection, listing_ids) -> list:
+    """Bump the version of listings whose response changed through another table, returning their ids."""
+    return connection.scalars(
+        update(Listing).where(Listing.id.in_(listing_ids)).values(updated_on=func.now()).returning(Listing.id)
+    ).all()
+
+
+def mark_listings_stale(target, listing_ids) -> None:
+    """Invalidate the cached responses of these listings once the session writing `target` commits."""
+    object_session(target).info.setdefault("stale_listings", set()).update(listing_ids)
+
+
+@event.listens_for(Listing, "after_update")
+@event.listens_for(Listing, "after_delete")
+def mark_listing_stale(mapper, connection, target):
+    mark_listings_stale(target, [target.id])
+
+
+@event.listens_for(Item, "after_update")
+def touch_item_listing(mapper, connection, target):
+    mark_listings_stale(target, touch_listings(
+        connection, select(ListingItem.listing_id).where(ListingItem.item_id == target.id)
+    ))
+
+
+@event.listens_for(SourceItem, "after_update")
+def touch_source_item_listings(mapper, connection, target):
+    mark_listings_stale(target, touch_listings(connection, select(ListingItem.listing_id).join(
+        Item, Item.id == ListingItem.item_id
+    ).where(Item.source_item_id == target.id)))
+
+
+@event.listens_for(Lodging, "after_update")
+def touch_lodging_listing(mapper, connection, target):
+    mark_listings_stale(target, touch_listings(
+        connection, select(ListingLodging.listing_id).where(ListingLodging.lodging_id == target.id)
+    ))
+
+
+# Cached responses are invalidated only after the change commits, so a concurrent read can't cache
+# the old listing again (as for profiles, see marketplace/profiles.py)
+@event.listens_for(db.session, "after_commit")
+def invalidate_stale_listings(session):
+    for listing_id in session.info.pop("stale_listings", ()):
+        listing_cache.invalidate(listing_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def discard_listing_changes(session):
+    session.info.pop("stale_listings", None)
+
+
+class LodgingBooking(db.Model):
+    """
+    A booked stay at a lodging, from check-in up to (not including) the check-out date,
+    so back-to-back stays don't overlap.
+    """
+    __tablename__ = "lodging_bookings"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=lambda: uuid.uuid4())
+    lodging_id = db.Column(UUID(as_uuid=True), db.ForeignKey('lodgings.id'), nullable=False)
+    listing_id = db.Column(UUID(as_uuid=True), nullable=False)
+    # the listing's partition key, as ListingItem.community_id
+    community_id = db.Column(UUID(as_uuid=True), nullable=False)
+    booked_by_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'))
+    check_in = db.Column(db.Date, nullable=False)
+    check_out = db.Column(db.Date, nullable=False)
+    created_on = db.Column(db.DateTime, default=func.now())
+
+    __table_args__ = (
+        CheckConstraint("check_out > check_in", name="ck_lodging_bookings_stay"),
+        ForeignKeyConstraint(
+            ["listing_id", "community_id"], ["listings.id", "listings.community_id"],
+            name="fk_lodging_bookings_listing",
+        ),
+        # overlap checks are always for one lodging, so they range scan this rather than a GiST index
+        Index("ix_lodging_bookings_lodging", lodging_id, check_in),
+    )
+
+
+class ListingReservation(db.Model):
+    """
+    A short-lived hold on some of a listing's available stock, i.e. while a buyer checks out.
+    Stock is taken from `available_count` when the hold is placed and given back if it is
+    released or expires before it is purchased.
+    """
+    __tablename__ = "listing_reservations"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=lambda: uuid.uuid4())
+    listing_id = db.Column(UUID(as_uuid=True), nullable=False)
+    # the listing's partition key, as ListingItem.community_id
+    community_id = db.Column(UUID(as_uuid=True), nullable=False)
+    reserved_by_id = db.Column(UUID(as_uuid=True), db.ForeignKey('users.id'))
+    quantity = db.Column(db.Integer, nullable=False, default=1)
+    # possible statuses: held/purchased/released/expired
+    status = db.Column(db.String(20), nullable=False, default="held")
+    expires_on = db.Column(db.DateTime, nullable=False)
+    created_on = db.Column(db.DateTime, default=func.now())
+
+    __table_args__ = (
+        CheckConstraint("quantity > 0", name="ck_listing_reservations_quantity"),
+        ForeignKeyConstraint(
+            ["listing_id", "community_id"], ["listings.id", "listings.community_id"],
+            name="fk_listing_reservations_listing",
+        ),
+        # only holds still counting against stock are ever swept for expiry
+        Index(
+            "ix_listing_reservations_held", listing_id, expires_on, postgresql_where=(status == "held")
+        ),
     )
+
+
+class Photo(db.Model):
+    """
+    An uploaded image and its thumbnails in the photo store. Stored once per distinct content,
+    so the same image uploaded again (or to another item) reuses the existing row and files.
+    """
+    __tablename__ = "photos"
+
+    id = db.Column(UUID(as_uuid=True), primary_key=True, default=lambda: uuid.uuid4())
+    # sha256 of the original upload's bytes
+    content_hash = db.Column(db.String(64), nullable=False, unique=True)
+    content_type = db.Column(db.String)
+    width = db.Column(db.Integer)
+    height = db.Column(db.Integer)
+    size_bytes = db.Column(db.Integer)
+    blurhash = db.Column(db.String)
+    original_key = db.Column(db.String, nullable=False)
+    # thumbnail name -> {"key", "width", "height", "size_bytes"}
+    variants = db.Column(DetailsJSONB)
+    created_on = db.Column(db.DateTime, default=func.now())
+
+
+class CommunityListingStats(db.Model):
+    """
+    Number of listings and their summed price in a community, per status, listing type, sale type and
+    price bucket. Kept up to date in the transaction of each listing write, so dashboards read a few rows
+    rather than counting the community's listings (see marketplace/stats.py).
+    """
+    __tablename__ = "community_listing_stats"
+
+    community_id = db.Column(UUID(as_uuid=True), db.ForeignKey('communities.id'), primary_key=True)
+    status = db.Column(db.String(20), primary_key=True)
+    listing_type = db.Column(db.String(20), primary_key=True)
+    sale_type = db.Column(db.String(20), primary_key=True)
+    # index into marketplace.stats.PRICE_BUCKET_CENTS, or -1 for listings without a price
+    price_bucket = db.Column(db.SmallInteger, primary_key=True)
+    listing_count = db.Column(db.Integer, nullable=False, default=0)
+    price_sum_cents = db.Column(db.BigInteger, nullable=False, default=0)
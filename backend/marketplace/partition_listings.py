@@ -0,0 +1,166 @@
+"""
+Migrate the listings table of an existing database to the hash partitioned table of `Listing`, then check
+which partitions the listing queries read.
+
+The old table is renamed aside, the partitioned table is created, the rows are copied across and the old
+table is dropped, all in one transaction that holds an exclusive lock on listings. Only the columns both
+tables have are copied; columns the old table predates take their defaults. Foreign keys to listings.id
+are replaced by ones on (listing_id, community_id), as the partitioned table has no unique key on id
+alone, so the tables referencing listings get a community_id filled in from their listing. A database
+that is already partitioned is left as is, so the script can be re-run safely.
+
+    python marketplace/partition_listings.py
+    python marketplace/partition_listings.py --check
+"""
+import argparse
+import uuid
+
+from marketplace.extensions import db
+from marketplace.server import create_app
+from marketplace.models import Listing, ListingItem, ListingLodging, ListingReservation, LodgingBooking
+from marketplace.api.feed import community_feed_select
+from marketplace.api.read import listing_details_select, listing_validators_select
+from sqlalchemy import ForeignKeyConstraint, text
+from sqlalchemy.schema import AddConstraint
+
+OLD_TABLE = "listings_unpartitioned"
+# tables referencing listings, each with a foreign key on (listing_id, community_id)
+LISTING_CHILD_TABLES = [
+    ListingItem.__table__, ListingLodging.__table__, LodgingBooking.__table__, ListingReservation.__table__,
+]
+
+
+def is_partitioned(connection, table: str) -> bool:
+    return connection.execute(
+        text("SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(:table))"),
+        {"table": table},
+    ).scalar()
+
+
+def table_columns(connection, table: str) -> set:
+    return set(connection.scalars(
+        text("SELECT column_name FROM information_schema.columns WHERE table_name = :table"), {"table": table}
+    ))
+
+
+def listing_foreign_key(table) -> ForeignKeyConstraint:
+    return next(
+        constraint for constraint in table.constraints
+        if isinstance(constraint, ForeignKeyConstraint) and constraint.referred_table is Listing.__table__
+    )
+
+
+def reference_partitioned_listings(connection) -> list:
+    """
+    Give the tables referencing listings their listing's community_id and a foreign key on both.
+    Rows whose listing doesn't exist would be left without one, so they fail the migration instead.
+    """
+    added = []
+    for table in LISTING_CHILD_TABLES:
+        connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN IF NOT EXISTS community_id uuid"))
+        connection.execute(text(
+            f"UPDATE {table.name} AS child SET community_id = listings.community_id FROM listings "
+            "WHERE listings.id = child.listing_id AND child.community_id IS NULL"
+        ))
+        orphans = connection.execute(text(f"SELECT count(*) FROM {table.name} WHERE community_id IS NULL")).scalar()
+        if orphans:
+            raise ValueError(f"{orphans} rows of {table.name} reference listings that don't exist; delete them first")
+
+        connection.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN community_id SET NOT NULL"))
+        foreign_key = listing_foreign_key(table)
+        connection.execute(AddConstraint(foreign_key))
+        added.append(f"{table.name}.{foreign_key.name}")
+
+    return added
+
+
+def partition_listings(connection) -> dict:
+    """Move listings into the partitioned table. Returns what was done, or None if it was already partitioned."""
+    if is_partitioned(connection, "listings"):
+        return None
+
+    connection.execute(text("LOCK TABLE listings IN ACCESS EXCLUSIVE MODE"))
+    orphans = connection.execute(text("SELECT count(*) FROM listings WHERE community_id IS NULL")).scalar()
+    if orphans:
+        raise ValueError(f"{orphans} listings have no community; assign or delete them before partitioning")
+
+    foreign_keys = connection.execute(text(
+        "SELECT conrelid::regclass::text, conname FROM pg_constraint "
+        "WHERE contype = 'f' AND confrelid = 'listings'::regclass"
+    )).all()
+    for table, constraint in foreign_keys:
+        connection.execute(text(f'ALTER TABLE {table} DROP CONSTRAINT "{constraint}"'))
+
+    # index names are unique per schema, so the old ones move aside with their table
+    connection.execute(text(f"ALTER TABLE listings RENAME TO {OLD_TABLE}"))
+    index_names = connection.scalars(
+        text("SELECT indexname FROM pg_indexes WHERE tablename = :table"), {"table": OLD_TABLE}
+    ).all()
+    for index_name in index_names:
+        connection.execute(text(f'ALTER INDEX "{index_name}" RENAME TO "{index_name[:50]}_unpartitioned"'))
+
+    # creates the partitions and indexes along with the table
+    Listing.__table__.create(connection)
+    old_columns = table_columns(connection, OLD_TABLE)
+    columns = ", ".join(column.name for column in Listing.__table__.columns if column.name in old_columns)
+    copied = connection.execute(text(f"INSERT INTO listings ({columns}) SELECT {columns} FROM {OLD_TABLE}")).rowcount
+    connection.execute(text(f"DROP TABLE {OLD_TABLE}"))
+    connection.execute(text("ANALYZE listings"))
+
+    return {
+        "copied": copied,
+        "dropped_foreign_keys": [f"{table}.{constraint}" for table, constraint in foreign_keys],
+        "added_foreign_keys": reference_partitioned_listings(connection),
+    }
+
+
+def scanned_partitions(connection, statement) -> list:
+    """The listings partitions a statement's plan reads, from EXPLAIN; pruned partitions don't appear."""
+    sql = statement.compile(dialect=connection.dialect, compile_kwargs={"literal_binds": True})
+    plan = connection.execute(text(f"EXPLAIN (FORMAT JSON) {sql}")).scalar()
+
+    partitions = set()
+    nodes = [plan[0]["Plan"]]
+    while nodes:
+        node = nodes.pop()
+        if node.get("Relation Name", "").startswith("listings_p"):
+            partitions.add(node["Relation Name"])
+        nodes.extend(node.get("Plans", []))
+
+    return sorted(partitions)
+
+
+def pruning_report(connection) -> dict:
+    """Partitions read by the listing reads, for a community and listing that needn't exist."""
+    community_id, listing_id = uuid.uuid4(), uuid.uuid4()
+    statements = {
+        "get_listing": listing_details_select().where(Listing.id == listing_id),
+        "get_listing_validators": listing_validators_select(listing_id),
+        "listings_batch": listing_details_select().where(Listing.id.in_([listing_id, uuid.uuid4()])),
+        "community_feed": community_feed_select(community_id, {}).limit(51),
+        "community_feed_by_type": community_feed_select(community_id, {"listing_type": "item"}).limit(51),
+    }
+
+    return {name: len(scanned_partitions(connection, statement)) for name, statement in statements.items()}
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Partition the listings table by community.")
+    arg_parser.add_argument("--check", action="store_true", help="only report the partitions each query reads")
+    args = arg_parser.parse_args()
+
+    with create_app(routes=False).app_context(), db.engine.begin() as connection:
+        if not args.check:
+            migrated = partition_listings(connection)
+            print(f"partitioned listings: {migrated}" if migrated else "listings are already partitioned")
+
+        if is_partitioned(connection, "listings"):
+            partition_count = connection.execute(
+                text("SELECT count(*) FROM pg_inherits WHERE inhparent = 'listings'::regclass")
+            ).scalar()
+            for name, scanned in pruning_report(connection).items():
+                print(f"{name}: reads {scanned} of {partition_count} partitions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+Photo ingestion: uploads are deduplicated by content hash, rendered into thumbnails in a process pool,
+written to the photo store and recorded as `Photo` rows. Items keep a denormalized entry per photo in
+`Item.photos` (see `photo_entry`), so listing pages link straight to thumbnails without another query.
+"""
+import hashlib
+import ipaddress
+import multiprocessing
+import os
+import socket
+import threading
+import urllib.parse
+import urllib.request
+import uuid
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Optional
+from flask import current_app
+from PIL import Image
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from marketplace.extensions import db
+from marketplace.imaging import THUMBNAIL_CONTENT_TYPE, process_photo
+from marketplace.models import Photo
+
+# Pillow format names of the originals we accept, with the content type they are stored under
+ORIGINAL_CONTENT_TYPES = {
+    "JPEG": "image/jpeg",
+    "PNG": "image/png",
+    "WEBP": "image/webp",
+    "GIF": "image/gif",
+}
+# thumbnails and originals are content-addressed and never change, so they can be cached forever
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+
+class InvalidPhoto(ValueError):
+    """An upload that isn't an image we accept."""
+
+
+class PhotoStore(object):
+    """
+    Where original uploads and thumbnails are written. Keys are relative paths, i.e. "ab/<hash>/small.jpg",
+    and `url` gives the address clients fetch them from.
+    """
+
+    def __init__(self, base_url: str):
+        self.base_url = base_url if base_url.endswith("/") else f"{base_url}/"
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        raise NotImplementedError
+
+    def get(self, key: str) -> bytes:
+        raise NotImplementedError
+
+    def url(self, key: str) -> str:
+        return f"{self.base_url}{key}"
+
+    def key_for_url(self, url: str) -> Optional[str]:
+        """The key of one of this store's urls, or None for a url elsewhere."""
+        if url.startswith(self.base_url):
+            return url[len(self.base_url):]
+
+        return None
+
+
+class LocalPhotoStore(PhotoStore):
+    """Files under a local directory, served by the `photo` blueprint. For development and single hosts."""
+
+    def __init__(self, root: str, base_url: str):
+        super().__init__(base_url)
+        self.root = os.path.abspath(root)
+
+    def path(self, key: str) -> str:
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f"photo key escapes the store: {key}")
+
+        return path
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        path = self.path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write then rename, so a concurrent reader never sees a partial file
+        partial_path = f"{path}.{os.getpid()}.{threading.get_ident()}.partial"
+        with open(partial_path, "wb") as partial_file:
+            partial_file.write(data)
+        os.replace(partial_path, path)
+
+    def get(self, key: str) -> bytes:
+        with open(self.path(key), "rb") as photo_file:
+            return photo_file.read()
+
+
+class S3PhotoStore(PhotoStore):
+    """An S3 (or S3-compatible) bucket, written through a boto3 client."""
+
+    def __init__(self, client, bucket: str, base_url: str):
+        super().__init__(base_url)
+        self.client = client
+        self.bucket = bucket
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        self.client.put_object(
+            Bucket=self.bucket, Key=key, Body=data, ContentType=content_type, CacheControl=IMMUTABLE_CACHE_CONTROL
+        )
+
+    def get(self, key: str) -> bytes:
+        return self.client.get_object(Bucket=self.bucket, Key=key)["Body"].read()
+
+
+def create_photo_store(config) -> PhotoStore:
+    if config["PHOTO_STORE"] == "s3":
+        import boto3
+
+        return S3PhotoStore(boto3.client("s3"), config["PHOTO_S3_BUCKET"], config["PHOTO_BASE_URL"])
+
+    return LocalPhotoStore(config["PHOTO_LOCAL_ROOT"], config["PHOTO_BASE_URL"])
+
+
+def photo_store() -> PhotoStore:
+    """The current app's photo store, built from its config on first use."""
+    store = current_app.extensions.get("photo_store")
+    if store is None:
+        store = current_app.extensions["photo_store"] = create_photo_store(current_app.config)
+
+    return store
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def photo_executor() -> Optional[ProcessPoolExecutor]:
+    """
+    The process pool rendering thumbnails, shared by every request in this process, or None when
+    PHOTO_WORKERS is 0. Workers are spawned rather than forked, so they don't inherit the app's
+    threads, locks or database connections.
+    """
+    global _executor
+    workers = current_app.config["PHOTO_WORKERS"]
+    if workers <= 0:
+        return None
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+        return _executor
+
+
+def shutdown_photo_executor() -> None:
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+def render_photos(uploads: list) -> list:
+    """
+    Run `process_photo` over every upload, in parallel when there's a pool, keeping the order.
+    An upload that isn't an image we accept renders as an `InvalidPhoto`.
+    """
+    sizes = current_app.config["PHOTO_THUMBNAIL_SIZES"]
+    quality = current_app.config["PHOTO_THUMBNAIL_QUALITY"]
+    executor = photo_executor()
+
+    # every upload is submitted before waiting on any, so they render side by side
+    futures = [executor.submit(process_photo, data, sizes, quality) for data in uploads] if executor else None
+
+    renders = []
+    for index, data in enumerate(uploads):
+        try:
+            render = futures[index].result() if futures else process_photo(data, sizes, quality)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            render = None
+        if render is None or render["format"] not in ORIGINAL_CONTENT_TYPES:
+            render = InvalidPhoto(f"upload {index} is not a JPEG, PNG, WebP or GIF image")
+        renders.append(render)
+
+    return renders
+
+
+def content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def store_render(store: PhotoStore, digest: str, data: bytes, render: dict) -> Photo:
+    """Write an original and its thumbnails under keys derived from its hash, and build its row."""
+    content_type = ORIGINAL_CONTENT_TYPES[render["format"]]
+    prefix = f"{digest[:2]}/{digest}"
+    original_key = f"{prefix}/original.{content_type.split('/')[1]}"
+    store.put(original_key, data, content_type)
+
+    variants = {}
+    for name, variant in render["variants"].items():
+        key = f"{prefix}/{name}.jpg"
+        store.put(key, variant["data"], THUMBNAIL_CONTENT_TYPE)
+        variants[name] = {
+            "key": key, "width": variant["width"], "height": variant["height"], "size_bytes": len(variant["data"]),
+        }
+
+    return Photo(
+        content_hash=digest,
+        content_type=content_type,
+        width=render["width"],
+        height=render["height"],
+        size_bytes=len(data),
+        blurhash=render["blurhash"],
+        original_key=original_key,
+        variants=variants,
+    )
+
+
+def ingest_photos(uploads: Iterable[bytes], skip_invalid: bool = False) -> list:
+    """
+    Store uploaded images and return their `Photo` rows in upload order, flushed but not committed.
+    Content already stored (by an earlier upload or within this batch) is reused without rendering
+    it again; the new images are rendered in parallel. Raises `InvalidPhoto` if any upload isn't an
+    image, before anything is written, or with `skip_invalid` returns None in its place.
+    """
+    uploads = list(uploads)
+    digests = [content_hash(data) for data in uploads]
+    photos_by_hash = {
+        photo.content_hash: photo
+        for photo in db.session.scalars(select(Photo).where(Photo.content_hash.in_(set(digests))))
+    }
+
+    new_uploads = {digest: data for digest, data in zip(digests, uploads) if digest not in photos_by_hash}
+    renders = render_photos(list(new_uploads.values()))
+    invalid = [render for render in renders if isinstance(render, InvalidPhoto)]
+    if invalid and not skip_invalid:
+        raise invalid[0]
+
+    store = photo_store()
+    for (digest, data), render in zip(new_uploads.items(), renders):
+        if isinstance(render, InvalidPhoto):
+            continue
+
+        photo = store_render(store, digest, data, render)
+        try:
+            # a concurrent upload of the same image may insert it first; its files are identical
+            with db.session.begin_nested():
+                db.session.add(photo)
+        except IntegrityError:
+            photo = db.session.scalars(select(Photo).where(Photo.content_hash == digest)).one()
+        photos_by_hash[digest] = photo
+
+    return [photos_by_hash.get(digest) for digest in digests]
+
+
+def rerender_photo(photo: Photo) -> Photo:
+    """Render a stored photo's thumbnails again from its original, i.e. after the sizes change."""
+    store = photo_store()
+    data = store.get(photo.original_key)
+    render = render_photos([data])[0]
+    if isinstance(render, InvalidPhoto):
+        raise render
+
+    fresh = store_render(store, photo.content_hash, data, render)
+    for column in ("content_type", "width", "height", "size_bytes", "blurhash", "original_key", "variants"):
+        setattr(photo, column, getattr(fresh, column))
+
+    return photo
+
+
+def photo_entry(photo: Photo) -> dict:
+    """What an item keeps in `Item.photos` for a photo: urls and dimensions for the listing page."""
+    store = photo_store()
+
+    return {
+        "photo_id": photo.id.hex,
+        "url": store.url(photo.original_key),
+        "width": photo.width,
+        "height": photo.height,
+        "content_hash": photo.content_hash,
+        "blurhash": photo.blurhash,
+        "thumbnails": {
+            name: {"url": store.url(variant["key"]), "width": variant["width"], "height": variant["height"]}
+            for name, variant in (photo.variants or {}).items()
+        },
+    }
+
+
+# seconds to wait on a remote original when reprocessing photos added before the pipeline
+FETCH_TIMEOUT_SECONDS = 30
+
+
+class FetchRefused(ValueError):
+    """A remote original we won't fetch: not on an allowed host, at a private address or too large."""
+
+
+def check_fetch_url(url: str, allowed_hosts) -> None:
+    """
+    Refuse a url not on one of `allowed_hosts`, or whose host resolves to a private, loopback, link-local
+    or otherwise internal address, so user supplied photo urls can't reach services inside our network.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise FetchRefused(f"not an http(s) url: {url}")
+    if parts.hostname.lower() not in allowed_hosts:
+        raise FetchRefused(f"host isn't in PHOTO_FETCH_HOSTS: {parts.hostname}")
+
+    for *_, address in socket.getaddrinfo(parts.hostname, None, proto=socket.IPPROTO_TCP):
+        ip = ipaddress.ip_address(address[0])
+        if not ip.is_global or ip.is_multicast:
+            raise FetchRefused(f"{parts.hostname} resolves to an internal address: {ip}")
+
+
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    """Follows a redirect only to a url `check_fetch_url` allows."""
+
+    def __init__(self, allowed_hosts):
+        super().__init__()
+        self.allowed_hosts = allowed_hosts
+
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_fetch_url(newurl, self.allowed_hosts)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+def fetch_url(url: str, allowed_hosts, max_bytes: int) -> bytes:
+    """Download a remote original, refusing it (see `check_fetch_url`) or any body over `max_bytes`."""
+    check_fetch_url(url, allowed_hosts)
+    opener = urllib.request.build_opener(CheckedRedirectHandler(allowed_hosts))
+    with opener.open(url, timeout=FETCH_TIMEOUT_SECONDS) as response:
+        if int(response.headers.get("Content-Length") or 0) > max_bytes:
+            raise FetchRefused(f"larger than {max_bytes} bytes: {url}")
+        data = response.read(max_bytes + 1)
+
+    if len(data) > max_bytes:
+        raise FetchRefused(f"larger than {max_bytes} bytes: {url}")
+
+    return data
+
+
+def fetch_original(store: PhotoStore, entry: dict) -> Optional[bytes]:
+    """
+    The original image of an `Item.photos` entry from before the pipeline, by store key or url.
+    Urls outside the store are only fetched from PHOTO_FETCH_HOSTS, see `fetch_url`.
+    """
+    key = entry.get("key") or store.key_for_url(entry.get("url") or "")
+    if key:
+        return store.get(key)
+
+    url = entry.get("url") or ""
+    if url.startswith(("http://", "https://")):
+        allowed_hosts = {host.lower() for host in current_app.config["PHOTO_FETCH_HOSTS"]}
+        return fetch_url(url, allowed_hosts, current_app.config["PHOTO_MAX_BYTES"])
+
+    return None
+
+
+def reprocess_item_photos(items: list, rerender: bool = False) -> Counter:
+    """
+    Bring the photos of a batch of items up to date, keeping any other keys of their entries (i.e. a caption).
+    Entries without a `photo_id` are fetched and ingested, all of the batch's together so they render in
+    parallel. Ingested entries are refreshed from their `Photo` row, which `rerender` renders again first.
+    Returns counts of what happened to the entries.
+    """
+    stats = Counter()
+    store = photo_store()
+    entries = [(item, entry) for item in items for entry in (item.photos or []) if isinstance(entry, dict)]
+    photo_ids = set()
+    for _, entry in entries:
+        try:
+            photo_ids.add(uuid.UUID(entry.get("photo_id")))
+        except (TypeError, ValueError):
+            pass
+    photos_by_id = {photo.id.hex: photo for photo in db.session.scalars(select(Photo).where(Photo.id.in_(photo_ids)))}
+
+    legacy_entries, originals = [], []
+    for item, entry in entries:
+        if entry.get("photo_id") in photos_by_id:
+            continue
+        try:
+            data = fetch_original(store, entry)
+        except FetchRefused:
+            stats["refused"] += 1
+            continue
+        except (OSError, ValueError):
+            data = None
+        if data is None:
+            stats["unreachable"] += 1
+            continue
+        legacy_entries.append(entry)
+        originals.append(data)
+
+    ingested = {}
+    for entry, photo in zip(legacy_entries, ingest_photos(originals, skip_invalid=True)):
+        if photo is None:
+            stats["invalid"] += 1
+        else:
+            ingested[id(entry)] = photo
+            stats["ingested"] += 1
+
+    if rerender:
+        for photo in photos_by_id.values():
+            rerender_photo(photo)
+            stats["rerendered"] += 1
+
+    for item in items:
+        photos = []
+        for entry in item.photos or []:
+            photo = None
+            if isinstance(entry, dict):
+                photo = ingested.get(id(entry)) or photos_by_id.get(entry.get("photo_id"))
+            if photo is None:
+                photos.append(entry)
+                continue
+
+            refreshed = {key: val for key, val in entry.items() if key != "key"}
+            refreshed.update(photo_entry(photo))
+            photos.append(refreshed)
+        # a new list, so the change to the JSON column is detected
+        item.photos = photos
+
+    return stats
@@ -0,0 +1,116 @@
+import logging
+import threading
+import time
+from collections import deque
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+def percentile(sorted_values: list, fraction: float) -> float:
+    if not sorted_values:
+        return 0.0
+
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+class PoolMetrics(object):
+    """
+    How long requests wait to check a connection out of the pool. Waits climbing while
+    `checked_out` sits at the pool's limit means the pool, not the database, is the bottleneck.
+    """
+
+    def __init__(self, slow_checkout_ms: float = 100, window: int = 1024):
+        self.slow_checkout_ms = slow_checkout_ms
+        self.checkouts = 0
+        self.timeouts = 0
+        self.slow_checkouts = 0
+        self.total_wait_ms = 0.0
+        self.max_wait_ms = 0.0
+        self.recent_waits_ms = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record_checkout(self, wait_ms: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+            self.recent_waits_ms.append(wait_ms)
+            if wait_ms >= self.slow_checkout_ms:
+                self.slow_checkouts += 1
+
+    def record_timeout(self) -> None:
+        with self._lock:
+            self.timeouts += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            recent = sorted(self.recent_waits_ms)
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "slow_checkouts": self.slow_checkouts,
+                "avg_wait_ms": round(self.total_wait_ms / self.checkouts, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait_ms, 3),
+                "p50_wait_ms": round(percentile(recent, 0.50), 3),
+                "p95_wait_ms": round(percentile(recent, 0.95), 3),
+                "p99_wait_ms": round(percentile(recent, 0.99), 3),
+            }
+
+
+class TimedQueuePool(QueuePool):
+    """QueuePool that records how long each checkout waited for a connection, and checkout timeouts."""
+    # checkouts waiting at least this long are counted and logged
+    slow_checkout_ms = 100
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.metrics = PoolMetrics(slow_checkout_ms=self.slow_checkout_ms)
+
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+        return pool
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            self.metrics.record_timeout()
+            logger.warning("Connection pool exhausted: %s", self.status())
+            raise
+
+        wait_ms = (time.perf_counter() - started) * 1000
+        self.metrics.record_checkout(wait_ms)
+        if wait_ms >= self.metrics.slow_checkout_ms:
+            logger.warning("Waited %.1fms for a pooled connection: %s", wait_ms, self.status())
+
+        return connection
+
+
+def timed_queue_pool(slow_checkout_ms: float) -> type:
+    """TimedQueuePool with its own slow checkout threshold, to pass as an engine's `poolclass`."""
+    return type("TimedQueuePool", (TimedQueuePool,), {"slow_checkout_ms": slow_checkout_ms})
+
+
+def pool_stats(pool) -> dict:
+    """Current usage of a pool, with checkout wait metrics when it is a TimedQueuePool."""
+    stats = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update({
+            "size": pool.size(),
+            "checked_in": pool.checkedin(),
+            "checked_out": pool.checkedout(),
+            # negative while the pool hasn't yet opened `size` connections
+            "overflow": pool.overflow(),
+            "max_overflow": pool._max_overflow,
+            "timeout": pool.timeout(),
+        })
+
+    metrics = getattr(pool, "metrics", None)
+    if metrics is not None:
+        stats.update(metrics.stats())
+
+    return stats
@@ -0,0 +1,50 @@
+from typing import Optional
+from uuid import UUID
+from sqlalchemy import event, select
+from sqlalchemy.orm import object_session
+from marketplace.extensions import db, listing_cache, profile_cache
+from marketplace.models import CommunityProfile, Listing
+
+
+def load_community_profile(community_id: UUID, user_id: UUID) -> Optional[dict]:
+    row = db.session.execute(
+        select(CommunityProfile.alias)
+        .where(CommunityProfile.community_id == community_id, CommunityProfile.user_id == user_id)
+    ).one_or_none()
+
+    if row is None:
+        return None
+
+    return {"alias": row.alias}
+
+
+def community_profile(community_id: UUID, user_id: UUID) -> Optional[dict]:
+    """A user's profile within a community, or None when they aren't a member. Served from `profile_cache`."""
+    return profile_cache.get(community_id, user_id, lambda: load_community_profile(community_id, user_id))
+
+
+# Cached listing responses carry the seller's alias, so a profile change also invalidates the seller's listings.
+# Both are invalidated only after the change commits, so a concurrent read can't cache the old profile again.
+@event.listens_for(CommunityProfile, "after_insert")
+@event.listens_for(CommunityProfile, "after_update")
+@event.listens_for(CommunityProfile, "after_delete")
+def mark_profile_stale(mapper, connection, target):
+    session_info = object_session(target).info
+    session_info.setdefault("stale_profiles", set()).add((target.community_id, target.user_id))
+    session_info.setdefault("stale_profile_listings", set()).update(connection.scalars(
+        select(Listing.id).where(Listing.community_id == target.community_id, Listing.listed_by_id == target.user_id)
+    ))
+
+
+@event.listens_for(db.session, "after_commit")
+def invalidate_stale_profiles(session):
+    for community_id, user_id in session.info.pop("stale_profiles", ()):
+        profile_cache.invalidate(community_id, user_id)
+    for listing_id in session.info.pop("stale_profile_listings", ()):
+        listing_cache.invalidate(listing_id)
+
+
+@event.listens_for(db.session, "after_rollback")
+def discard_profile_changes(session):
+    session.info.pop("stale_profiles", None)
+    session.info.pop("stale_profile_listings", None)
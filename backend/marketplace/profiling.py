@@ -0,0 +1,163 @@
+"""
+Opt-in query profiling, turned on with QUERY_PROFILING_ENABLED.
+
+Every statement run inside a request is timed through engine events and tallied per request.
+Responses carry the request's query count, database time and slowest statement in a
+`Server-Timing` header, and each request is logged as one JSON record. Statements slower than
+SLOW_QUERY_MS are logged on their own. A statement shape repeated N_PLUS_ONE_THRESHOLD times in one
+request is flagged as a likely N+1, where one set-based statement should have been used.
+
+Queries run while a streamed response body is being sent happen after the header was written,
+so they are logged as slow queries if slow but not counted in the request.
+"""
+import json
+import logging
+import re
+import time
+from collections import Counter
+from flask import Flask, current_app, g, has_app_context, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = re.compile(r"\s+")
+# IN (%(id_1_1)s, %(id_1_2)s, ...) or IN (?, ?, ...) differ only by how many values were bound
+PARAMETER_LIST = re.compile(r"\(\s*(?:%\(\w+\)s|\?|:\w+)(?:\s*,\s*(?:%\(\w+\)s|\?|:\w+))*\s*\)")
+
+
+def statement_shape(statement: str) -> str:
+    """A statement with its whitespace and bound value lists normalized, to group repeats of it."""
+    return PARAMETER_LIST.sub("(?)", WHITESPACE.sub(" ", statement).strip())
+
+
+class QueryProfile(object):
+    """Statements run during one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.query_count = 0
+        self.total_ms = 0.0
+        self.slowest_ms = 0.0
+        self.slowest_statement = None
+        self.shapes = Counter()
+
+    def record(self, statement: str, elapsed_ms: float) -> None:
+        self.query_count += 1
+        self.total_ms += elapsed_ms
+        self.shapes[statement_shape(statement)] += 1
+        if elapsed_ms > self.slowest_ms:
+            self.slowest_ms = elapsed_ms
+            self.slowest_statement = statement
+
+    def repeated_shapes(self, threshold: int) -> list:
+        """(shape, count) of statements repeated at least `threshold` times, most repeated first."""
+        return [(shape, count) for shape, count in self.shapes.most_common() if count >= threshold]
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self, threshold: int) -> str:
+        timings = [
+            f'db;dur={self.total_ms:.2f};desc="{self.query_count} queries"',
+            f"db-slowest;dur={self.slowest_ms:.2f}",
+            f"total;dur={self.elapsed_ms():.2f}",
+        ]
+        repeated = self.repeated_shapes(threshold)
+        if repeated:
+            timings.append(f'n-plus-one;desc="{repeated[0][1]} repeats"')
+
+        return ", ".join(timings)
+
+
+def profiling_enabled() -> bool:
+    return has_app_context() and current_app.config["QUERY_PROFILING_ENABLED"]
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if profiling_enabled():
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info.get("query_started")
+    if not started:
+        return
+
+    elapsed_ms = (time.perf_counter() - started.pop()) * 1000
+
+    if elapsed_ms >= current_app.config["SLOW_QUERY_MS"]:
+        logger.warning(json.dumps({
+            "event": "slow_query",
+            "duration_ms": round(elapsed_ms, 2),
+            "statement": WHITESPACE.sub(" ", statement).strip(),
+            "path": request.path if has_request_context() else None,
+        }))
+
+    profile = g.get("query_profile") if has_request_context() else None
+    if profile is not None:
+        profile.record(statement, elapsed_ms)
+
+
+def handle_error(exception_context):
+    # a failed statement never reaches after_cursor_execute
+    started = exception_context.connection.info.get("query_started") if exception_context.connection else None
+    if started:
+        started.pop()
+
+
+def start_request_profile():
+    if current_app.config["QUERY_PROFILING_ENABLED"]:
+        g.query_profile = QueryProfile()
+
+
+def finish_request_profile(response):
+    profile = g.pop("query_profile", None)
+    if profile is None:
+        return response
+
+    threshold = current_app.config["N_PLUS_ONE_THRESHOLD"]
+    response.headers["Server-Timing"] = profile.server_timing(threshold)
+
+    repeated = profile.repeated_shapes(threshold)
+    for shape, count in repeated:
+        logger.warning(json.dumps({
+            "event": "n_plus_one",
+            "path": request.path,
+            "endpoint": request.endpoint,
+            "repeats": count,
+            "statement": shape,
+        }))
+
+    logger.info(json.dumps({
+        "event": "request_profile",
+        "method": request.method,
+        "path": request.path,
+        "endpoint": request.endpoint,
+        "status": response.status_code,
+        "query_count": profile.query_count,
+        "db_ms": round(profile.total_ms, 2),
+        "slowest_ms": round(profile.slowest_ms, 2),
+        "slowest_statement": WHITESPACE.sub(" ", profile.slowest_statement).strip()
+        if profile.slowest_statement else None,
+        "total_ms": round(profile.elapsed_ms(), 2),
+        "n_plus_one": len(repeated),
+    }))
+
+    return response
+
+
+def initialize_query_profiling(app: Flask) -> None:
+    """
+    Listen on every engine rather than the app's, as Flask-SQLAlchemy creates it lazily.
+    The listeners are registered whether or not profiling is enabled, and check app.config per statement
+    and request. QUERY_PROFILING_ENABLED is read from the environment once, when the app is created, so
+    switching profiling on or off in a deployment takes a restart.
+    """
+    if not event.contains(Engine, "before_cursor_execute", before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", after_cursor_execute)
+        event.listen(Engine, "handle_error", handle_error)
+
+    app.before_request(start_request_profile)
+    app.after_request(finish_request_profile)
@@ -0,0 +1,20 @@
+"""
+Recompute the category closure table from each category's parent, i.e. after categories were
+loaded or moved with SQL rather than through the ORM, which keeps the table current itself.
+
+    python marketplace/rebuild_category_closure.py
+"""
+from marketplace.extensions import db
+from marketplace.server import create_app
+from marketplace.categories import category_tree, rebuild_category_closure
+
+
+def main():
+    with create_app(routes=False).app_context():
+        rebuild_category_closure()
+        db.session.commit()
+        category_tree.invalidate()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,48 @@
+"""
+Recount the community listing stats from the listings and repair any rows that drifted, i.e. after
+listings were written with raw SQL. Each community is repaired in its own short transaction, alongside
+live writes. Run it periodically, or for one community:
+
+    python marketplace/reconcile_stats.py
+    python marketplace/reconcile_stats.py --community-id <community id>
+"""
+import argparse
+import uuid
+from typing import Optional
+
+from sqlalchemy import select
+
+from marketplace.extensions import db
+from marketplace.server import create_app
+from marketplace.models import Community
+from marketplace.stats import reconcile_community_stats
+
+
+def reconcile_all_stats(community_ids: Optional[list] = None) -> dict:
+    """Repair every community's stats, or those of `community_ids`. Returns the drifted rows per community."""
+    if community_ids is None:
+        community_ids = db.session.scalars(select(Community.id).order_by(Community.id)).all()
+
+    repaired = {}
+    for community_id in community_ids:
+        drifted = reconcile_community_stats(community_id)
+        db.session.commit()
+        if drifted:
+            repaired[community_id] = drifted
+
+    return repaired
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Repair drifted community listing stats.")
+    arg_parser.add_argument("--community-id", type=uuid.UUID, action="append", help="defaults to every community")
+    args = arg_parser.parse_args()
+
+    with create_app(routes=False).app_context():
+        repaired = reconcile_all_stats(args.community_id)
+
+    print(f"repaired {sum(repaired.values())} stats rows across {len(repaired)} communities")
+
+
+if __name__ == "__main__":
+    main()
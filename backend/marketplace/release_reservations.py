@@ -0,0 +1,25 @@
+"""
+Expire every listing reservation past its hold and give the stock back. Purchases and new
+reservations already do this for the listing they touch; run this periodically for the rest.
+
+Returning stock bumps the listing's version, so the web workers' conditional reads see it at once. Their
+cached listing responses are their own, and this process can't invalidate them: plain reads show the
+old stock until LISTING_CACHE_TTL runs out.
+
+    python marketplace/release_reservations.py
+"""
+from marketplace.extensions import db
+from marketplace.server import create_app
+from marketplace.inventory import release_expired_reservations
+
+
+def main():
+    with create_app(routes=False).app_context():
+        released = release_expired_reservations()
+        db.session.commit()
+
+    print(f"released {sum(released.values())} units across {len(released)} listings")
+
+
+if __name__ == "__main__":
+    main()
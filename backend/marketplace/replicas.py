@@ -0,0 +1,245 @@
+"""
+Read replica routing, turned on by configuring a "replica" bind (REPLICA_DATABASE_URL).
+
+Each request decides once, before its view runs, which database its reads use:
+ - GET and HEAD requests, and POST views marked with `replica_reads` (i.e. the listings batch), read
+   from the replica while it is reachable and no more than REPLICA_MAX_LAG_SECONDS behind,
+ - every other request uses the primary, and so does any statement that isn't a plain SELECT. Once a
+   replica request runs one, the rest of the request reads from the primary too, to see its own write.
+A client whose request wrote to the primary gets a cookie that pins its reads to the primary for
+READ_YOUR_WRITES_SECONDS, so the listing it just created is there when it reads it back.
+
+The replica's health is checked at most every REPLICA_CHECK_INTERVAL seconds per process, outside of
+any request's transaction. A replica that fails a check or a connection is skipped until it passes one,
+and a read that fails on the replica is run again on the primary rather than failing its request.
+"""
+import logging
+import threading
+import time
+from typing import Callable, Optional
+from flask import Flask, current_app, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc, text
+
+logger = logging.getLogger(__name__)
+
+REPLICA_BIND = "replica"
+# session.info key set while the session's reads go to the replica
+READ_REPLICA = "read_replica"
+PRIMARY_UNTIL_COOKIE = "marketplace_primary_until"
+REPLICA_METHODS = ("GET", "HEAD")
+
+# seconds the replica is behind the primary: 0 when it has replayed everything it received, or when it
+# isn't a standby at all (i.e. a copy of the database standing in for one)
+REPLICA_LAG = """
+SELECT CASE
+    WHEN NOT pg_is_in_recovery() THEN 0
+    WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+    ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+END
+"""
+
+
+def replica_reads(view: Callable) -> Callable:
+    """Mark a view that only reads, but isn't a GET, as safe to serve from the replica."""
+    view.replica_reads = True
+    return view
+
+
+def is_plain_select(clause) -> bool:
+    return getattr(clause, "is_select", False) and getattr(clause, "_for_update_arg", None) is None
+
+
+class RoutingSession(Session):
+    """Session sending plain SELECTs to the replica bind while `READ_REPLICA` is set in its info."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self.info.get(READ_REPLICA):
+            if is_plain_select(clause):
+                return self._db.engines[REPLICA_BIND]
+
+            # a flush, DML, raw SQL or a locking read: it and everything after it goes to the primary
+            self.info[READ_REPLICA] = False
+
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def read_or_retry_on_primary(self, execute: Callable, *args, **kwargs):
+        """Run a statement, and once more on the primary if it was a read the replica failed to answer."""
+        reading_replica = self.info.get(READ_REPLICA)
+        try:
+            return execute(*args, **kwargs)
+        except exc.DBAPIError as error:
+            replica_failed = error.connection_invalidated or isinstance(error, exc.OperationalError)
+            if not (reading_replica and self.info.get(READ_REPLICA) and replica_failed):
+                raise
+
+            # the engine's handle_error listener has marked the replica down for the next requests
+            self.info[READ_REPLICA] = False
+            return execute(*args, **kwargs)
+
+    def execute(self, *args, **kwargs):
+        return self.read_or_retry_on_primary(super().execute, *args, **kwargs)
+
+    def scalar(self, *args, **kwargs):
+        return self.read_or_retry_on_primary(super().scalar, *args, **kwargs)
+
+    def scalars(self, *args, **kwargs):
+        return self.read_or_retry_on_primary(super().scalars, *args, **kwargs)
+
+
+class ReplicaMonitor(object):
+    """Whether the replica is reachable and caught up, as of its last check."""
+
+    def __init__(self, max_lag_seconds: float = 5, check_interval: float = 5):
+        self.max_lag_seconds = max_lag_seconds
+        self.check_interval = check_interval
+        self.healthy = False
+        self.lag_seconds = None
+        self.error = None
+        self.checked_at = None
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def measure_lag(engine) -> float:
+        with engine.connect() as connection:
+            return float(connection.execute(text(REPLICA_LAG)).scalar())
+
+    def check(self, engine) -> bool:
+        try:
+            lag_seconds = self.measure_lag(engine)
+        except exc.SQLAlchemyError as error:
+            self.mark_down(error)
+        else:
+            if lag_seconds > self.max_lag_seconds and self.healthy:
+                logger.warning("Replica is %.1fs behind, reading from the primary", lag_seconds)
+            self.lag_seconds = lag_seconds
+            self.error = None
+            self.healthy = lag_seconds <= self.max_lag_seconds
+        self.checked_at = time.monotonic()
+
+        return self.healthy
+
+    def is_healthy(self, engine) -> bool:
+        """The last check's verdict, checking again first when it is due. Other threads don't wait on a check."""
+        due = self.checked_at is None or time.monotonic() - self.checked_at >= self.check_interval
+        if due and self._lock.acquire(blocking=False):
+            try:
+                self.check(engine)
+            finally:
+                self._lock.release()
+
+        return self.healthy
+
+    def mark_down(self, error: Exception) -> None:
+        if self.healthy or self.checked_at is None:
+            logger.warning("Replica is unavailable, reading from the primary: %s", error)
+        self.healthy = False
+        self.error = str(error).splitlines()[0] if str(error) else type(error).__name__
+        self.failures += 1
+        self.checked_at = time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "lag_seconds": self.lag_seconds,
+            "max_lag_seconds": self.max_lag_seconds,
+            "seconds_since_check": round(time.monotonic() - self.checked_at, 3) if self.checked_at else None,
+            "failures": self.failures,
+            "error": self.error,
+        }
+
+
+class ReplicaRouter(object):
+    """
+    Routes each request's reads to the replica or the primary, see the module docstring.
+    There is one router per process, so the last app created configures it.
+    """
+
+    def __init__(self):
+        self.monitor = ReplicaMonitor()
+        self.read_your_writes_seconds = 5
+        self.enabled = False
+        self.replica_requests = 0
+        self.primary_requests = 0
+        self.pinned_requests = 0
+
+    def init_app(self, app: Flask) -> None:
+        self.monitor = ReplicaMonitor(
+            max_lag_seconds=app.config["REPLICA_MAX_LAG_SECONDS"], check_interval=app.config["REPLICA_CHECK_INTERVAL"]
+        )
+        self.read_your_writes_seconds = app.config["READ_YOUR_WRITES_SECONDS"]
+
+        db = app.extensions["sqlalchemy"]
+        with app.app_context():
+            engine = db.engines.get(REPLICA_BIND)
+        self.enabled = engine is not None
+        if not self.enabled:
+            return
+
+        event.listen(engine, "handle_error", self.replica_error)
+        app.before_request(self.route_request)
+        app.after_request(self.pin_writer)
+        app.teardown_request(self.finish_request)
+
+    def replica_error(self, context) -> None:
+        if context.is_disconnect or isinstance(context.sqlalchemy_exception, exc.OperationalError):
+            self.monitor.mark_down(context.original_exception)
+
+    @staticmethod
+    def reads_only() -> bool:
+        view = current_app.view_functions.get(request.endpoint)
+        return request.method in REPLICA_METHODS or getattr(view, "replica_reads", False)
+
+    def pinned_to_primary(self, cookies) -> bool:
+        """Whether the client sending these cookies wrote recently, so has to read its writes from the primary."""
+        if not self.enabled:
+            return False
+
+        try:
+            primary_until = float(cookies.get(PRIMARY_UNTIL_COOKIE, 0))
+        except ValueError:
+            return False
+
+        return primary_until > time.time()
+
+    @staticmethod
+    def reading_replica() -> bool:
+        """Whether this request's reads still go to the replica."""
+        return bool(current_app.extensions["sqlalchemy"].session.info.get(READ_REPLICA))
+
+    def route_request(self) -> None:
+        if not self.reads_only():
+            return
+
+        if self.pinned_to_primary(request.cookies):
+            self.pinned_requests += 1
+        elif self.monitor.is_healthy(current_app.extensions["sqlalchemy"].engines[REPLICA_BIND]):
+            self.replica_requests += 1
+            current_app.extensions["sqlalchemy"].session.info[READ_REPLICA] = True
+        else:
+            self.primary_requests += 1
+
+    def pin_writer(self, response):
+        if not self.reads_only() and response.status_code < 400:
+            response.set_cookie(
+                PRIMARY_UNTIL_COOKIE, f"{time.time() + self.read_your_writes_seconds:.3f}",
+                max_age=self.read_your_writes_seconds, httponly=True, samesite="Lax",
+            )
+
+        return response
+
+    @staticmethod
+    def finish_request(error: Optional[BaseException] = None) -> None:
+        current_app.extensions["sqlalchemy"].session.info.pop(READ_REPLICA, None)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "replica_requests": self.replica_requests,
+            # read requests sent to the primary because the replica was unhealthy
+            "primary_requests": self.primary_requests,
+            "pinned_requests": self.pinned_requests,
+            "read_your_writes_seconds": self.read_your_writes_seconds,
+            **self.monitor.stats(),
+        }
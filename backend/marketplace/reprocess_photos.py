@@ -0,0 +1,60 @@
+"""
+Run every item's photos through the photo pipeline, a batch of items at a time. Photos added before the
+pipeline (entries with only a `url` or store `key`) are fetched, deduplicated, rendered into thumbnails
+and replaced by full entries; photos already ingested have their entries refreshed. Pass --rerender
+after changing PHOTO_THUMBNAIL_SIZES to render every stored original again.
+
+Updating an item bumps its listing's version (see `touch_listings`), so conditional reads see the new
+photos at once. Listing responses the web workers already cached are their own, and this process can't
+invalidate them: plain reads serve the old photos until LISTING_CACHE_TTL runs out.
+
+    python marketplace/reprocess_photos.py --batch-size 200
+"""
+import argparse
+import json
+from collections import Counter
+from sqlalchemy import select
+from marketplace.extensions import db
+from marketplace.server import create_app
+from marketplace.models import Item
+from marketplace.photos import reprocess_item_photos, shutdown_photo_executor
+
+REPROCESS_BATCH_SIZE = 200
+
+
+def reprocess_all_photos(batch_size: int = REPROCESS_BATCH_SIZE, rerender: bool = False) -> Counter:
+    """Walks items by id, committing after each batch so an interrupted run keeps what it has done."""
+    stats = Counter()
+    last_id = None
+    while True:
+        query = select(Item).order_by(Item.id).limit(batch_size)
+        if last_id is not None:
+            query = query.where(Item.id > last_id)
+        items = db.session.scalars(query).all()
+        if not items:
+            return stats
+
+        last_id = items[-1].id
+        items = [item for item in items if item.photos]
+        stats.update(reprocess_item_photos(items, rerender=rerender))
+        db.session.commit()
+        stats["items"] += len(items)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Run every item's photos through the photo pipeline.")
+    arg_parser.add_argument("--batch-size", type=int, default=REPROCESS_BATCH_SIZE)
+    arg_parser.add_argument("--rerender", action="store_true", help="render thumbnails of ingested photos again")
+    args = arg_parser.parse_args()
+
+    try:
+        with create_app(routes=False).app_context():
+            stats = reprocess_all_photos(args.batch_size, args.rerender)
+    finally:
+        shutdown_photo_executor()
+
+    print(json.dumps(stats))
+
+
+if __name__ == "__main__":
+    main()
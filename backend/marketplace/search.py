@@ -0,0 +1,304 @@
+import math
+import re
+import threading
+from collections import defaultdict
+from typing import Optional
+from uuid import UUID
+from flask import current_app
+from sqlalchemy import cast, event, func, inspect, literal, select, update
+from sqlalchemy.orm import object_session
+from sqlalchemy.dialects.postgresql import REGCONFIG
+from marketplace.extensions import db
+from marketplace.models import Item, Listing, ListingItem, SourceItem
+
+SEARCH_CONFIG = "english"
+
+# ts_rank weights, strongest first: title, then item/source item names, then description
+SEARCH_WEIGHTS = {"A": 1.0, "B": 0.4, "C": 0.1}
+
+
+def use_postgres_search() -> bool:
+    """`SEARCH_BACKEND` is "postgres", "memory", or "auto" to pick by database dialect."""
+    backend = current_app.config["SEARCH_BACKEND"]
+    if backend == "auto":
+        return db.engine.dialect.name == "postgresql"
+
+    return backend == "postgres"
+
+
+def weighted_tsvector(text, weight: str):
+    search_config = cast(literal(SEARCH_CONFIG), REGCONFIG)
+    return func.setweight(func.to_tsvector(search_config, func.coalesce(text, "")), weight)
+
+
+def listing_search_vector(title, desc, item_name=None, source_item_name=None):
+    """SQL expression of a listing's search document, from values or column expressions."""
+    names = func.concat_ws(" ", item_name, source_item_name)
+    return (
+        weighted_tsvector(title, "A")
+        .op("||")(weighted_tsvector(names, "B"))
+        .op("||")(weighted_tsvector(desc, "C"))
+    )
+
+
+def new_listing_search_vector(listing_dict: dict, item_dict: Optional[dict] = None):
+    """
+    Search vector for a listing about to be inserted. The source item's name is read by a scalar
+    subquery inside the same INSERT, so keeping the index current costs no extra round trip.
+    """
+    if not use_postgres_search():
+        return None
+
+    item_dict = item_dict or {}
+    source_item_name = None
+    if item_dict.get("source_item_id") is not None:
+        source_item_name = (
+            select(SourceItem.source_item_name)
+            .where(SourceItem.id == item_dict.get("source_item_id"))
+            .scalar_subquery()
+        )
+
+    return listing_search_vector(
+        listing_dict.get("listing_title"),
+        listing_dict.get("listing_desc"),
+        item_dict.get("item_name"),
+        source_item_name,
+    )
+
+
+def listing_item_names(listing_id) -> tuple:
+    """Scalar subqueries of the item and source item names of a listing, by id or correlated to `Listing.id`."""
+    item_name = (
+        select(Item.item_name)
+        .join(ListingItem, ListingItem.item_id == Item.id)
+        .where(ListingItem.listing_id == listing_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+    source_item_name = (
+        select(SourceItem.source_item_name)
+        .join(Item, Item.source_item_id == SourceItem.id)
+        .join(ListingItem, ListingItem.item_id == Item.id)
+        .where(ListingItem.listing_id == listing_id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+    return item_name, source_item_name
+
+
+def search_vectors_update(listing_ids):
+    """
+    A set-based UPDATE recomputing the search vectors of listings from their rows. The vector isn't part of
+    a listing's response, so its version and updated_on are left alone.
+    """
+    return (
+        update(Listing)
+        .where(Listing.id.in_(listing_ids))
+        .values(
+            search_vector=listing_search_vector(
+                Listing.listing_title, Listing.listing_desc, *listing_item_names(Listing.id)
+            ),
+            version=Listing.version,
+            updated_on=Listing.updated_on,
+        )
+    )
+
+
+def refresh_search_vectors(listing_ids: list) -> None:
+    """Recompute the search vectors of many listings with a single set-based UPDATE."""
+    db.session.execute(search_vectors_update(listing_ids))
+
+
+def any_changed(target, attributes) -> bool:
+    state = inspect(target)
+    return any(state.attrs[attribute].history.has_changes() for attribute in attributes)
+
+
+def mark_search_stale(target) -> None:
+    """Reload the fallback index once the session writing `target` commits."""
+    object_session(target).info["search_stale"] = True
+
+
+# ORM writes to the searched text keep the vectors current in the same flush. Writes that bypass the ORM,
+# like the bulk import, call `refresh_search_vectors` themselves.
+@event.listens_for(Listing, "before_update")
+def update_listing_search_vector(mapper, connection, target):
+    if not any_changed(target, ("listing_title", "listing_desc")):
+        return
+
+    mark_search_stale(target)
+    if use_postgres_search():
+        # computed within the listing's own UPDATE, from its new title and description
+        target.search_vector = listing_search_vector(
+            target.listing_title, target.listing_desc, *listing_item_names(target.id)
+        )
+
+
+@event.listens_for(Item, "after_update")
+def update_item_search_vectors(mapper, connection, target):
+    if not any_changed(target, ("item_name", "source_item_id")):
+        return
+
+    mark_search_stale(target)
+    if use_postgres_search():
+        connection.execute(
+            search_vectors_update(select(ListingItem.listing_id).where(ListingItem.item_id == target.id))
+        )
+
+
+@event.listens_for(SourceItem, "after_update")
+def update_source_item_search_vectors(mapper, connection, target):
+    if not any_changed(target, ("source_item_name",)):
+        return
+
+    mark_search_stale(target)
+    if use_postgres_search():
+        connection.execute(search_vectors_update(
+            select(ListingItem.listing_id).join(Item, Item.id == ListingItem.item_id)
+            .where(Item.source_item_id == target.id)
+        ))
+
+
+@event.listens_for(db.session, "after_commit")
+def reload_stale_search_index(session):
+    if session.info.pop("search_stale", False):
+        search_index.reset()
+
+
+@event.listens_for(db.session, "after_rollback")
+def discard_search_changes(session):
+    session.info.pop("search_stale", None)
+
+
+def search_rank_and_match(query: str):
+    """ts_rank expression and the `@@` match predicate of a web-style search query."""
+    tsquery = func.websearch_to_tsquery(cast(literal(SEARCH_CONFIG), REGCONFIG), query)
+    return func.ts_rank(Listing.search_vector, tsquery), Listing.search_vector.op("@@")(tsquery)
+
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOP_WORDS = frozenset(["a", "an", "and", "are", "for", "in", "is", "of", "on", "or", "the", "to", "with"])
+
+
+def tokenize(text: Optional[str]) -> list:
+    if not text:
+        return []
+
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOP_WORDS]
+
+
+class InvertedIndex(object):
+    """
+    Pure-Python fallback for databases without PostgreSQL full-text search.
+    Documents are weighted like the tsvector; a listing matches when it contains every query term,
+    and is ranked by the weighted term frequency times inverse document frequency.
+    Listings created by other processes aren't seen until the index is reloaded, so it is meant for
+    tests and single-process use.
+    """
+
+    def __init__(self):
+        self.postings = defaultdict(dict)
+        self.communities = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.communities)
+
+    def add(self, listing_id: UUID, community_id: UUID, title, desc, item_name=None, source_item_name=None):
+        weighted_fields = [
+            (title, SEARCH_WEIGHTS["A"]),
+            (item_name, SEARCH_WEIGHTS["B"]),
+            (source_item_name, SEARCH_WEIGHTS["B"]),
+            (desc, SEARCH_WEIGHTS["C"]),
+        ]
+        term_weights = defaultdict(float)
+        for text, weight in weighted_fields:
+            for token in tokenize(text):
+                term_weights[token] += weight
+
+        with self._lock:
+            self.communities[listing_id] = community_id
+            for token, weight in term_weights.items():
+                self.postings[token][listing_id] = weight
+
+    def search(self, query: str, community_id: Optional[UUID] = None) -> list:
+        """(listing id, score) pairs, best match first."""
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            term_postings = [self.postings.get(term, {}) for term in terms]
+            matches = set.intersection(*(set(postings) for postings in term_postings))
+            if community_id is not None:
+                matches = {listing_id for listing_id in matches if self.communities[listing_id] == community_id}
+
+            document_count = len(self.communities)
+            scores = {
+                listing_id: sum(
+                    postings[listing_id] * math.log(1 + document_count / len(postings))
+                    for postings in term_postings
+                )
+                for listing_id in matches
+            }
+
+        return sorted(scores.items(), key=lambda score: (-score[1], str(score[0])))
+
+
+class SearchIndexHolder(object):
+    """Lazily loads the fallback index from the database the first time it is searched."""
+
+    def __init__(self):
+        self.index = None
+        self._lock = threading.Lock()
+
+    def get(self) -> InvertedIndex:
+        with self._lock:
+            if self.index is None:
+                index = InvertedIndex()
+                rows = db.session.execute(
+                    select(
+                        Listing.id,
+                        Listing.community_id,
+                        Listing.listing_title,
+                        Listing.listing_desc,
+                        Item.item_name,
+                        SourceItem.source_item_name,
+                    )
+                    .outerjoin(ListingItem, ListingItem.listing_id == Listing.id)
+                    .outerjoin(Item, Item.id == ListingItem.item_id)
+                    .outerjoin(SourceItem, SourceItem.id == Item.source_item_id)
+                )
+                for row in rows:
+                    index.add(*row)
+                self.index = index
+
+            return self.index
+
+    def add_listing(self, listing: Listing, item=None) -> None:
+        """Keep an already loaded index current; an unloaded one will pick the listing up when it loads."""
+        if self.index is None:
+            return
+
+        source_item_name = None
+        if item is not None and item.source_item_id is not None:
+            source_item_name = db.session.scalar(
+                select(SourceItem.source_item_name).where(SourceItem.id == item.source_item_id)
+            )
+
+        self.index.add(
+            listing.id,
+            listing.community_id,
+            listing.listing_title,
+            listing.listing_desc,
+            item.item_name if item is not None else None,
+            source_item_name,
+        )
+
+    def reset(self) -> None:
+        with self._lock:
+            self.index = None
+
+
+search_index = SearchIndexHolder()
@@ -1,24 +1,56 @@
 import logging
+import os
+from typing import Optional
 from flask import Flask, jsonify
-from flask_sqlalchemy import SQLAlchemy
+from werkzeug.routing import UUIDConverter
+from marketplace.extensions import db, listing_cache, profile_cache, replica_router
+from marketplace.geo import zipcode_directory
+from marketplace.api.utils import MarketplaceJSONProvider
+from marketplace.profiling import initialize_query_profiling
 
 logging.basicConfig(level=logging.DEBUG)
 logging.getLogger("faker").setLevel(logging.ERROR)
 
 
 # Configure db access for the Flask application using Flask-SQLAlchemy
-def initialize_db_client(app: Flask) -> SQLAlchemy:
-    db = SQLAlchemy(app)
-    return db
+def initialize_db_client(app: Flask) -> None:
+    # the models have to be imported for their tables to be known to the metadata, and the modules keeping
+    # data derived from them current for their ORM event listeners to be registered
+    import marketplace.models  # noqa 401
+    import marketplace.categories, marketplace.profiles, marketplace.search, marketplace.stats  # noqa 401
+
+    db.init_app(app)
+
+
+def initialize_replica_routing(app: Flask) -> None:
+    replica_router.init_app(app)
+
+
+def initialize_listing_cache(app: Flask) -> None:
+    listing_cache.init_app(app)
+
+
+def initialize_profile_cache(app: Flask) -> None:
+    profile_cache.init_app(app)
+
+
+def initialize_zipcode_directory(app: Flask) -> None:
+    zipcode_directory.init_app(app)
 
 
 def initialize_routes(app: Flask) -> None:
-    import marketplace.api.listing  # noqa 401
+    """Route modules are only imported here, so tools that don't serve requests never load them."""
+    from marketplace.api import bulk, category, export, feed, listing, lodging, photo, purchase, stats, status
+
+    for module in [listing, feed, bulk, export, category, lodging, purchase, photo, stats, status]:
+        app.register_blueprint(module.blueprint)
 
 
 def initialize_error_handlers(app: Flask) -> None:
     # # Return validation errors as JSON
     @app.errorhandler(422)
+    @app.errorhandler(415)
+    @app.errorhandler(409)
     @app.errorhandler(400)
     def handle_422_error(err):
         data = getattr(err, "data", None)
@@ -43,16 +75,41 @@ def initialize_error_handlers(app: Flask) -> None:
         )
 
 
-def init_flask_app() -> Flask:
+class HexUUIDConverter(UUIDConverter):
+    """Accepts UUIDs with or without hyphens, as the API serializes them in their hex form."""
+    regex = (
+        r"[A-Fa-f0-9]{8}-?[A-Fa-f0-9]{4}-?"
+        r"[A-Fa-f0-9]{4}-?[A-Fa-f0-9]{4}-?[A-Fa-f0-9]{12}"
+    )
+
+
+def init_flask_app(config_name: Optional[str] = None, config: Optional[dict] = None) -> Flask:
     app = Flask(__name__)
-    app.config.from_object("marketplace.config.Configuration")
+    app.url_map.converters["uuid"] = HexUUIDConverter
+    app.json = MarketplaceJSONProvider(app)
+    config_name = config_name or os.environ.get("MARKETPLACE_CONFIG", "Configuration")
+    app.config.from_object(f"marketplace.config.{config_name}")
+    app.config.update(config or {})
     app.logger.info("Service Startup: Finished configuring application")
 
     return app
 
 
-app: Flask = init_flask_app()
-db: SQLAlchemy = initialize_db_client(app)
+def create_app(config_name: Optional[str] = None, config: Optional[dict] = None, routes: bool = True) -> Flask:
+    """
+    Build and configure an app. The configuration class is `config_name`, or MARKETPLACE_CONFIG from the
+    environment, with `config` applied over it, i.e. `create_app(config={"SQLALCHEMY_DATABASE_URI": "sqlite://"})`
+    for a throwaway database. CLI tools that only need the database pass `routes=False`.
+    """
+    app = init_flask_app(config_name, config)
+    initialize_db_client(app)
+    initialize_replica_routing(app)
+    initialize_listing_cache(app)
+    initialize_profile_cache(app)
+    initialize_zipcode_directory(app)
+    initialize_query_profiling(app)
+    initialize_error_handlers(app)
+    if routes:
+        initialize_routes(app)
 
-initialize_error_handlers(app)
-initialize_routes(app)
+    return app
@@ -0,0 +1,224 @@
+"""
+Per-community listing stats, maintained incrementally in `CommunityListingStats`.
+
+Every write that adds a listing or moves it between stats rows (a new status, type, sale type or price)
+applies a +1/-1 delta to those rows with an upsert, on the same connection and in the same transaction
+as the write, so the stats commit or roll back with it:
+ - ORM writes, i.e. `create_listing`, through the mapper events below,
+ - bulk imports and the stock updates of `marketplace/inventory.py`, which call `apply_stats_deltas`.
+Writes outside of these (raw SQL, manual fixes) make the stats drift, which `reconcile_community_stats`
+repairs from the listings themselves; run marketplace/reconcile_stats.py periodically.
+"""
+from bisect import bisect_right
+from collections import Counter
+from typing import Iterable, Optional
+from uuid import UUID
+from sqlalchemy import case, delete, event, func, inspect, literal, select, union_all
+from sqlalchemy.dialects import postgresql, sqlite
+from marketplace.extensions import db
+from marketplace.models import CommunityListingStats, Listing
+
+# lower bounds of the price buckets, in cents; the last bucket is open ended
+PRICE_BUCKET_CENTS = [0, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000]
+UNPRICED_BUCKET = -1
+
+KEY_COLUMNS = ("community_id", "status", "listing_type", "sale_type", "price_bucket")
+# the listing attributes that decide which stats row a listing counts in
+KEY_ATTRIBUTES = ("community_id", "status", "listing_type", "sale_type", "listing_price_cents")
+
+UPSERT_DIALECTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def price_bucket(price_cents: Optional[int]) -> int:
+    if price_cents is None or price_cents < 0:
+        return UNPRICED_BUCKET
+
+    return bisect_right(PRICE_BUCKET_CENTS, price_cents) - 1
+
+
+def price_bucket_expression(price_cents):
+    """`price_bucket` in SQL, to group listings by bucket."""
+    return case(
+        *[(price_cents >= bound, index) for index, bound in reversed(list(enumerate(PRICE_BUCKET_CENTS)))],
+        else_=UNPRICED_BUCKET,
+    )
+
+
+def stats_key(community_id, status, listing_type, sale_type, price_cents) -> tuple:
+    return community_id, status, listing_type, sale_type, price_bucket(price_cents)
+
+
+def listing_deltas(listings: Iterable[dict], sign: int = 1) -> Counter:
+    """Deltas of adding (or with `sign` -1, removing) listings, given as dicts of at least KEY_ATTRIBUTES."""
+    deltas = Counter()
+    for listing in listings:
+        key = stats_key(*(listing.get(attribute) for attribute in KEY_ATTRIBUTES))
+        count, price_sum = deltas.get(key, (0, 0))
+        deltas[key] = (count + sign, price_sum + sign * (listing.get("listing_price_cents") or 0))
+
+    return deltas
+
+
+def merge_deltas(*deltas_list: dict) -> dict:
+    merged = {}
+    for deltas in deltas_list:
+        for key, (count, price_sum) in deltas.items():
+            merged_count, merged_price_sum = merged.get(key, (0, 0))
+            merged[key] = (merged_count + count, merged_price_sum + price_sum)
+
+    return merged
+
+
+def status_change_deltas(listing, old_status: str, new_status: str) -> dict:
+    """Deltas of a listing row (with KEY_ATTRIBUTES columns) moving from one status to another."""
+    listing = dict(listing._mapping) if hasattr(listing, "_mapping") else dict(listing)
+
+    return merge_deltas(
+        listing_deltas([{**listing, "status": old_status}], sign=-1),
+        listing_deltas([{**listing, "status": new_status}]),
+    )
+
+
+def apply_stats_deltas(connection, deltas: dict) -> None:
+    """
+    Add deltas of (listing count, price sum) to their stats rows with one upsert. Rows are written in key
+    order, so transactions touching the same rows lock them in the same order and can't deadlock.
+    """
+    rows = [
+        {**dict(zip(KEY_COLUMNS, key)), "listing_count": count, "price_sum_cents": price_sum}
+        for key, (count, price_sum) in sorted(deltas.items(), key=lambda key_delta: [str(v) for v in key_delta[0]])
+        if count or price_sum
+    ]
+    if not rows:
+        return
+
+    upsert = UPSERT_DIALECTS[connection.dialect.name](CommunityListingStats).values(rows)
+    connection.execute(upsert.on_conflict_do_update(
+        index_elements=list(KEY_COLUMNS),
+        set_={
+            "listing_count": CommunityListingStats.listing_count + upsert.excluded.listing_count,
+            "price_sum_cents": CommunityListingStats.price_sum_cents + upsert.excluded.price_sum_cents,
+        },
+    ))
+
+
+def attribute_values(target, current: bool) -> dict:
+    """A listing's KEY_ATTRIBUTES as they are now, or as they were before this flush."""
+    state = inspect(target)
+    values = {}
+    for attribute in KEY_ATTRIBUTES:
+        history = state.attrs[attribute].history
+        values[attribute] = getattr(target, attribute) if current or not history.deleted else history.deleted[0]
+
+    return values
+
+
+@event.listens_for(Listing, "after_insert")
+def count_new_listing(mapper, connection, target):
+    apply_stats_deltas(connection, listing_deltas([attribute_values(target, current=True)]))
+
+
+@event.listens_for(Listing, "after_update")
+def recount_changed_listing(mapper, connection, target):
+    state = inspect(target)
+    if not any(state.attrs[attribute].history.has_changes() for attribute in KEY_ATTRIBUTES):
+        return
+
+    apply_stats_deltas(connection, merge_deltas(
+        listing_deltas([attribute_values(target, current=False)], sign=-1),
+        listing_deltas([attribute_values(target, current=True)]),
+    ))
+
+
+@event.listens_for(Listing, "after_delete")
+def uncount_deleted_listing(mapper, connection, target):
+    apply_stats_deltas(connection, listing_deltas([attribute_values(target, current=False)], sign=-1))
+
+
+def stats_drift_select(community_id: UUID):
+    """
+    Per stats row, the listings' actual (count, price sum) minus the stored one, where they differ.
+    Both are read by one statement, so a write committing concurrently is either wholly in the result or
+    wholly out of it, and applying the differences as deltas doesn't undo it.
+    """
+    bucket = price_bucket_expression(Listing.listing_price_cents)
+    actual = (
+        select(
+            Listing.community_id, Listing.status, Listing.listing_type, Listing.sale_type,
+            bucket.label("price_bucket"),
+            func.count().label("listing_count"),
+            func.coalesce(func.sum(Listing.listing_price_cents), 0).label("price_sum_cents"),
+        )
+        .where(Listing.community_id == community_id)
+        .group_by(Listing.community_id, Listing.status, Listing.listing_type, Listing.sale_type, bucket)
+    )
+    stored = select(
+        CommunityListingStats.community_id, CommunityListingStats.status, CommunityListingStats.listing_type,
+        CommunityListingStats.sale_type, CommunityListingStats.price_bucket,
+        (literal(0) - CommunityListingStats.listing_count).label("listing_count"),
+        (literal(0) - CommunityListingStats.price_sum_cents).label("price_sum_cents"),
+    ).where(CommunityListingStats.community_id == community_id)
+
+    both = union_all(actual, stored).subquery()
+    key = [both.c[column] for column in KEY_COLUMNS]
+
+    return (
+        select(*key, func.sum(both.c.listing_count), func.sum(both.c.price_sum_cents))
+        .group_by(*key)
+        .having((func.sum(both.c.listing_count) != 0) | (func.sum(both.c.price_sum_cents) != 0))
+    )
+
+
+def reconcile_community_stats(community_id: UUID) -> int:
+    """Repair a community's stats rows from its listings. Returns how many rows had drifted; the caller commits."""
+    drift = {tuple(row[:5]): (row[5], row[6]) for row in db.session.execute(stats_drift_select(community_id))}
+    apply_stats_deltas(db.session.connection(), drift)
+    db.session.execute(delete(CommunityListingStats).where(
+        CommunityListingStats.community_id == community_id,
+        CommunityListingStats.listing_count == 0,
+        CommunityListingStats.price_sum_cents == 0,
+    ))
+
+    return len(drift)
+
+
+def community_stats(community_id: UUID, status: Optional[str] = None) -> dict:
+    """
+    Listing counts by status, listing type and sale type, and the price distribution of a community,
+    optionally only of listings in one status. Reads the community's stats rows, whose number is bounded by
+    the kinds of listings rather than how many there are.
+    """
+    query = select(CommunityListingStats).where(CommunityListingStats.community_id == community_id)
+    if status is not None:
+        query = query.where(CommunityListingStats.status == status)
+
+    by_status, by_listing_type, by_sale_type, by_bucket = Counter(), Counter(), Counter(), Counter()
+    priced_count = price_sum_cents = 0
+    for row in db.session.scalars(query):
+        by_status[row.status] += row.listing_count
+        by_listing_type[row.listing_type] += row.listing_count
+        by_sale_type[row.sale_type] += row.listing_count
+        if row.price_bucket != UNPRICED_BUCKET:
+            by_bucket[row.price_bucket] += row.listing_count
+            priced_count += row.listing_count
+            price_sum_cents += row.price_sum_cents
+
+    return {
+        "community_id": community_id,
+        "listing_count": sum(by_status.values()),
+        "by_status": {key: count for key, count in sorted(by_status.items()) if count},
+        "by_listing_type": {key: count for key, count in sorted(by_listing_type.items()) if count},
+        "by_sale_type": {key: count for key, count in sorted(by_sale_type.items()) if count},
+        "price": {
+            "priced_count": priced_count,
+            "mean_cents": round(price_sum_cents / priced_count) if priced_count else None,
+            "buckets": [
+                {
+                    "min_cents": bound,
+                    "max_cents": PRICE_BUCKET_CENTS[index + 1] - 1 if index + 1 < len(PRICE_BUCKET_CENTS) else None,
+                    "count": by_bucket[index],
+                }
+                for index, bound in enumerate(PRICE_BUCKET_CENTS)
+            ],
+        },
+    }
@@ -1,25 +1,154 @@
 import pytest
-from marketplace.server import app, db
-from marketplace.models import Community, User, Listing, SourceItem, ListingItem, Item, ListingLodging, Lodging
+from flask.ctx import AppContext
+from flask import Flask
+from marketplace.extensions import db, listing_cache, profile_cache
+from marketplace.server import create_app
+from marketplace.geo import zipcode_directory
+from marketplace.load_zipcodes import load_zipcodes
+from marketplace.search import search_index
+from marketplace.models import (
+    Community, CommunityProfile, User, Listing, SourceItem, ListingItem, Item, ListingLodging, Lodging,
+    Category, CategoryClosure, LodgingBooking, ListingReservation, Photo, CommunityListingStats,
+)
+
+
+@pytest.fixture(scope="session")
+def app():
+    """One app for the whole run. Set DATABASE_URL to run against a scratch Postgres database."""
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        load_zipcodes(zipcode_directory.index)
+        db.session.commit()
+
+    yield app
 
 
 @pytest.fixture
-def client():
+def client(app: Flask):
     client = app.test_client()
 
     yield client
 
 
 @pytest.fixture
-def test_context():
+def test_context(app: Flask):
     app_context = app.app_context()
 
     yield app_context
 
 
-def pytest_runtest_teardown():
+@pytest.fixture
+def seed_community(test_context: AppContext):
+    with test_context:
+        community = Community(name="Sneaker Gang", uri="sneakergang")
+        db.session.add(community)
+        db.session.commit()
+        db.session.refresh(community)
+
+        yield community
+
+
+@pytest.fixture
+def seed_user(test_context: AppContext):
+    with test_context:
+        user = User(email="a@a.com", first_name="Bob", last_name="Brown")
+        db.session.add(user)
+        db.session.commit()
+        db.session.refresh(user)
+
+        yield user
+
+
+@pytest.fixture
+def seed_profile(test_context: AppContext, seed_community: Community, seed_user: User):
+    with test_context:
+        profile = CommunityProfile(community_id=seed_community.id, user_id=seed_user.id, alias="bobby")
+        db.session.add(profile)
+        db.session.commit()
+        db.session.refresh(profile)
+
+        yield profile
+
+
+@pytest.fixture
+def seed_source_item(test_context: AppContext):
+    with test_context:
+        source_item = SourceItem(source_item_name="Keds", source_item_details='{"color": "red"}')
+        db.session.add(source_item)
+        db.session.commit()
+        db.session.refresh(source_item)
+
+        yield source_item
+
+
+def post_listing(client, json_args: dict) -> str:
+    create_response = client.post("/marketplace/api/listing/create", json=json_args)
+    assert create_response.status_code == 200
+
+    return create_response.json["listing"]["id"]
+
+
+@pytest.fixture
+def create_listing():
+    """Creates an active item listing through the API, `overrides` replacing any of its fields. Returns its id."""
+    def create(client, community: Community, user: User, **overrides) -> str:
+        return post_listing(client, {
+            "community_id": community.id,
+            "listed_by_id": user.id,
+            "status": "active",
+            "listing_type": "item",
+            "sale_type": "sell",
+            "listing_price_cents": 1000,
+            "listing_title": "Sneaker",
+            "available_count": 1,
+            "item_name": "Sneaker",
+            "condition": "new",
+            "shipping_zipcode": "94115",
+            **overrides,
+        })
+
+    return create
+
+
+@pytest.fixture
+def create_lodging_listing():
+    """Creates an active hotel listing through the API, like `create_listing`."""
+    def create(client, community: Community, user: User, **overrides) -> str:
+        return post_listing(client, {
+            "community_id": community.id,
+            "listed_by_id": user.id,
+            "status": "active",
+            "listing_type": "lodging",
+            "sale_type": "book",
+            "listing_price_cents": 20099,
+            "listing_title": "Hotel Room",
+            "available_count": 1,
+            "lodging_name": "Hilton",
+            "address": "1 Main St",
+            "start_date": "2024-01-01",
+            "end_date": "2024-02-01",
+            "lodging_type": "hotel",
+            **overrides,
+        })
+
+    return create
+
+
+@pytest.fixture(autouse=True)
+def clean_database(app: Flask):
+    """Requested first so it is torn down last, after the seed fixtures have left their app contexts."""
+    yield
+
+    listing_cache.clear()
+    profile_cache.clear()
+    search_index.reset()
+
     with app.app_context():
-        model_class_list = [ListingItem, Item, ListingLodging, Lodging, SourceItem, Listing, User, Community]
+        model_class_list = [
+            LodgingBooking, ListingReservation, ListingItem, Item, ListingLodging, Lodging, SourceItem, Listing, CommunityProfile, User, CommunityListingStats, Community,
+            CategoryClosure, Category, Photo,
+        ]
 
         for model in model_class_list:
             db.session.query(model).delete()
@@ -0,0 +1,101 @@
+from marketplace.extensions import db
+from marketplace.models import Community, CommunityProfile, Item, Listing, ListingItem, ListingLodging, User
+
+
+def test_import_listings_reports_row_errors(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    base_row = {
+        "community_id": seed_community.id.hex,
+        "listed_by_id": seed_user.id.hex,
+        "status": "active",
+        "sale_type": "sell",
+        "listing_price_cents": 1000,
+        "available_count": 1,
+    }
+    rows = [
+        {
+            **base_row,
+            "listing_type": "item",
+            "listing_title": "Sneaker",
+            "item_name": "Sneaker",
+            "condition": "new",
+            "shipping_zipcode": "94115",
+            "photos": [{"url": "a.jpg"}],
+        },
+        {**base_row, "listing_type": "item", "listing_title": "Missing item fields"},
+        {
+            **base_row,
+            "listing_type": "lodging",
+            "sale_type": "book",
+            "listing_title": "Cabin",
+            "lodging_name": "Cabin",
+            "address": "1 Lake Rd",
+            "start_date": "2024-01-01",
+            "end_date": "2024-01-08",
+            "lodging_type": "airbnb",
+        },
+        {**base_row, "community_id": "00000000000000000000000000000000", "listing_type": "empty", "listing_title": "x"},
+    ]
+    with test_context:
+        import_response = client.post("/marketplace/api/listing/import", json=rows)
+
+        assert import_response.status_code == 200
+        assert import_response.json["imported"] == 2
+        errors = import_response.json["errors"]
+        assert [error["row"] for error in errors] == [2, 4]
+        assert set(errors[0]["errors"]) == {"item_name", "condition", "shipping_zipcode"}
+
+        assert db.session.query(Listing).count() == 2
+        assert db.session.query(ListingItem).count() == 1
+        assert db.session.query(ListingLodging).count() == 1
+        assert db.session.query(Item).one().photos == [{"url": "a.jpg"}]
+
+        search_response = client.get(
+            f"/marketplace/api/community/{seed_community.id}/listings/search", query_string={"q": "sneaker"}
+        )
+        assert [listing["listing"]["listing_title"] for listing in search_response.json["listings"]] == ["Sneaker"]
+
+
+def test_import_listings_csv(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    csv_body = (
+        "community_id,listed_by_id,status,listing_type,sale_type,listing_price_cents,listing_title,"
+        "available_count,item_name,condition,shipping_zipcode,item_details\n"
+        f"{seed_community.id},{seed_user.id},active,item,sell,500,Sneaker,1,Sneaker,good,94115,\"{{\"\"size\"\": 9}}\"\n"
+        f"{seed_community.id},{seed_user.id},draft,empty,free,0,Free stuff,3,,,,\n"
+    )
+    with test_context:
+        import_response = client.post(
+            "/marketplace/api/listing/import", data=csv_body, content_type="text/csv"
+        )
+
+        assert import_response.status_code == 200
+        assert import_response.json == {"imported": 2, "errors": []}
+        assert db.session.query(Item).one().item_details == {"size": 9}
+        assert db.session.query(Listing).filter(Listing.status == "active").one().listed_on is not None
+
+
+def test_import_listings_unsupported_format(test_context, client):
+    with test_context:
+        import_response = client.post("/marketplace/api/listing/import", data="x", content_type="text/plain")
+
+        assert import_response.status_code == 415
+
+
+def test_import_listings_jsonl_malformed_line(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    row = (
+        f'{{"community_id": "{seed_community.id}", "listed_by_id": "{seed_user.id}", "status": "draft", '
+        '"listing_type": "empty", "sale_type": "free", "listing_price_cents": 0, "listing_title": "x", '
+        '"available_count": 1}'
+    )
+    with test_context:
+        import_response = client.post(
+            "/marketplace/api/listing/import", data=f"{row}\n{{oops\n{row}\n", content_type="application/x-ndjson"
+        )
+
+        assert import_response.json["imported"] == 2
+        assert [error["row"] for error in import_response.json["errors"]] == [2]
@@ -0,0 +1,134 @@
+from uuid import UUID
+import pytest
+from sqlalchemy import select
+from marketplace.extensions import db
+from marketplace.models import Category, CategoryClosure, Community, CommunityProfile, SourceItem, User
+from marketplace.categories import rebuild_category_closure
+
+
+def create_category_path(client, names: list) -> list:
+    category_ids = []
+    for name in names:
+        parent = {"parent_id": category_ids[-1]} if category_ids else {}
+        create_response = client.post("/marketplace/api/category/create", json={"name": name, **parent})
+        assert create_response.status_code == 200
+        category_ids.append(create_response.json["category"]["id"])
+
+    return category_ids
+
+
+def test_category_tree_lookups(test_context, client):
+    with test_context:
+        brands_id, nike_id, jordan_id, retro_id = create_category_path(
+            client, ["Sneaker brands", "Nike", "Air Jordan", "Retro 4"]
+        )
+        (adidas_id,) = create_category_path(client, ["Adidas"])
+
+        breadcrumbs_response = client.get(f"/marketplace/api/category/{retro_id}/breadcrumbs")
+        assert [crumb["name"] for crumb in breadcrumbs_response.json["breadcrumbs"]] == [
+            "Sneaker brands", "Nike", "Air Jordan", "Retro 4",
+        ]
+
+        ancestors_response = client.get(f"/marketplace/api/category/{jordan_id}/ancestors")
+        assert [ancestor["id"] for ancestor in ancestors_response.json["ancestors"]] == [nike_id, brands_id]
+
+        descendants_response = client.get(f"/marketplace/api/category/{nike_id}/descendants")
+        assert [descendant["id"] for descendant in descendants_response.json["descendants"]] == [jordan_id, retro_id]
+
+        assert client.get(f"/marketplace/api/category/{adidas_id}/ancestors").json["ancestors"] == []
+
+
+def test_category_closure_matches_rebuild(test_context, client):
+    with test_context:
+        create_category_path(client, ["Sneaker brands", "Nike", "Air Jordan", "Retro 4"])
+        closure_query = select(CategoryClosure.ancestor_id, CategoryClosure.descendant_id, CategoryClosure.depth)
+
+        incremental = set(db.session.execute(closure_query).all())
+        rebuild_category_closure()
+        db.session.commit()
+        rebuilt = set(db.session.execute(closure_query).all())
+
+        assert len(incremental) == 10
+        assert incremental == rebuilt
+
+
+def test_moving_a_category_moves_its_subtree(test_context, client):
+    with test_context:
+        brands_id, nike_id, jordan_id, retro_id = create_category_path(
+            client, ["Sneaker brands", "Nike", "Air Jordan", "Retro 4"]
+        )
+        (adidas_id,) = create_category_path(client, ["Adidas"])
+        closure_query = select(CategoryClosure.ancestor_id, CategoryClosure.descendant_id, CategoryClosure.depth)
+
+        db.session.get(Category, UUID(jordan_id)).parent_id = UUID(adidas_id)
+        # inserted through the ORM rather than the API
+        db.session.add(Category(name="Retro 5", parent_id=UUID(jordan_id)))
+        db.session.commit()
+
+        incremental = set(db.session.execute(closure_query).all())
+        rebuild_category_closure()
+        db.session.commit()
+        assert incremental == set(db.session.execute(closure_query).all())
+
+        breadcrumbs_response = client.get(f"/marketplace/api/category/{retro_id}/breadcrumbs")
+        assert [crumb["name"] for crumb in breadcrumbs_response.json["breadcrumbs"]] == [
+            "Adidas", "Air Jordan", "Retro 4",
+        ]
+        assert client.get(f"/marketplace/api/category/{nike_id}/descendants").json["descendants"] == []
+        subtree = db.session.scalars(select(CategoryClosure.descendant_id).where(
+            CategoryClosure.ancestor_id == UUID(brands_id)
+        )).all()
+        assert set(subtree) == {UUID(brands_id), UUID(nike_id)}
+
+        # nor can a category move under its own subtree
+        db.session.get(Category, UUID(adidas_id)).parent_id = UUID(retro_id)
+        with pytest.raises(ValueError):
+            db.session.commit()
+        db.session.rollback()
+
+
+def test_create_category_unknown_parent(test_context, client):
+    with test_context:
+        create_response = client.post(
+            "/marketplace/api/category/create",
+            json={"name": "Orphan", "parent_id": "00000000000000000000000000000000"},
+        )
+
+        assert create_response.status_code == 422
+
+
+def test_community_feed_by_category(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    with test_context:
+        brands_id, nike_id, retro_id = create_category_path(client, ["Sneaker brands", "Nike", "Retro 4"])
+        (adidas_id,) = create_category_path(client, ["Adidas"])
+        retro = SourceItem(source_item_name="Retro 4", category_id=retro_id)
+        samba = SourceItem(source_item_name="Samba", category_id=adidas_id)
+        db.session.add_all([retro, samba])
+        db.session.commit()
+
+        listing_ids = {}
+        for source_item in [retro, samba]:
+            create_response = client.post("/marketplace/api/listing/create", json={
+                "community_id": seed_community.id,
+                "listed_by_id": seed_user.id,
+                "status": "active",
+                "listing_type": "item",
+                "sale_type": "sell",
+                "listing_price_cents": 1000,
+                "listing_title": source_item.source_item_name,
+                "available_count": 1,
+                "source_item_id": source_item.id,
+                "item_name": source_item.source_item_name,
+                "condition": "new",
+                "shipping_zipcode": "94115",
+            })
+            listing_ids[source_item.source_item_name] = create_response.json["listing"]["id"]
+
+        feed_url = f"/marketplace/api/community/{seed_community.id}/listings"
+        nike_feed = client.get(feed_url, query_string={"category_id": nike_id}).json["listings"]
+        brands_feed = client.get(feed_url, query_string={"category_id": brands_id}).json["listings"]
+
+        assert [listing["listing"]["id"] for listing in nike_feed] == [listing_ids["Retro 4"]]
+        assert len(brands_feed) == 1
@@ -0,0 +1,100 @@
+import datetime
+import json
+from uuid import UUID
+from flask import Flask
+from sqlalchemy import update
+from marketplace.extensions import db
+from marketplace.models import Community, CommunityProfile, Listing, User
+
+
+def test_export_community_listings(
+    app: Flask, test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    monkeypatch
+):
+    # resume exactly at the cursor; the overlap is covered below
+    monkeypatch.setitem(app.config, "EXPORT_OVERLAP_SECONDS", 0)
+    base_args = {
+        "community_id": seed_community.id,
+        "listed_by_id": seed_user.id,
+        "status": "active",
+        "sale_type": "sell",
+        "listing_price_cents": 1000,
+        "available_count": 1,
+    }
+    item_args = {
+        **base_args,
+        "listing_type": "item",
+        "listing_title": "Sneaker",
+        "item_name": "Sneaker",
+        "condition": "new",
+        "shipping_zipcode": "94115",
+    }
+    with test_context:
+        first_id = client.post("/marketplace/api/listing/create", json=item_args).json["listing"]["id"]
+        second_id = client.post(
+            "/marketplace/api/listing/create", json={**base_args, "listing_type": "empty", "listing_title": "Empty"}
+        ).json["listing"]["id"]
+
+        export_url = f"/marketplace/api/community/{seed_community.id}/listings/export"
+        export_response = client.get(export_url)
+
+        assert export_response.status_code == 200
+        assert export_response.mimetype == "application/x-ndjson"
+        rows = [json.loads(line) for line in export_response.get_data(as_text=True).splitlines()]
+        assert [row["listing"]["id"] for row in rows] == [first_id, second_id]
+        assert rows[0]["item"]["item_name"] == "Sneaker"
+
+        # resuming from the first row's cursor only exports what came after it
+        since_response = client.get(export_url, query_string=rows[0]["cursor"])
+        since_rows = [json.loads(line) for line in since_response.get_data(as_text=True).splitlines()]
+        assert [row["listing"]["id"] for row in since_rows] == [second_id]
+
+        # rows sharing a timestamp, as a bulk import's do, are resumed after the last one exported
+        import_response = client.post("/marketplace/api/listing/import", json=[
+            {**base_args, "listing_type": "empty", "listing_title": f"Imported {i}"} for i in range(3)
+        ])
+        assert import_response.json["imported"] == 3
+        all_rows = [json.loads(line) for line in client.get(export_url).get_data(as_text=True).splitlines()]
+        imported = all_rows[2:]
+        assert len({row["cursor"]["since"] for row in imported}) == 1
+        resumed_response = client.get(export_url, query_string=imported[0]["cursor"])
+        resumed_rows = [json.loads(line) for line in resumed_response.get_data(as_text=True).splitlines()]
+        assert [row["listing"]["id"] for row in resumed_rows] == [row["listing"]["id"] for row in imported[1:]]
+
+        # a listing updated after the last export is exported again, with its new stock
+        assert client.post(f"/marketplace/api/listing/{first_id}/purchase", json={}).status_code == 200
+        updated_response = client.get(export_url, query_string=all_rows[-1]["cursor"])
+        updated_rows = [json.loads(line) for line in updated_response.get_data(as_text=True).splitlines()]
+        assert [row["listing"]["id"] for row in updated_rows] == [first_id]
+        assert updated_rows[0]["listing"]["available_count"] == 0
+
+        assert client.get(export_url, query_string={"after_id": first_id}).status_code == 422
+
+
+def test_resumed_exports_overlap_late_commits(
+    app: Flask, test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    monkeypatch, create_listing
+):
+    with test_context:
+        export_url = f"/marketplace/api/community/{seed_community.id}/listings/export"
+        exported_id = create_listing(client, seed_community, seed_user, listing_title="Exported")
+        cursor = json.loads(client.get(export_url).get_data(as_text=True))["cursor"]
+
+        # written by a transaction that started before the export ran, and committed after it
+        late_id = create_listing(client, seed_community, seed_user, listing_title="Late")
+        db.session.execute(
+            update(Listing)
+            .where(Listing.id == UUID(late_id))
+            .values(updated_on=datetime.datetime.fromisoformat(cursor["since"]) - datetime.timedelta(seconds=5))
+        )
+        db.session.commit()
+
+        monkeypatch.setitem(app.config, "EXPORT_OVERLAP_SECONDS", 0)
+        assert client.get(export_url, query_string=cursor).get_data(as_text=True) == ""
+
+        monkeypatch.setitem(app.config, "EXPORT_OVERLAP_SECONDS", 60)
+        resumed_response = client.get(export_url, query_string=cursor)
+        resumed_rows = [json.loads(line) for line in resumed_response.get_data(as_text=True).splitlines()]
+        # the exported listing comes again unchanged, for the consumer to de-duplicate
+        assert [row["listing"]["id"] for row in resumed_rows] == [late_id, exported_id]
+        assert resumed_rows[1]["cursor"] == cursor
@@ -0,0 +1,207 @@
+from uuid import UUID
+import pytest
+from flask import Flask
+from sqlalchemy import delete, select
+from marketplace.extensions import db
+from marketplace.models import Community, CommunityProfile, Item, Listing, ListingItem, SourceItem, User, Zipcode
+
+
+def test_community_feed_pages_by_keyset(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_ids = [
+            create_listing(client, seed_community, seed_user, listing_title=f"Sneaker {i}") for i in range(5)
+        ]
+        create_listing(client, seed_community, seed_user, status="draft")
+
+        feed_url = f"/marketplace/api/community/{seed_community.id}/listings"
+        seen_ids = []
+        cursor = None
+        while True:
+            query = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+            feed_response = client.get(feed_url, query_string=query)
+            assert feed_response.status_code == 200
+
+            seen_ids += [listing["listing"]["id"] for listing in feed_response.json["listings"]]
+            cursor = feed_response.json["next_cursor"]
+            if cursor is None:
+                break
+
+        # newest first, drafts excluded, no listing repeated or skipped across pages
+        assert seen_ids == list(reversed(listing_ids))
+
+
+def test_community_feed_filters(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        cheap_id = create_listing(client, seed_community, seed_user, listing_price_cents=500)
+        create_listing(client, seed_community, seed_user, listing_price_cents=5000)
+        create_listing(client, seed_community, seed_user, listing_type="empty", listing_price_cents=500)
+
+        feed_response = client.get(
+            f"/marketplace/api/community/{seed_community.id}/listings",
+            query_string={"listing_type": "item", "max_price_cents": 1000},
+        )
+
+        assert feed_response.status_code == 200
+        listings = feed_response.json["listings"]
+        assert [listing["listing"]["id"] for listing in listings] == [cheap_id]
+        assert listings[0]["item"]["item_name"] == "Sneaker"
+
+
+def test_community_feed_near_zipcode(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        oakland_id = create_listing(client, seed_community, seed_user, shipping_zipcode="94607-1234")
+        city_id = create_listing(client, seed_community, seed_user, shipping_zipcode="94115")
+        create_listing(client, seed_community, seed_user, shipping_zipcode="10001")
+
+        feed_url = f"/marketplace/api/community/{seed_community.id}/listings"
+        feed_response = client.get(feed_url, query_string={"near_zipcode": "94110", "radius_miles": 15})
+
+        assert feed_response.status_code == 200
+        assert {listing["listing"]["id"] for listing in feed_response.json["listings"]} == {oakland_id, city_id}
+
+        close_response = client.get(feed_url, query_string={"near_zipcode": "94110", "radius_miles": 3})
+        assert [listing["listing"]["id"] for listing in close_response.json["listings"]] == [city_id]
+
+        unknown_response = client.get(feed_url, query_string={"near_zipcode": "00000"})
+        assert unknown_response.status_code == 422
+
+
+def test_community_feed_near_zipcode_across_the_antimeridian(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    # made up zipcodes on either side of the antimeridian, below any real one
+    zipcodes = [
+        Zipcode(zipcode="00001", latitude=-16.8, longitude=179.9),
+        Zipcode(zipcode="00002", latitude=-16.8, longitude=-179.9),
+    ]
+    with test_context:
+        db.session.add_all(zipcodes)
+        db.session.commit()
+        try:
+            east_id = create_listing(client, seed_community, seed_user, shipping_zipcode="00002")
+
+            feed_url = f"/marketplace/api/community/{seed_community.id}/listings"
+            feed_response = client.get(feed_url, query_string={"near_zipcode": "00001", "radius_miles": 20})
+            assert [listing["listing"]["id"] for listing in feed_response.json["listings"]] == [east_id]
+        finally:
+            db.session.execute(delete(Zipcode).where(Zipcode.zipcode.in_(["00001", "00002"])))
+            db.session.commit()
+
+
+def test_community_feed_details_filter(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        size_9_id = create_listing(client, seed_community, seed_user, item_details={"size": 9, "color": "red"})
+        create_listing(client, seed_community, seed_user, item_details={"size": 10, "color": "red"})
+        create_listing(client, seed_community, seed_user, item_details={"size": "9"})
+        cabin_id = create_listing(
+            client, seed_community, seed_user,
+            listing_type="lodging", sale_type="book", lodging_name="Cabin", address="1 Lake Rd",
+            start_date="2024-01-01", end_date="2024-01-08", lodging_type="airbnb",
+            lodging_details={"parking": True},
+        )
+
+        feed_url = f"/marketplace/api/community/{seed_community.id}/listings"
+        red_9_feed = client.get(feed_url, query_string={"details.size": "9", "details.color": "red"})
+        quoted_feed = client.get(feed_url, query_string={"details.size": '"9"'})
+        parking_feed = client.get(feed_url, query_string={"details.parking": "true"})
+        item_parking_feed = client.get(feed_url, query_string={"details.parking": "true", "listing_type": "item"})
+
+        assert [listing["listing"]["id"] for listing in red_9_feed.json["listings"]] == [size_9_id]
+        assert len(quoted_feed.json["listings"]) == 1
+        assert [listing["listing"]["id"] for listing in parking_feed.json["listings"]] == [cabin_id]
+        assert item_parking_feed.json["listings"] == []
+
+
+def test_community_feed_invalid_cursor(test_context, client, seed_community: Community):
+    with test_context:
+        feed_response = client.get(
+            f"/marketplace/api/community/{seed_community.id}/listings", query_string={"cursor": "nope"}
+        )
+
+        assert feed_response.status_code == 422
+
+
+@pytest.mark.parametrize("search_backend", ["postgres", "memory"])
+def test_search_community_listings(
+    app: Flask, test_context, client, seed_community: Community,
+    seed_user: User, seed_profile: CommunityProfile, seed_source_item: SourceItem,
+    search_backend: str, create_listing,
+):
+    with test_context:
+        app.config["SEARCH_BACKEND"] = search_backend
+        try:
+            title_id = create_listing(client, seed_community, seed_user, listing_title="Red running shoes")
+            name_id = create_listing(
+                client, seed_community, seed_user, listing_title="Sneakers", item_name="Red shoes, barely worn"
+            )
+            desc_id = create_listing(
+                client, seed_community, seed_user, listing_title="Boots", listing_desc="red shoes for hiking"
+            )
+            source_id = create_listing(
+                client, seed_community, seed_user, listing_title="Sneakers", source_item_id=seed_source_item.id
+            )
+            create_listing(client, seed_community, seed_user, listing_title="Red shoes", status="draft")
+            create_listing(client, seed_community, seed_user, listing_title="Blue shoes")
+
+            search_url = f"/marketplace/api/community/{seed_community.id}/listings/search"
+            search_response = client.get(search_url, query_string={"q": "red shoes"})
+
+            assert search_response.status_code == 200
+            # ranked by where the terms appear: title, then item name, then description
+            assert [listing["listing"]["id"] for listing in search_response.json["listings"]] == [
+                title_id, name_id, desc_id,
+            ]
+
+            keds_response = client.get(search_url, query_string={"q": "keds"})
+            assert [listing["listing"]["id"] for listing in keds_response.json["listings"]] == [source_id]
+        finally:
+            app.config["SEARCH_BACKEND"] = "auto"
+
+
+@pytest.mark.parametrize("search_backend", ["postgres", "memory"])
+def test_search_follows_orm_updates(
+    app: Flask, test_context, client, seed_community: Community,
+    seed_user: User, seed_profile: CommunityProfile, seed_source_item: SourceItem,
+    search_backend: str, create_listing,
+):
+    with test_context:
+        app.config["SEARCH_BACKEND"] = search_backend
+        try:
+            listing_id = create_listing(
+                client, seed_community, seed_user, listing_title="Boots", source_item_id=seed_source_item.id
+            )
+            search_url = f"/marketplace/api/community/{seed_community.id}/listings/search"
+
+            def search(q: str) -> list:
+                search_response = client.get(search_url, query_string={"q": q})
+                return [listing["listing"]["id"] for listing in search_response.json["listings"]]
+
+            assert search("boots") == [listing_id]
+
+            listing = db.session.get(Listing, UUID(listing_id))
+            listing.listing_title = "Sandals"
+            db.session.commit()
+            assert search("boots") == []
+            assert search("sandals") == [listing_id]
+
+            item = db.session.scalars(select(Item).join(ListingItem).where(ListingItem.listing_id == listing.id)).one()
+            item.item_name = "Espadrilles"
+            db.session.commit()
+            assert search("espadrilles") == [listing_id]
+
+            db.session.get(SourceItem, seed_source_item.id).source_item_name = "Vans"
+            db.session.commit()
+            assert search("keds") == []
+            assert search("vans") == [listing_id]
+            # each write bumped the version once; refreshing the search vector didn't bump it again
+            assert client.get(f"/marketplace/api/listing/{listing_id}").json["listing"]["version"] == 4
+        finally:
+            app.config["SEARCH_BACKEND"] = "auto"
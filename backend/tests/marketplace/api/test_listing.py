@@ -1,41 +1,5 @@
-import json
-import pytest
-from marketplace.server import db
-from flask.ctx import AppContext
-from marketplace.models import Community, SourceItem, User
-
-
-@pytest.fixture
-def seed_community(test_context: AppContext):
-    with test_context:
-        community = Community(name="Sneaker Gang", uri="sneakergang")
-        db.session.add(community)
-        db.session.commit()
-        db.session.refresh(community)
-
-        yield community
-
-
-@pytest.fixture
-def seed_user(test_context: AppContext):
-    with test_context:
-        user = User(email="a@a.com", first_name="Bob", last_name="Brown")
-        db.session.add(user)
-        db.session.commit()
-        db.session.refresh(user)
-
-        yield user
-
-
-@pytest.fixture
-def seed_source_item(test_context: AppContext):
-    with test_context:
-        source_item = SourceItem(source_item_name="Keds", source_item_details='{"color": "red"}')
-        db.session.add(source_item)
-        db.session.commit()
-        db.session.refresh(source_item)
-
-        yield source_item
+from marketplace.extensions import db
+from marketplace.models import Community, CommunityProfile, Item, SourceItem, User
 
 
 def test_create_listing_with_validation_error(test_context, client):
@@ -55,7 +19,38 @@ def test_create_listing_with_validation_error(test_context, client):
         }}
 
 
-def test_create_empty_listing(test_context, client, seed_community: Community, seed_user: User):
+def test_create_listing_reports_listing_and_type_errors_together(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    json_args = {
+        "community_id": seed_community.id,
+        "listed_by_id": seed_user.id,
+        "status": "active",
+        "listing_type": "lodging",
+        "sale_type": "book",
+        "listing_price_cents": "cheap",
+        "listing_title": "Cabin",
+        "available_count": 1,
+        "lodging_name": "Cabin",
+        "address": "1 Lake Rd",
+        "start_date": "2024-01-01",
+        "end_date": "2024-01-08",
+        "lodging_type": "castle",
+    }
+    with test_context:
+        create_response = client.post("/marketplace/api/listing/create", json=json_args)
+
+        # one parse of the body against the lodging variant's schema
+        assert create_response.status_code == 422
+        assert create_response.json == {'errors': {'json': {
+            'listing_price_cents': ['Not a valid integer.'],
+            'lodging_type': ["Lodging type doesn't exist"]}
+        }}
+
+
+def test_create_empty_listing(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
     json_args = {
         "community_id": seed_community.id,
         "listed_by_id": seed_user.id,
@@ -76,7 +71,10 @@ def test_create_empty_listing(test_context, client, seed_community: Community, s
         assert listing.get("listing_title") == "Test List"
 
 
-def test_create_item_listing(test_context, client, seed_community: Community, seed_user: User, seed_source_item: SourceItem):
+def test_create_item_listing(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    seed_source_item: SourceItem,
+):
     json_args = {
         "community_id": seed_community.id,
         "listed_by_id": seed_user.id,
@@ -103,11 +101,16 @@ def test_create_item_listing(test_context, client, seed_community: Community, se
         item = create_response.json.get("item")
         assert item.get("item_name") == "My broken sneakers"
         assert item.get("source_item_id") == seed_source_item.id.hex
-        item_details = json.loads(item.get("item_details"))
-        assert item_details.get("size") == 14
+        # details sent JSON-encoded are stored as the object they hold
+        assert item.get("item_details") == {"size": 14}
+        assert client.post(
+            "/marketplace/api/listing/create", json={**json_args, "item_details": '"size 14"'}
+        ).status_code == 422
 
 
-def test_create_lodging_listing(test_context, client, seed_community: Community, seed_user: User):
+def test_create_lodging_listing(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
     json_args = {
         "community_id": seed_community.id,
         "listed_by_id": seed_user.id,
@@ -135,5 +138,204 @@ def test_create_lodging_listing(test_context, client, seed_community: Community,
         assert listing.get("listing_title") == "Hotel Room"
         lodging = create_response.json.get("lodging")
         assert lodging.get("lodging_name") == "Hilton"
-        lodging_details = json.loads(lodging.get("lodging_details"))
-        assert lodging_details.get("parking") == "no"
+        assert lodging.get("lodging_details") == {"parking": "no"}
+
+
+def test_get_listing_not_found(test_context, client):
+    with test_context:
+        get_response = client.get("/marketplace/api/listing/00000000-0000-0000-0000-000000000000")
+
+        assert get_response.status_code == 404
+
+
+def test_get_item_listing(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    seed_source_item: SourceItem,
+):
+    json_args = {
+        "community_id": seed_community.id,
+        "listed_by_id": seed_user.id,
+        "status": "active",
+        "listing_type": "item",
+        "sale_type": "sell",
+        "listing_price_cents": 10099,
+        "listing_title": "Sneaker",
+        "available_count": 1,
+        "source_item_id": seed_source_item.id,
+        "item_name": "My broken sneakers",
+        "condition": "acceptable",
+        "shipping_zipcode": "94115",
+    }
+    with test_context:
+        create_response = client.post("/marketplace/api/listing/create", json=json_args)
+        listing_id = create_response.json["listing"]["id"]
+
+        get_response = client.get(f"/marketplace/api/listing/{listing_id}")
+
+        assert get_response.status_code == 200
+        listing = get_response.json.get("listing")
+        assert listing.get("id") == listing_id
+        assert listing.get("listed_by_alias") == "bobby"
+        item = get_response.json.get("item")
+        assert item.get("item_name") == "My broken sneakers"
+        assert item.get("source_item_name") == "Keds"
+        assert "lodging" not in get_response.json
+        assert "shipping" not in get_response.json
+
+        shipping_response = client.get(f"/marketplace/api/listing/{listing_id}", query_string={"zipcode": "10001"})
+
+        shipping = shipping_response.json["shipping"]
+        assert shipping["zone"] == 8
+        assert shipping["estimated_cost_cents"] == 1695
+        assert 2550 < shipping["distance_miles"] < 2590
+        assert shipping_response.json["listing"] == listing
+
+        invalid_response = client.get(f"/marketplace/api/listing/{listing_id}", query_string={"zipcode": "nope"})
+        assert invalid_response.status_code == 422
+
+
+def test_get_listing_conditional(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user, available_count=2)
+        listing_url = f"/marketplace/api/listing/{listing_id}"
+
+        get_response = client.get(listing_url)
+        etag, last_modified = get_response.headers["ETag"], get_response.headers["Last-Modified"]
+        assert get_response.json["listing"]["version"] == 1
+        assert client.get(listing_url).headers["ETag"] == etag
+
+        not_modified_response = client.get(listing_url, headers={"If-None-Match": etag})
+        assert not_modified_response.status_code == 304
+        assert not_modified_response.get_data() == b""
+        assert not_modified_response.headers["ETag"] == etag
+        assert client.get(listing_url, headers={"If-Modified-Since": last_modified}).status_code == 304
+        assert client.get(
+            listing_url, headers={"If-Modified-Since": "Mon, 01 Jan 2001 00:00:00 GMT"}
+        ).status_code == 200
+        # the shipping estimate is part of the body, so it is part of the ETag
+        shipping_response = client.get(listing_url, query_string={"zipcode": "10001"}, headers={"If-None-Match": etag})
+        assert shipping_response.status_code == 200
+        assert shipping_response.headers["ETag"] != etag
+
+        # a stock update, then an item update, each bump the version
+        client.post(f"{listing_url}/purchase", json={"quantity": 1})
+        purchased_response = client.get(listing_url, headers={"If-None-Match": etag})
+        assert purchased_response.status_code == 200
+        assert purchased_response.json["listing"]["version"] == 2
+        purchased_etag = purchased_response.headers["ETag"]
+
+        db.session.query(Item).one().condition = "good"
+        db.session.commit()
+        item_response = client.get(listing_url, headers={"If-None-Match": purchased_etag})
+        assert item_response.status_code == 200
+        assert item_response.json["listing"]["version"] == 3
+        assert item_response.json["item"]["condition"] == "good"
+
+        assert client.get(f"/marketplace/api/listing/{'0' * 32}", headers={"If-None-Match": etag}).status_code == 404
+
+
+def test_get_lodging_listing(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    json_args = {
+        "community_id": seed_community.id,
+        "listed_by_id": seed_user.id,
+        "status": "active",
+        "listing_type": "lodging",
+        "sale_type": "book",
+        "listing_price_cents": 20099,
+        "listing_title": "Hotel Room",
+        "available_count": 1,
+        "lodging_name": "Hilton",
+        "address": "1 Main St",
+        "start_date": "2024-01-01",
+        "end_date": "2024-02-01",
+        "lodging_type": "hotel",
+    }
+    with test_context:
+        create_response = client.post("/marketplace/api/listing/create", json=json_args)
+        listing_id = create_response.json["listing"]["id"]
+
+        get_response = client.get(f"/marketplace/api/listing/{listing_id}")
+
+        assert get_response.status_code == 200
+        listing = get_response.json.get("listing")
+        assert listing.get("listing_type") == "lodging"
+        assert listing.get("listed_by_alias") == "bobby"
+        lodging = get_response.json.get("lodging")
+        assert lodging.get("lodging_name") == "Hilton"
+        assert lodging.get("start_date") == "2024-01-01"
+        assert "item" not in get_response.json
+
+
+def test_get_listings_batch(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    base_args = {
+        "community_id": seed_community.id,
+        "listed_by_id": seed_user.id,
+        "status": "active",
+        "sale_type": "sell",
+        "listing_price_cents": 500,
+        "available_count": 1,
+    }
+    item_args = {
+        **base_args,
+        "listing_type": "item",
+        "listing_title": "Sneaker",
+        "item_name": "Sneaker",
+        "condition": "new",
+        "shipping_zipcode": "94115",
+    }
+    lodging_args = {
+        **base_args,
+        "listing_type": "lodging",
+        "sale_type": "book",
+        "listing_title": "Cabin",
+        "lodging_name": "Cabin",
+        "address": "1 Lake Rd",
+        "start_date": "2024-01-01",
+        "end_date": "2024-01-08",
+        "lodging_type": "airbnb",
+    }
+    empty_args = {**base_args, "listing_type": "empty", "listing_title": "Empty"}
+    missing_id = "00000000000000000000000000000000"
+
+    with test_context:
+        listing_ids = [
+            client.post("/marketplace/api/listing/create", json=args).json["listing"]["id"]
+            for args in [lodging_args, item_args, empty_args]
+        ]
+
+        batch_response = client.post(
+            "/marketplace/api/listings/batch", json={"ids": listing_ids + [missing_id]}
+        )
+
+        assert batch_response.status_code == 200
+        listings = batch_response.json.get("listings")
+        assert [listing["listing"]["id"] for listing in listings] == listing_ids
+        assert listings[0]["lodging"]["lodging_name"] == "Cabin"
+        assert listings[1]["item"]["item_name"] == "Sneaker"
+        assert "item" not in listings[2] and "lodging" not in listings[2]
+        assert batch_response.json.get("not_found") == [missing_id]
+
+
+def test_get_listings_batch_limit(test_context, client):
+    with test_context:
+        empty_response = client.post("/marketplace/api/listings/batch", json={"ids": []})
+        assert empty_response.status_code == 422
+
+        too_many = ["00000000000000000000000000000000"] * 501
+        too_many_response = client.post("/marketplace/api/listings/batch", json={"ids": too_many})
+        assert too_many_response.status_code == 422
+
+
+def test_get_db_pool_stats(test_context, client):
+    with test_context:
+        stats_response = client.get("/marketplace/api/db/pool/stats")
+
+        assert stats_response.status_code == 200
+        assert stats_response.json["checked_out"] >= 0
+        assert "pid" in stats_response.json
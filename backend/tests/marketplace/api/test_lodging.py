@@ -0,0 +1,97 @@
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask
+from marketplace.models import Community, CommunityProfile, User
+
+
+def test_book_lodging(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    create_lodging_listing
+):
+    with test_context:
+        listing_id = create_lodging_listing(client, seed_community, seed_user)
+        book_url = f"/marketplace/api/listing/{listing_id}/book"
+
+        book_response = client.post(book_url, json={"check_in": "2024-01-10", "check_out": "2024-01-15"})
+        assert book_response.status_code == 200
+        assert book_response.json["booking"]["check_in"] == "2024-01-10"
+
+        overlap_response = client.post(book_url, json={"check_in": "2024-01-14", "check_out": "2024-01-16"})
+        assert overlap_response.status_code == 409
+
+        # checking in on another stay's check-out day doesn't overlap
+        back_to_back_response = client.post(book_url, json={"check_in": "2024-01-15", "check_out": "2024-01-16"})
+        assert back_to_back_response.status_code == 200
+
+        outside_response = client.post(book_url, json={"check_in": "2024-01-30", "check_out": "2024-02-03"})
+        assert outside_response.status_code == 422
+
+        backwards_response = client.post(book_url, json={"check_in": "2024-01-20", "check_out": "2024-01-20"})
+        assert backwards_response.status_code == 422
+
+
+def test_book_lodging_requires_book_sale_type(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    create_lodging_listing
+):
+    with test_context:
+        listing_id = create_lodging_listing(client, seed_community, seed_user, sale_type="rent")
+
+        book_response = client.post(
+            f"/marketplace/api/listing/{listing_id}/book", json={"check_in": "2024-01-10", "check_out": "2024-01-15"}
+        )
+
+        assert book_response.status_code == 422
+
+
+def test_concurrent_bookings_never_double_book(
+    app: Flask, test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    create_lodging_listing
+):
+    with test_context:
+        listing_id = create_lodging_listing(client, seed_community, seed_user)
+
+    def book(_):
+        with app.app_context():
+            return app.test_client().post(
+                f"/marketplace/api/listing/{listing_id}/book", json={"check_in": "2024-01-10", "check_out": "2024-01-12"}
+            ).status_code
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        status_codes = list(executor.map(book, range(8)))
+
+    assert sorted(status_codes) == [200] + [409] * 7
+
+
+def test_lodging_availability(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    create_lodging_listing
+):
+    with test_context:
+        hotel_id = create_lodging_listing(client, seed_community, seed_user)
+        booked_id = create_lodging_listing(client, seed_community, seed_user, lodging_name="Booked Inn")
+        cabin_id = create_lodging_listing(
+            client, seed_community, seed_user, lodging_name="Cabin", lodging_type="airbnb",
+            start_date="2024-01-20", end_date="2024-03-01",
+        )
+        client.post(
+            f"/marketplace/api/listing/{booked_id}/book", json={"check_in": "2024-01-05", "check_out": "2024-01-25"}
+        )
+
+        availability_url = f"/marketplace/api/community/{seed_community.id}/lodgings/availability"
+        stay = {"check_in": "2024-01-10", "check_out": "2024-01-15"}
+
+        available = client.get(availability_url, query_string=stay).json["listings"]
+        assert [listing["listing"]["id"] for listing in available] == [hotel_id]
+        assert available[0]["lodging"]["lodging_name"] == "Hilton"
+
+        late_stay = {"check_in": "2024-01-25", "check_out": "2024-01-28"}
+        late_available = client.get(availability_url, query_string=late_stay).json["listings"]
+        assert {listing["listing"]["id"] for listing in late_available} == {hotel_id, booked_id, cabin_id}
+
+        airbnb_available = client.get(availability_url, query_string={**late_stay, "lodging_type": "airbnb"})
+        assert [listing["listing"]["id"] for listing in airbnb_available.json["listings"]] == [cabin_id]
+
+        overlapping = client.get(
+            availability_url, query_string={"check_in": "2024-01-30", "check_out": "2024-02-10", "match": "overlapping"}
+        ).json["listings"]
+        assert {listing["listing"]["id"] for listing in overlapping} == {hotel_id, booked_id, cabin_id}
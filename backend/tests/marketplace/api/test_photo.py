@@ -0,0 +1,161 @@
+import http.server
+import io
+import threading
+import pytest
+from flask import Flask
+from PIL import Image
+from marketplace.extensions import db
+from marketplace.imaging import blurhash_encode
+from marketplace.models import Community, CommunityProfile, Item, Photo, User
+from marketplace.photos import FetchRefused, LocalPhotoStore, fetch_url
+from marketplace.reprocess_photos import reprocess_all_photos
+
+
+def image_bytes(size=(1200, 800), color=(200, 30, 30), image_format="PNG") -> bytes:
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, image_format)
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def photo_store(app: Flask, tmp_path):
+    store = LocalPhotoStore(str(tmp_path), app.config["PHOTO_BASE_URL"])
+    app.extensions["photo_store"] = store
+
+    yield store
+
+    app.extensions.pop("photo_store")
+
+
+def test_blurhash_matches_reference_encoder():
+    gradient = Image.linear_gradient("L").resize((32, 32)).convert("RGB")
+
+    assert blurhash_encode(gradient, 4, 3) == "L#HetWoffQof00WBfQWBxuj[fQj["
+
+
+def test_upload_photos_renders_thumbnails_and_dedupes(test_context, client, photo_store: LocalPhotoStore):
+    red = image_bytes()
+    with test_context:
+        upload_response = client.post("/marketplace/api/photos", data={
+            "photo": [(io.BytesIO(red), "a.png"), (io.BytesIO(image_bytes(color=(0, 0, 255))), "b.png")],
+        })
+
+        assert upload_response.status_code == 200
+        first, second = upload_response.json["photos"]
+        assert (first["width"], first["height"]) == (1200, 800)
+        assert first["thumbnails"]["small"]["width"] == 160
+        assert first["thumbnails"]["large"] == {"url": first["thumbnails"]["large"]["url"], "width": 1080, "height": 720}
+        assert len(first["blurhash"]) == 28
+        assert first["photo_id"] != second["photo_id"]
+
+        thumbnail_response = client.get(first["thumbnails"]["small"]["url"])
+        assert thumbnail_response.status_code == 200
+        assert Image.open(io.BytesIO(thumbnail_response.data)).size == (160, 107)
+
+        again_response = client.post("/marketplace/api/photos", data={"photo": (io.BytesIO(red), "again.png")})
+        assert again_response.json["photos"] == [first]
+        assert db.session.query(Photo).count() == 2
+
+
+def test_upload_rejects_non_images(test_context, client, photo_store: LocalPhotoStore):
+    with test_context:
+        upload_response = client.post("/marketplace/api/photos", data={
+            "photo": [(io.BytesIO(image_bytes()), "a.png"), (io.BytesIO(b"not an image"), "b.png")],
+        })
+
+        assert upload_response.status_code == 422
+        assert db.session.query(Photo).count() == 0
+
+
+def test_add_listing_photos(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    photo_store: LocalPhotoStore, create_listing,
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user)
+        assert client.get(f"/marketplace/api/listing/{listing_id}").json["item"]["photos"] is None
+
+        add_response = client.post(
+            f"/marketplace/api/listing/{listing_id}/photos", data={"photo": (io.BytesIO(image_bytes()), "a.jpg")}
+        )
+        assert add_response.status_code == 200
+
+        photos = client.get(f"/marketplace/api/listing/{listing_id}").json["item"]["photos"]
+        assert photos == add_response.json["photos"]
+        assert set(photos[0]["thumbnails"]) == {"small", "medium", "large"}
+
+
+def test_reprocess_legacy_photos(
+    app: Flask, test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    photo_store: LocalPhotoStore, create_listing,
+):
+    photo_store.put("legacy/one.jpg", image_bytes(image_format="JPEG"), "image/jpeg")
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user, photos=[
+            {"url": photo_store.url("legacy/one.jpg"), "caption": "front"},
+            {"url": "/nowhere.jpg"},
+        ])
+        version = client.get(f"/marketplace/api/listing/{listing_id}").json["listing"]["version"]
+
+        stats = reprocess_all_photos()
+
+        assert stats["ingested"] == 1
+        assert stats["unreachable"] == 1
+        listing_response = client.get(f"/marketplace/api/listing/{listing_id}").json
+        # the version the web workers' conditional reads check has moved on
+        assert listing_response["listing"]["version"] == version + 1
+        front, unreachable = listing_response["item"]["photos"]
+        assert front["caption"] == "front"
+        assert front["photo_id"] == db.session.query(Photo).one().id.hex
+        assert front["thumbnails"]["medium"]["width"] == 480
+        assert unreachable == {"url": "/nowhere.jpg"}
+
+        app.config["PHOTO_THUMBNAIL_SIZES"] = {"small": 100}
+        try:
+            assert reprocess_all_photos(rerender=True)["rerendered"] == 1
+        finally:
+            app.config["PHOTO_THUMBNAIL_SIZES"] = {"small": 160, "medium": 480, "large": 1080}
+        item_photos = db.session.query(Item).one().photos
+        assert set(item_photos[0]["thumbnails"]) == {"small"}
+
+
+def test_remote_originals_are_only_fetched_from_allowed_hosts(
+    app: Flask, test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    photo_store: LocalPhotoStore, create_listing, monkeypatch
+):
+    monkeypatch.setitem(app.config, "PHOTO_FETCH_HOSTS", ["localhost", "169.254.169.254"])
+    with test_context:
+        create_listing(client, seed_community, seed_user, photos=[
+            {"url": "http://elsewhere.example/one.jpg"},
+            {"url": "http://localhost:8080/admin"},
+            {"url": "http://169.254.169.254/latest/meta-data/"},
+        ])
+
+        stats = reprocess_all_photos()
+
+    assert stats["refused"] == 3
+    assert stats["ingested"] == 0
+
+
+def test_fetch_url_caps_the_body(monkeypatch):
+    class OriginalHandler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.end_headers()
+            self.wfile.write(b"x" * 2048)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.HTTPServer(("127.0.0.1", 0), OriginalHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # the test server is on loopback, which is otherwise refused
+    monkeypatch.setattr("marketplace.photos.check_fetch_url", lambda url, allowed_hosts: None)
+    url = f"http://127.0.0.1:{server.server_port}/big.jpg"
+    try:
+        assert len(fetch_url(url, set(), max_bytes=4096)) == 2048
+        with pytest.raises(FetchRefused):
+            fetch_url(url, set(), max_bytes=1024)
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,152 @@
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+from uuid import UUID
+from sqlalchemy import select, update
+from flask import Flask
+from marketplace.extensions import db
+from marketplace.inventory import release_expired_reservations
+from marketplace.models import Community, CommunityProfile, Listing, ListingReservation, User
+
+
+def test_purchase_listing(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user, available_count=3)
+        purchase_url = f"/marketplace/api/listing/{listing_id}/purchase"
+
+        purchase_response = client.post(purchase_url, json={"quantity": 2})
+        assert purchase_response.status_code == 200
+        assert purchase_response.json["listing"]["available_count"] == 1
+        assert purchase_response.json["listing"]["status"] == "active"
+
+        too_many_response = client.post(purchase_url, json={"quantity": 2})
+        assert too_many_response.status_code == 409
+
+        last_response = client.post(purchase_url, json={})
+        assert last_response.json["listing"] == {"id": listing_id, "available_count": 0, "status": "sold"}
+
+        # the cached listing was invalidated by the purchase
+        assert client.get(f"/marketplace/api/listing/{listing_id}").json["listing"]["status"] == "sold"
+        assert client.post(purchase_url, json={}).status_code == 409
+
+
+def test_purchase_listing_not_for_sale(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        draft_id = create_listing(client, seed_community, seed_user, status="draft")
+
+        assert client.post(f"/marketplace/api/listing/{draft_id}/purchase", json={}).status_code == 422
+        assert client.post(f"/marketplace/api/listing/{'0' * 32}/purchase", json={}).status_code == 404
+
+
+def test_reserve_and_purchase(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user, available_count=2)
+
+        reserve_response = client.post(f"/marketplace/api/listing/{listing_id}/reserve", json={"quantity": 2})
+        assert reserve_response.status_code == 200
+        assert reserve_response.json["listing"]["status"] == "sold"
+        reservation_id = reserve_response.json["reservation"]["id"]
+
+        # held stock can't be bought by anyone else
+        assert client.post(f"/marketplace/api/listing/{listing_id}/purchase", json={}).status_code == 409
+
+        purchase_url = f"/marketplace/api/listing/{listing_id}/purchase"
+        # the held quantity is bought as a whole, and stays held while the request doesn't match it
+        mismatched_response = client.post(purchase_url, json={"reservation_id": reservation_id, "quantity": 1})
+        assert mismatched_response.status_code == 422
+        purchase_response = client.post(purchase_url, json={"reservation_id": reservation_id, "quantity": 2})
+        assert purchase_response.status_code == 200
+        assert purchase_response.json["quantity"] == 2
+
+        # a reservation is only purchased once
+        assert client.post(purchase_url, json={"reservation_id": reservation_id}).status_code == 409
+        assert client.post(f"/marketplace/api/reservation/{reservation_id}/release").status_code == 409
+
+
+def test_released_and_expired_reservations_return_stock(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user, available_count=1)
+        reserve_url = f"/marketplace/api/listing/{listing_id}/reserve"
+
+        reservation_id = client.post(reserve_url, json={}).json["reservation"]["id"]
+        release_response = client.post(f"/marketplace/api/reservation/{reservation_id}/release")
+        assert release_response.json["listing"] == {"id": listing_id, "available_count": 1, "status": "active"}
+
+        expiring_id = client.post(reserve_url, json={}).json["reservation"]["id"]
+        assert client.post(reserve_url, json={}).status_code == 409
+
+        db.session.execute(
+            update(ListingReservation)
+            .where(ListingReservation.id == expiring_id)
+            .values(expires_on=datetime.datetime.now() - datetime.timedelta(seconds=1))
+        )
+        db.session.commit()
+
+        # the expired hold is swept and its stock goes to the next buyer
+        purchase_response = client.post(f"/marketplace/api/listing/{listing_id}/purchase", json={})
+        assert purchase_response.status_code == 200
+        assert purchase_response.json["listing"]["status"] == "sold"
+
+        expired_purchase = client.post(
+            f"/marketplace/api/listing/{listing_id}/purchase", json={"reservation_id": expiring_id}
+        )
+        assert expired_purchase.status_code == 409
+
+
+def test_sweeping_expired_reservations_bumps_listing_versions(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user, available_count=1)
+        listing_url = f"/marketplace/api/listing/{listing_id}"
+        client.post(f"{listing_url}/reserve", json={})
+        held_response = client.get(listing_url)
+        assert (held_response.json["listing"]["status"], held_response.json["listing"]["version"]) == ("sold", 2)
+
+        db.session.execute(update(ListingReservation).values(
+            expires_on=datetime.datetime.now() - datetime.timedelta(seconds=1)
+        ))
+        db.session.commit()
+        # as marketplace/release_reservations.py does, from a process other than the web workers'
+        assert release_expired_reservations() == {UUID(listing_id): 1}
+        db.session.commit()
+
+        listing = db.session.execute(
+            select(Listing.status, Listing.version).where(Listing.id == UUID(listing_id))
+        ).one()
+        assert tuple(listing) == ("active", 3)
+        # a worker still caching the held version answers conditional reads from the new one
+        conditional_response = client.get(listing_url, headers={"If-None-Match": held_response.headers["ETag"]})
+        assert conditional_response.status_code == 200
+        assert conditional_response.json["listing"]["version"] == 3
+
+
+def test_concurrent_purchases_never_oversell(
+    app: Flask, test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    create_listing
+):
+    stock = 25
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user, available_count=stock)
+
+    def purchase(_):
+        with app.app_context():
+            return app.test_client().post(f"/marketplace/api/listing/{listing_id}/purchase", json={}).status_code
+
+    with ThreadPoolExecutor(max_workers=12) as executor:
+        status_codes = list(executor.map(purchase, range(stock * 2)))
+
+    assert status_codes.count(200) == stock
+    assert status_codes.count(409) == stock
+
+    with app.app_context():
+        listing = app.test_client().get(f"/marketplace/api/listing/{listing_id}").json["listing"]
+        assert listing["available_count"] == 0
+        assert listing["status"] == "sold"
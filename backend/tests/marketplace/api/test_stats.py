@@ -0,0 +1,80 @@
+from sqlalchemy import text
+from marketplace.extensions import db
+from marketplace.models import Community, CommunityListingStats, CommunityProfile, User
+from marketplace.reconcile_stats import reconcile_all_stats
+
+
+def get_stats(client, community: Community, **query) -> dict:
+    stats_response = client.get(f"/marketplace/api/community/{community.id}/stats", query_string=query)
+    assert stats_response.status_code == 200
+
+    return stats_response.json
+
+
+def bucket_counts(stats: dict) -> dict:
+    return {bucket["min_cents"]: bucket["count"] for bucket in stats["price"]["buckets"] if bucket["count"]}
+
+
+def test_community_stats_follow_listing_writes(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        hot_id = create_listing(client, seed_community, seed_user, listing_price_cents=1200)
+        create_listing(client, seed_community, seed_user, listing_price_cents=30000)
+        create_listing(
+            client, seed_community, seed_user,
+            listing_type="empty", sale_type="free", status="draft", listing_price_cents=0,
+        )
+
+        stats = get_stats(client, seed_community)
+        assert stats["listing_count"] == 3
+        assert stats["by_status"] == {"active": 2, "draft": 1}
+        assert stats["by_listing_type"] == {"empty": 1, "item": 2}
+        assert stats["by_sale_type"] == {"free": 1, "sell": 2}
+        assert stats["price"]["mean_cents"] == 10400
+        assert bucket_counts(stats) == {0: 1, 1000: 1, 25000: 1}
+
+        reserve_response = client.post(f"/marketplace/api/listing/{hot_id}/reserve", json={"quantity": 1})
+        assert get_stats(client, seed_community)["by_status"] == {"active": 1, "draft": 1, "sold": 1}
+        assert get_stats(client, seed_community, status="sold")["price"]["mean_cents"] == 1200
+
+        reservation_id = reserve_response.json["reservation"]["id"]
+        client.post(f"/marketplace/api/reservation/{reservation_id}/release")
+        assert get_stats(client, seed_community)["by_status"] == {"active": 2, "draft": 1}
+
+        import_response = client.post("/marketplace/api/listing/import", json=[{
+            "community_id": seed_community.id.hex, "listed_by_id": seed_user.id.hex, "status": "active",
+            "listing_type": "empty", "sale_type": "sell", "listing_price_cents": 2000000, "listing_title": "Boat",
+            "available_count": 1,
+        }])
+        assert import_response.json["imported"] == 1
+        stats = get_stats(client, seed_community, status="active")
+        assert stats["listing_count"] == 3
+        assert bucket_counts(stats) == {1000: 1, 25000: 1, 1000000: 1}
+
+        assert client.get("/marketplace/api/community/00000000000000000000000000000000/stats").status_code == 404
+
+
+def test_reconcile_repairs_drift(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user)
+        create_listing(client, seed_community, seed_user)
+        expected = get_stats(client, seed_community)
+
+        # writes behind the app's back: one listing closed, a stats row left behind by a deleted listing
+        db.session.execute(text("UPDATE listings SET status = 'closed' WHERE id = :id"), {"id": listing_id})
+        db.session.add(CommunityListingStats(
+            community_id=seed_community.id, status="spam", listing_type="item", sale_type="sell", price_bucket=0,
+            listing_count=1, price_sum_cents=5,
+        ))
+        db.session.commit()
+        assert get_stats(client, seed_community)["by_status"] == {"active": 2, "spam": 1}
+
+        assert reconcile_all_stats() == {seed_community.id: 3}
+
+        assert get_stats(client, seed_community)["by_status"] == {"active": 1, "closed": 1}
+        assert get_stats(client, seed_community)["price"] == expected["price"]
+        assert db.session.query(CommunityListingStats).filter(CommunityListingStats.listing_count == 0).count() == 0
+        assert reconcile_all_stats() == {}
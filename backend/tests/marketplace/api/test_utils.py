@@ -0,0 +1,45 @@
+import datetime
+import json
+import uuid
+from sqlalchemy import select
+from flask import Flask
+from marketplace.extensions import db
+from marketplace.models import Community
+from marketplace.api.utils import decode_cursor, encode_cursor, row_to_dict
+
+
+def test_json_provider_serializes_special_types(app: Flask, test_context):
+    community_id = uuid.uuid4()
+    with test_context:
+        body = app.json.dumps({
+            "id": community_id,
+            "on": datetime.date(2024, 1, 2),
+            "at": datetime.datetime(2024, 1, 2, 3, 4, 5),
+            "for": datetime.timedelta(hours=1, minutes=30),
+        })
+
+    assert json.loads(body) == {
+        "id": community_id.hex,
+        "on": "2024-01-02",
+        "at": "2024-01-02T03:04:05",
+        "for": "01:30:00",
+    }
+
+
+def test_json_provider_serializes_rows_and_models(app: Flask, test_context, seed_community: Community):
+    with test_context:
+        row = db.session.execute(select(Community.id, Community.name)).one()
+        community = db.session.get(Community, seed_community.id)
+
+        body = json.loads(app.json.dumps({"row": row, "model": community}))
+
+    assert body["row"] == {"id": seed_community.id.hex, "name": "Sneaker Gang"}
+    assert body["model"]["uri"] == "sneakergang"
+    assert body["model"] == json.loads(app.json.dumps(row_to_dict(community)))
+
+
+def test_cursor_round_trip():
+    listing_id = uuid.uuid4()
+    listed_on = datetime.datetime(2024, 1, 2, 3, 4, 5, 678)
+
+    assert decode_cursor(encode_cursor(listed_on, listing_id)) == [listed_on.isoformat(), listing_id.hex]
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import time
+from uuid import UUID
+import pytest
+from flask import Flask, has_app_context
+from sqlalchemy import update
+from marketplace.asgi import application, async_database_url, async_engine, async_engine_options
+from marketplace.extensions import db, listing_cache, profile_cache, replica_router
+from marketplace.models import Community, CommunityProfile, Listing, User
+from marketplace.pool import timed_queue_pool
+from marketplace.replicas import PRIMARY_UNTIL_COOKIE
+
+
+def asgi_request(method: str, path: str, query_string: str = "", body=None, headers: dict = None):
+    """Call the ASGI app directly, returning (status, parsed JSON body, raw body)."""
+    messages = []
+    request_body = json.dumps(body).encode() if body is not None else b""
+
+    async def receive():
+        return {"type": "http.request", "body": request_body, "more_body": False}
+
+    async def send(message):
+        messages.append(message)
+
+    async def call():
+        try:
+            await application({
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": method,
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": query_string.encode(),
+                "root_path": "",
+                "headers": [(b"content-type", b"application/json"), (b"host", b"localhost")] + [
+                    (name.lower().encode(), value.encode()) for name, value in (headers or {}).items()
+                ],
+                "server": ("localhost", 80),
+                "client": ("127.0.0.1", 1234),
+            }, receive, send)
+        finally:
+            # pooled connections belong to this event loop
+            await async_engine.dispose()
+
+    asyncio.run(call())
+    status = next(message["status"] for message in messages if message["type"] == "http.response.start")
+    raw_body = b"".join(message.get("body", b"") for message in messages if message["type"] == "http.response.body")
+
+    return status, json.loads(raw_body) if raw_body else None, raw_body
+
+
+def test_async_get_listing_matches_flask(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user, item_details={"size": 9})
+
+        status, async_json, async_body = asgi_request("GET", f"/marketplace/api/listing/{listing_id}")
+        assert status == 200
+        assert async_json["item"]["item_details"] == {"size": 9}
+
+        # the async read filled the shared cache, and is byte for byte what the Flask view builds
+        assert listing_cache.get(UUID(listing_id)).body == async_body.decode()
+        listing_cache.clear()
+        assert client.get(f"/marketplace/api/listing/{listing_id}").get_data() == async_body
+
+        etag = client.get(f"/marketplace/api/listing/{listing_id}").headers["ETag"]
+        not_modified_status, _, not_modified_body = asgi_request(
+            "GET", f"/marketplace/api/listing/{listing_id}", headers={"If-None-Match": etag}
+        )
+        assert (not_modified_status, not_modified_body) == (304, b"")
+
+        missing_status, missing_json, _ = asgi_request("GET", f"/marketplace/api/listing/{'0' * 32}")
+        assert missing_status == 404
+        assert missing_json == {"error": "listing does not exist"}
+
+
+def test_async_conditional_get_without_app_context(app: Flask, create_listing):
+    """Under uvicorn nothing pushes an app context, unlike the seed fixtures, so the data is created in one first."""
+    with app.app_context():
+        community = Community(name="No context", uri="nocontext")
+        user = User(email="n@n.com", first_name="No", last_name="Context")
+        db.session.add_all([community, user])
+        db.session.flush()
+        db.session.add(CommunityProfile(community_id=community.id, user_id=user.id, alias="nocontext"))
+        db.session.commit()
+        client = app.test_client()
+        listing_id = create_listing(client, community, user)
+        etag = client.get(f"/marketplace/api/listing/{listing_id}").headers["ETag"]
+    listing_cache.clear()
+    profile_cache.clear()
+    assert not has_app_context()
+
+    status, _, body = asgi_request("GET", f"/marketplace/api/listing/{listing_id}", headers={"If-None-Match": etag})
+    assert (status, body) == (304, b"")
+
+    status, async_json, _ = asgi_request(
+        "GET", f"/marketplace/api/listing/{listing_id}", headers={"If-None-Match": '"0"'}
+    )
+    assert status == 200
+    assert async_json["listing"]["listed_by_alias"] == "nocontext"
+    # the ETag of a body the async handler built matches the one the Flask view sent
+    assert listing_cache.get(UUID(listing_id)).etag == etag.strip('"')
+
+
+def test_async_get_listing_revalidates_for_pinned_clients(
+    monkeypatch, test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    create_listing,
+):
+    monkeypatch.setattr(replica_router, "enabled", True)
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user)
+        listing_path = f"/marketplace/api/listing/{listing_id}"
+        asgi_request("GET", listing_path)
+        # written behind this process' cache, as another process would
+        with db.engine.begin() as connection:
+            connection.execute(
+                update(Listing).where(Listing.id == UUID(listing_id)).values(listing_title="Renamed")
+            )
+
+        assert asgi_request("GET", listing_path)[1]["listing"]["listing_title"] != "Renamed"
+
+        pinned_cookie = f"{PRIMARY_UNTIL_COOKIE}={time.time() + 10:.3f}"
+        status, pinned_json, _ = asgi_request("GET", listing_path, headers={"Cookie": pinned_cookie})
+        assert status == 200
+        assert pinned_json["listing"]["listing_title"] == "Renamed"
+
+
+def test_async_engine_takes_the_engine_options():
+    options = async_engine_options({
+        "poolclass": timed_queue_pool(slow_checkout_ms=100),
+        "pool_timeout": 10,
+        "pool_recycle": 1800,
+        "connect_args": {"options": "-c statement_timeout=30000", "application_name": "marketplace"},
+    })
+
+    assert "poolclass" not in options
+    assert (options["pool_timeout"], options["pool_recycle"], options["pool_pre_ping"]) == (10, 1800, True)
+    assert options["connect_args"] == {
+        "server_settings": {"statement_timeout": "30000", "application_name": "marketplace"},
+    }
+
+    with pytest.raises(ValueError, match="PostgreSQL"):
+        async_database_url("sqlite:///marketplace.db")
+
+
+def test_async_batch_and_feed(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_ids = [create_listing(client, seed_community, seed_user) for _ in range(3)]
+
+        status, batch_json, _ = asgi_request(
+            "POST", "/marketplace/api/listings/batch", body={"ids": [listing_ids[0], "0" * 32]}
+        )
+        assert status == 200
+        assert [listing["listing"]["id"] for listing in batch_json["listings"]] == [listing_ids[0]]
+        assert batch_json["not_found"] == ["0" * 32]
+
+        feed_path = f"/marketplace/api/community/{seed_community.id.hex}/listings"
+        status, feed_json, feed_body = asgi_request("GET", feed_path, "limit=2")
+        assert status == 200
+        assert feed_body == client.get(feed_path, query_string={"limit": 2}).get_data()
+
+        _, next_json, _ = asgi_request("GET", feed_path, f"limit=2&cursor={feed_json['next_cursor']}")
+        assert [listing["listing"]["id"] for listing in next_json["listings"]] == [listing_ids[0]]
+
+        assert asgi_request("GET", feed_path, "limit=0")[0] == 422
+        assert asgi_request("GET", feed_path, "cursor=nope")[0] == 422
+
+
+def test_other_routes_pass_through_to_flask(test_context, seed_community: Community):
+    status, feed_json, _ = asgi_request(
+        "GET", f"/marketplace/api/community/{seed_community.id.hex}/listings/search", "q=shoes"
+    )
+
+    assert status == 200
+    assert feed_json == {"listings": []}
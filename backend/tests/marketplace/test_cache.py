@@ -0,0 +1,214 @@
+import threading
+import uuid
+from marketplace.cache import CacheBackend, CachedListing, ListingCache, LRUCacheBackend, ProfileCache
+from sqlalchemy import select
+from marketplace.models import Community, CommunityProfile, Item, Listing, ListingItem, User
+from marketplace.extensions import db, listing_cache
+
+
+class FakeRedisBackend(CacheBackend):
+    """Dict-backed stand-in for a remote key/value store."""
+
+    def __init__(self):
+        super().__init__()
+        self.store = {}
+
+    def get(self, key):
+        return self.store.get(key)
+
+    def set(self, key, value, ttl):
+        self.store[key] = value
+
+    def delete(self, key):
+        self.store.pop(key, None)
+
+    def clear(self):
+        self.store.clear()
+
+
+def test_lru_backend_evicts_least_recently_used():
+    backend = LRUCacheBackend(max_size=2)
+    backend.set("a", "1", ttl=60)
+    backend.set("b", "2", ttl=60)
+    assert backend.get("a") == "1"
+
+    backend.set("c", "3", ttl=60)
+
+    assert backend.get("b") is None
+    assert backend.get("a") == "1"
+    assert backend.get("c") == "3"
+    assert backend.evictions == 1
+
+
+def test_lru_backend_expires_entries():
+    backend = LRUCacheBackend()
+    backend.set("a", "1", ttl=0)
+
+    assert backend.get("a") is None
+    assert len(backend) == 0
+
+
+def test_listing_cache_counts_hits_and_misses():
+    cache = ListingCache(FakeRedisBackend(), ttl=60)
+    listing_id = uuid.uuid4()
+
+    assert cache.get(listing_id) is None
+    cache.set(listing_id, CachedListing("1-abc", "Wed, 01 May 2024 10:00:00 GMT", '{"listing": {}}\n'))
+    assert cache.get(listing_id) == ("1-abc", "Wed, 01 May 2024 10:00:00 GMT", '{"listing": {}}\n')
+    cache.invalidate(listing_id)
+    assert cache.get(listing_id) is None
+
+    assert cache.stats() == {"hits": 1, "misses": 2, "evictions": 0, "hit_rate": 1 / 3}
+
+
+def test_listing_cache_counts_lookups_across_threads():
+    cache = ListingCache(LRUCacheBackend(), ttl=60)
+    listing_id = uuid.uuid4()
+    cache.set(listing_id, CachedListing("1-abc", "", "{}\n"))
+
+    def look_up():
+        for _ in range(2000):
+            cache.get(listing_id)
+            cache.get(uuid.uuid4())
+
+    threads = [threading.Thread(target=look_up) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert cache.stats()["hits"] == cache.stats()["misses"] == 16000
+
+
+def test_profile_cache_remembers_non_members():
+    cache = ProfileCache(FakeRedisBackend(), ttl=60)
+    community_id, user_id = uuid.uuid4(), uuid.uuid4()
+    loads = []
+
+    def load():
+        loads.append(1)
+        return None
+
+    assert cache.get(community_id, user_id, load) is None
+    assert cache.get(community_id, user_id, load) is None
+    assert len(loads) == 1
+
+    cache.invalidate(community_id, user_id)
+    assert cache.get(community_id, user_id, lambda: {"alias": "bobby"}) == {"alias": "bobby"}
+    assert cache.stats()["hits"] == 1
+
+
+def test_get_listing_is_served_from_cache(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    json_args = {
+        "community_id": seed_community.id,
+        "listed_by_id": seed_user.id,
+        "status": "active",
+        "listing_type": "empty",
+        "sale_type": "sell",
+        "listing_price_cents": 199,
+        "listing_title": "Cached",
+        "available_count": 1,
+    }
+    with test_context:
+        listing_id = client.post("/marketplace/api/listing/create", json=json_args).json["listing"]["id"]
+        hits = listing_cache.hits
+
+        first_response = client.get(f"/marketplace/api/listing/{listing_id}")
+        # change the row behind the cache's back; the cached body is still served
+        db.session.query(Listing).filter(Listing.id == uuid.UUID(listing_id)).update({"listing_title": "Changed"})
+        db.session.commit()
+        second_response = client.get(f"/marketplace/api/listing/{listing_id}")
+
+        assert listing_cache.hits == hits + 1
+        assert second_response.json == first_response.json
+        assert second_response.json["listing"]["listing_title"] == "Cached"
+
+        listing_cache.invalidate(uuid.UUID(listing_id))
+        third_response = client.get(f"/marketplace/api/listing/{listing_id}")
+        assert third_response.json["listing"]["listing_title"] == "Changed"
+
+
+def test_profile_change_invalidates_alias(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile
+):
+    json_args = {
+        "community_id": seed_community.id,
+        "listed_by_id": seed_user.id,
+        "status": "active",
+        "listing_type": "empty",
+        "sale_type": "sell",
+        "listing_price_cents": 199,
+        "listing_title": "Aliased",
+        "available_count": 1,
+    }
+    with test_context:
+        listing_id = client.post("/marketplace/api/listing/create", json=json_args).json["listing"]["id"]
+        assert client.get(f"/marketplace/api/listing/{listing_id}").json["listing"]["listed_by_alias"] == "bobby"
+
+        profile = db.session.get(CommunityProfile, (seed_community.id, seed_user.id))
+        profile.alias = "robert"
+        db.session.commit()
+
+        assert client.get(f"/marketplace/api/listing/{listing_id}").json["listing"]["listed_by_alias"] == "robert"
+
+        db.session.delete(profile)
+        db.session.commit()
+        create_response = client.post("/marketplace/api/listing/create", json=json_args)
+        assert create_response.status_code == 422
+        assert create_response.json["errors"]["json"] == {
+            "listed_by_id": ["User is not a member of the listing's community."],
+        }
+
+
+def test_orm_writes_invalidate_cached_listings(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user)
+        listing_url = f"/marketplace/api/listing/{listing_id}"
+        first_response = client.get(listing_url)
+        assert first_response.json["listing"]["version"] == 1
+
+        item = db.session.scalars(
+            select(Item).join(ListingItem, ListingItem.item_id == Item.id)
+            .where(ListingItem.listing_id == uuid.UUID(listing_id))
+        ).one()
+        item.item_name = "Renamed"
+        db.session.commit()
+
+        second_response = client.get(listing_url)
+        assert second_response.json["item"]["item_name"] == "Renamed"
+        assert second_response.json["listing"]["version"] == 2
+        assert second_response.headers["ETag"] != first_response.headers["ETag"]
+        assert client.get(listing_url, headers={"If-None-Match": first_response.headers["ETag"]}).status_code == 200
+
+        listing = db.session.get(Listing, uuid.UUID(listing_id))
+        listing.status = "closed"
+        db.session.commit()
+        assert client.get(listing_url).json["listing"]["status"] == "closed"
+
+        # a rolled back change leaves the cached response alone
+        hits = listing_cache.hits
+        listing.listing_title = "Discarded"
+        db.session.flush()
+        db.session.rollback()
+        assert client.get(listing_url).json["listing"]["listing_title"] == "Sneaker"
+        assert listing_cache.hits == hits + 1
+
+
+def test_cache_stats_endpoints(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        profile_stats = client.get("/marketplace/api/profile/cache/stats").json
+        listing_id = create_listing(client, seed_community, seed_user)
+        create_listing(client, seed_community, seed_user)
+        client.get(f"/marketplace/api/listing/{listing_id}")
+
+        # the second create's membership check is served from the profile cache
+        new_profile_stats = client.get("/marketplace/api/profile/cache/stats").json
+        assert new_profile_stats["hits"] == profile_stats["hits"] + 1
+        assert new_profile_stats["misses"] == profile_stats["misses"] + 1
+        assert set(client.get("/marketplace/api/listing/cache/stats").json) == set(new_profile_stats)
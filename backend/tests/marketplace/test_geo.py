@@ -0,0 +1,64 @@
+import random
+import pytest
+from marketplace.geo import (
+    DEFAULT_ZIPCODE_DATASET, ZipcodeIndex, bounding_box, checked_zipcode_index, haversine_miles, read_zipcode_rows,
+    shipping_zone, zipcode_directory,
+)
+
+
+def test_distance_between_zipcodes():
+    index = zipcode_directory.index
+
+    # Pacific Heights to Manhattan, about 2,570 miles as the crow flies
+    assert 2550 < index.distance_miles("94115", "10001") < 2590
+    assert index.distance_miles("94115-1234", "94115") == 0
+    assert index.distance_miles("94115", "00000") is None
+    assert shipping_zone(index.distance_miles("94115", "94607")) == 1
+    assert shipping_zone(index.distance_miles("94115", "10001")) == 8
+
+
+def test_radius_matches_brute_force():
+    rows = list(read_zipcode_rows(zipcode_directory.path))
+    random.seed(7)
+    # scatter extra points around the sample ones, so cells hold more than one zipcode;
+    # their made up zipcodes (00500 and up) are below any real one
+    rows += [
+        (f"{500 + number:05d}", latitude + random.uniform(-2, 2), longitude + random.uniform(-2, 2))
+        for number, (_, latitude, longitude) in enumerate(rows * 5)
+    ]
+    index = ZipcodeIndex(rows)
+
+    for zipcode, latitude, longitude in random.sample(rows, 20):
+        for radius in (0, 10, 75, 400):
+            expected = {
+                other for other, other_latitude, other_longitude in rows
+                if haversine_miles(latitude, longitude, other_latitude, other_longitude) <= radius
+            }
+            nearby = index.within(zipcode, radius)
+
+            assert {nearby_zipcode for nearby_zipcode, _ in nearby} == expected
+            assert [miles for _, miles in nearby] == sorted(miles for _, miles in nearby)
+
+    assert index.within("00000", 10) is None
+
+
+def test_radius_wraps_the_antimeridian():
+    # Taveuni, Fiji sits across the antimeridian from Vanua Levu
+    index = ZipcodeIndex([("00001", -16.8, 179.9), ("00002", -16.8, -179.9), ("00003", -16.8, 178.0)])
+
+    assert [zipcode for zipcode, _ in index.within("00001", 20)] == ["00001", "00002"]
+    assert [zipcode for zipcode, _ in index.within("00002", 20)] == ["00002", "00001"]
+    assert {zipcode for zipcode, _ in index.within("00002", 200)} == {"00001", "00002", "00003"}
+
+    _, _, longitude_ranges = bounding_box(-16.8, -179.9, 20)
+    assert len(longitude_ranges) == 2
+    assert bounding_box(89.9, 0, 20)[2] == [(-180.0, 180.0)]
+
+
+def test_short_dataset_fails_loudly():
+    with pytest.raises(RuntimeError, match="ZIPCODE_DATASET_MIN_ZIPCODES"):
+        checked_zipcode_index(DEFAULT_ZIPCODE_DATASET, min_zipcodes=30000)
+    with pytest.raises(RuntimeError, match="doesn't exist"):
+        checked_zipcode_index("/nonexistent/zipcodes.csv")
+
+    assert len(checked_zipcode_index(DEFAULT_ZIPCODE_DATASET)) == len(zipcode_directory.index)
@@ -0,0 +1,88 @@
+from uuid import UUID
+import pytest
+from sqlalchemy import delete, text
+from sqlalchemy.exc import IntegrityError
+from marketplace.extensions import db
+from marketplace.models import LISTING_PARTITIONS, Community, CommunityProfile, Listing, User
+from marketplace.partition_listings import LISTING_CHILD_TABLES, is_partitioned, partition_listings, pruning_report
+
+
+def test_community_reads_prune_to_one_partition(test_context):
+    with test_context, db.engine.connect() as connection:
+        report = pruning_report(connection)
+
+    assert report["community_feed"] == 1
+    assert report["community_feed_by_type"] == 1
+    # lookups by id alone can't be pruned; they probe each partition's primary key index
+    assert report["get_listing"] == LISTING_PARTITIONS
+    assert report["get_listing_validators"] == LISTING_PARTITIONS
+
+
+def test_listing_references_are_enforced(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user)
+
+        # its item still references it, through the partition key
+        with pytest.raises(IntegrityError):
+            db.session.execute(delete(Listing).where(Listing.id == UUID(listing_id)))
+        db.session.rollback()
+
+
+def test_partition_existing_listings(
+    test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    with test_context:
+        listing_ids = {create_listing(client, seed_community, seed_user) for _ in range(3)}
+        community_id = seed_community.id
+        db.session.close()
+
+        with db.engine.connect() as connection:
+            transaction = connection.begin()
+            try:
+                # rebuild the schema the way it was before partitioning: listings without the columns added
+                # since, and tables referencing listings.id alone, without a community_id
+                for table in LISTING_CHILD_TABLES:
+                    connection.execute(text(f"ALTER TABLE {table.name} DROP COLUMN community_id"))
+                connection.execute(text("ALTER TABLE listings RENAME TO listings_template"))
+                connection.execute(text(
+                    "CREATE TABLE listings (LIKE listings_template INCLUDING DEFAULTS, PRIMARY KEY (id))"
+                ))
+                connection.execute(text("ALTER TABLE listings DROP COLUMN version, DROP COLUMN updated_on"))
+                connection.execute(text(
+                    "INSERT INTO listings SELECT id, community_id, listed_by_id, created_on, listed_on, closed_on, "
+                    "status, listing_type, sale_type, listing_price_cents, listing_title, listing_desc, "
+                    "available_count, search_vector FROM listings_template"
+                ))
+                connection.execute(text("DROP TABLE listings_template"))
+                connection.execute(text("CREATE INDEX ix_listings_community_feed ON listings (community_id)"))
+                connection.execute(text(
+                    "ALTER TABLE listing_items ADD CONSTRAINT listing_items_listing_id_fkey "
+                    "FOREIGN KEY (listing_id) REFERENCES listings (id)"
+                ))
+                assert not is_partitioned(connection, "listings")
+
+                migrated = partition_listings(connection)
+
+                assert migrated == {
+                    "copied": 3,
+                    "dropped_foreign_keys": ["listing_items.listing_items_listing_id_fkey"],
+                    "added_foreign_keys": [
+                        "listing_items.fk_listing_items_listing",
+                        "listing_lodgings.fk_listing_lodgings_listing",
+                        "lodging_bookings.fk_lodging_bookings_listing",
+                        "listing_reservations.fk_listing_reservations_listing",
+                    ],
+                }
+                assert is_partitioned(connection, "listings")
+                partitions = connection.execute(text("SELECT DISTINCT tableoid::regclass::text FROM listings")).all()
+                assert len(partitions) == 1
+                assert {row.id.hex for row in connection.execute(text("SELECT id FROM listings"))} == listing_ids
+                assert connection.execute(text("SELECT DISTINCT version FROM listings")).scalars().all() == [1]
+                assert connection.execute(
+                    text("SELECT DISTINCT community_id FROM listing_items")
+                ).scalars().all() == [community_id]
+                assert partition_listings(connection) is None
+            finally:
+                transaction.rollback()
@@ -0,0 +1,47 @@
+import pytest
+from sqlalchemy import create_engine, exc, text
+from marketplace.config import Configuration, ProductionConfiguration
+from marketplace.pool import PoolMetrics, pool_stats, timed_queue_pool
+
+
+def test_pool_metrics_percentiles():
+    metrics = PoolMetrics(slow_checkout_ms=50)
+    for wait_ms in range(1, 101):
+        metrics.record_checkout(wait_ms)
+
+    stats = metrics.stats()
+    assert stats["checkouts"] == 100
+    assert stats["slow_checkouts"] == 51
+    assert stats["max_wait_ms"] == 100
+    assert stats["p50_wait_ms"] == 51
+    assert stats["p99_wait_ms"] == 100
+
+
+def test_timed_queue_pool_records_checkouts_and_timeouts():
+    engine = create_engine(
+        "sqlite://", poolclass=timed_queue_pool(slow_checkout_ms=50), pool_size=1, max_overflow=0, pool_timeout=0.05,
+    )
+
+    with engine.connect():
+        assert pool_stats(engine.pool)["checked_out"] == 1
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+
+    stats = pool_stats(engine.pool)
+    assert stats["checked_out"] == 0
+    assert stats["checkouts"] == 1
+    assert stats["timeouts"] == 1
+
+
+def test_production_engine_options():
+    engine = create_engine(
+        Configuration.SQLALCHEMY_DATABASE_URI, **ProductionConfiguration.SQLALCHEMY_ENGINE_OPTIONS
+    )
+
+    with engine.connect() as connection:
+        assert connection.execute(text("SHOW statement_timeout")).scalar() == "30s"
+
+    stats = pool_stats(engine.pool)
+    assert stats["pool_class"] == "TimedQueuePool"
+    assert stats["checkouts"] == 1
+    engine.dispose()
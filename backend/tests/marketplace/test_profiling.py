@@ -0,0 +1,68 @@
+import logging
+import pytest
+from flask import Flask
+from marketplace.models import Community, CommunityProfile, User
+from marketplace.profiling import QueryProfile, statement_shape
+
+
+@pytest.fixture
+def query_profiling(app: Flask):
+    app.config["QUERY_PROFILING_ENABLED"] = True
+    yield
+    app.config["QUERY_PROFILING_ENABLED"] = False
+    app.config["SLOW_QUERY_MS"] = 200
+
+
+def test_statement_shape_ignores_bound_value_counts():
+    assert statement_shape("SELECT *\n  FROM listings WHERE id IN (%(id_1_1)s, %(id_1_2)s)") == (
+        statement_shape("SELECT * FROM listings WHERE id IN (%(id_1_1)s)")
+    )
+    assert statement_shape("SELECT * FROM listings WHERE id IN (?, ?, ?)") == (
+        "SELECT * FROM listings WHERE id IN (?)"
+    )
+
+
+def test_query_profile_flags_repeated_statements():
+    profile = QueryProfile()
+    for _ in range(6):
+        profile.record("SELECT * FROM items WHERE id = %(id_1)s", 1.0)
+    profile.record("SELECT * FROM listings", 4.0)
+
+    assert profile.query_count == 7
+    assert profile.slowest_statement == "SELECT * FROM listings"
+    assert profile.repeated_shapes(5) == [("SELECT * FROM items WHERE id = %(id_1)s", 6)]
+    assert 'n-plus-one;desc="6 repeats"' in profile.server_timing(5)
+
+
+def test_get_listing_is_a_single_query(
+    query_profiling, test_context, client, seed_community: Community, seed_user: User, seed_profile: CommunityProfile,
+    create_listing
+):
+    with test_context:
+        listing_id = create_listing(client, seed_community, seed_user)
+
+        listing_response = client.get(f"/marketplace/api/listing/{listing_id}")
+        assert 'db;dur=' in listing_response.headers["Server-Timing"]
+        assert 'desc="1 queries"' in listing_response.headers["Server-Timing"]
+
+        cached_response = client.get(f"/marketplace/api/listing/{listing_id}")
+        assert 'desc="0 queries"' in cached_response.headers["Server-Timing"]
+
+
+def test_slow_queries_are_logged(
+    app: Flask, query_profiling, test_context, client, seed_community: Community, caplog
+):
+    app.config["SLOW_QUERY_MS"] = 0
+    with test_context, caplog.at_level(logging.INFO, logger="marketplace.profiling"):
+        client.get(f"/marketplace/api/community/{seed_community.id}/listings")
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert any('"event": "slow_query"' in message and "FROM listings" in message for message in messages)
+    assert any('"event": "request_profile"' in message and '"query_count": 1' in message for message in messages)
+
+
+def test_profiling_is_off_by_default(test_context, client, seed_community: Community):
+    with test_context:
+        feed_response = client.get(f"/marketplace/api/community/{seed_community.id}/listings")
+
+        assert "Server-Timing" not in feed_response.headers
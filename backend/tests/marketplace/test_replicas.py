@@ -0,0 +1,155 @@
+from uuid import UUID
+import pytest
+from flask import Flask
+from sqlalchemy import create_engine, delete, insert, select, text
+from sqlalchemy.engine import make_url
+from marketplace.extensions import db, listing_cache, replica_router
+from marketplace.models import Community, CommunityProfile, User
+from marketplace.replicas import PRIMARY_UNTIL_COOKIE, REPLICA_BIND, ReplicaMonitor
+from marketplace.server import create_app
+
+
+@pytest.fixture
+def replica_app(app: Flask):
+    """An app reading from a second database on the test server, standing in for a replica of the first."""
+    primary_url = make_url(app.config["SQLALCHEMY_DATABASE_URI"])
+    if primary_url.get_backend_name() != "postgresql":
+        pytest.skip("needs PostgreSQL")
+
+    replica_url = primary_url.set(database=f"{primary_url.database}_replica")
+    with create_engine(primary_url, isolation_level="AUTOCOMMIT").connect() as connection:
+        if not connection.execute(
+            text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": replica_url.database}
+        ).scalar():
+            connection.execute(text(f'CREATE DATABASE "{replica_url.database}"'))
+
+    replica_app = create_app(config={
+        "SQLALCHEMY_BINDS": {REPLICA_BIND: replica_url.render_as_string(hide_password=False)},
+        "REPLICA_CHECK_INTERVAL": 0,
+    })
+    with replica_app.app_context():
+        # recreated, so the replica has the same schema as the primary even after a model change
+        db.metadata.drop_all(db.engines[REPLICA_BIND])
+        db.metadata.create_all(db.engines[REPLICA_BIND])
+
+    yield replica_app
+
+    with replica_app.app_context(), db.engines[REPLICA_BIND].begin() as connection:
+        for table in reversed(db.metadata.sorted_tables):
+            connection.execute(delete(table))
+        db.engines[REPLICA_BIND].dispose()
+    # restore the configuration of the other tests' app, and forget the bind, which `create_all` would
+    # otherwise look for in every app created after this one
+    db.metadatas.pop(REPLICA_BIND, None)
+    replica_router.init_app(app)
+    listing_cache.init_app(app)
+
+
+def replicate(replica_app: Flask) -> None:
+    """Copy the primary's rows to the replica, as replication would have by now."""
+    with replica_app.app_context():
+        with db.engine.connect() as primary, db.engines[REPLICA_BIND].begin() as replica:
+            for table in reversed(db.metadata.sorted_tables):
+                replica.execute(delete(table))
+            for table in db.metadata.sorted_tables:
+                rows = [dict(row._mapping) for row in primary.execute(select(table))]
+                if rows:
+                    replica.execute(insert(table), rows)
+
+
+def test_reads_route_to_a_healthy_replica(
+    replica_app: Flask, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, monkeypatch,
+    create_listing
+):
+    writer, reader = replica_app.test_client(), replica_app.test_client()
+    with replica_app.app_context():
+        listing_id = create_listing(writer, seed_community, seed_user)
+    listing_url = f"/marketplace/api/listing/{listing_id}"
+    assert writer.get_cookie(PRIMARY_UNTIL_COOKIE) is not None
+
+    # the writer reads its own write from the primary; the replica hasn't seen it yet
+    assert writer.get(listing_url).status_code == 200
+    listing_cache.clear()
+    assert reader.get(listing_url).status_code == 404
+    assert reader.get_cookie(PRIMARY_UNTIL_COOKIE) is None
+
+    replicate(replica_app)
+    assert reader.get(listing_url).status_code == 200
+    feed_response = reader.get(f"/marketplace/api/community/{seed_community.id}/listings")
+    assert [listing["listing"]["id"] for listing in feed_response.json["listings"]] == [listing_id]
+    batch_response = reader.post("/marketplace/api/listings/batch", json={"ids": [listing_id]})
+    assert len(batch_response.json["listings"]) == 1
+    assert reader.get_cookie(PRIMARY_UNTIL_COOKIE) is None
+
+    # a replica further behind than allowed is skipped until it catches up
+    with replica_app.app_context():
+        lagging_id = create_listing(writer, seed_community, seed_user)
+    listing_cache.clear()
+    assert reader.get(f"/marketplace/api/listing/{lagging_id}").status_code == 404
+    monkeypatch.setattr(replica_router.monitor, "measure_lag", lambda engine: 60.0)
+    assert reader.get(f"/marketplace/api/listing/{lagging_id}").status_code == 200
+
+    stats = reader.get("/marketplace/api/db/replica/stats").json
+    assert (stats["healthy"], stats["lag_seconds"]) == (False, 60.0)
+    assert stats["replica_requests"] == 5
+    assert stats["primary_requests"] == 2
+    assert stats["pinned_requests"] == 1
+
+
+def test_lagging_replica_reads_are_not_cached(
+    replica_app: Flask, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, create_listing
+):
+    writer, reader = replica_app.test_client(), replica_app.test_client()
+    with replica_app.app_context():
+        listing_id = create_listing(writer, seed_community, seed_user)
+    listing_url = f"/marketplace/api/listing/{listing_id}"
+    replicate(replica_app)
+
+    # the purchase invalidates the cached listing, but the replica hasn't seen it yet
+    assert writer.post(f"{listing_url}/purchase", json={}).status_code == 200
+    assert reader.get(listing_url).json["listing"]["available_count"] == 1
+    assert listing_cache.get(UUID(listing_id)) is None
+
+    replicate(replica_app)
+    assert reader.get(listing_url).json["listing"]["available_count"] == 0
+    assert listing_cache.get(UUID(listing_id)) is not None
+
+
+def test_failed_replica_reads_are_retried_on_the_primary(
+    replica_app: Flask, seed_community: Community, seed_user: User, seed_profile: CommunityProfile, monkeypatch,
+    create_listing
+):
+    writer, reader = replica_app.test_client(), replica_app.test_client()
+    with replica_app.app_context():
+        listing_id = create_listing(writer, seed_community, seed_user)
+        replica_database = db.engines[REPLICA_BIND].url.database
+    listing_cache.clear()
+
+    # the replica goes away after its last health check passed
+    monkeypatch.setattr(replica_router.monitor, "measure_lag", lambda engine: 0.0)
+    with replica_app.app_context(), db.engine.connect() as primary:
+        primary = primary.execution_options(isolation_level="AUTOCOMMIT")
+        primary.execute(text(f'ALTER DATABASE "{replica_database}" ALLOW_CONNECTIONS false'))
+        try:
+            primary.execute(
+                text("SELECT pg_terminate_backend(pid) FROM pg_stat_activity WHERE datname = :name"),
+                {"name": replica_database},
+            )
+            response = reader.get(f"/marketplace/api/listing/{listing_id}")
+        finally:
+            primary.execute(text(f'ALTER DATABASE "{replica_database}" ALLOW_CONNECTIONS true'))
+
+    assert response.status_code == 200
+    assert response.json["listing"]["id"] == listing_id
+    assert reader.get_cookie(PRIMARY_UNTIL_COOKIE) is None
+    stats = reader.get("/marketplace/api/db/replica/stats").json
+    assert stats["failures"] == 1
+
+
+def test_unreachable_replica_is_skipped():
+    monitor = ReplicaMonitor(max_lag_seconds=5)
+    engine = create_engine("postgresql://postgres@localhost:1/lomatest_replica?connect_timeout=1")
+
+    assert monitor.is_healthy(engine) is False
+    assert monitor.stats()["failures"] == 1
+    assert monitor.stats()["error"]
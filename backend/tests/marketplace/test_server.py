@@ -0,0 +1,54 @@
+import datetime
+import subprocess
+import sys
+import uuid
+from marketplace.extensions import db
+from marketplace.models import Community, CommunityProfile, User
+from marketplace.server import create_app
+
+
+def test_importing_server_does_not_build_an_app():
+    loaded = subprocess.check_output([
+        sys.executable, "-c",
+        "import sys, marketplace.server; print(any(name.startswith('marketplace.api.') and name != "
+        "'marketplace.api.utils' for name in sys.modules))",
+    ], text=True)
+
+    assert loaded.strip() == "False"
+
+
+def test_create_app_on_a_throwaway_database():
+    app = create_app(config={"SQLALCHEMY_DATABASE_URI": "sqlite://"})
+    client = app.test_client()
+
+    with app.app_context():
+        db.create_all()
+        community = Community(name="In memory", uri="inmemory")
+        user = User(email="m@m.com", first_name="Mem", last_name="Ory")
+        db.session.add_all([community, user])
+        db.session.flush()
+        db.session.add(CommunityProfile(community_id=community.id, user_id=user.id, alias="mem", active_since=datetime.date.today()))
+        db.session.commit()
+
+        create_response = client.post("/marketplace/api/listing/create", json={
+            "community_id": community.id.hex,
+            "listed_by_id": user.id.hex,
+            "status": "active",
+            "listing_type": "empty",
+            "sale_type": "sell",
+            "listing_price_cents": 100,
+            "listing_title": "In memory",
+            "available_count": 1,
+        })
+        assert create_response.status_code == 200
+
+        listing_id = create_response.json["listing"]["id"]
+        get_response = client.get(f"/marketplace/api/listing/{listing_id}")
+        assert get_response.json["listing"]["listing_title"] == "In memory"
+
+
+def test_create_app_without_routes():
+    app = create_app(config={"SQLALCHEMY_DATABASE_URI": "sqlite://"}, routes=False)
+
+    assert app.test_client().get(f"/marketplace/api/listing/{uuid.uuid4().hex}").status_code == 404
+    assert not app.blueprints
@@ -0,0 +1,8 @@
+"""
+WSGI entry point for production servers:
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+"""
+from marketplace.server import create_app
+
+app = create_app()